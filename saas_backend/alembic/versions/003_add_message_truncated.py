@@ -0,0 +1,30 @@
+# pylint: disable=invalid-name
+"""add messages.is_truncated
+
+Revision ID: 003_add_message_truncated
+Revises: 002_create_messages
+Create Date: 2024-03-01
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003_add_message_truncated'
+down_revision = '002_create_messages'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """添加消息截断标记（客户端中途断开时保存的不完整回复）"""
+    op.add_column(
+        'messages',
+        sa.Column('is_truncated', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    """回滚：删除消息截断标记"""
+    op.drop_column('messages', 'is_truncated')
@@ -0,0 +1,38 @@
+# pylint: disable=invalid-name
+"""create usage_daily_rollup
+
+Revision ID: 004_create_usage_daily_rollup
+Revises: 003_add_message_truncated
+Create Date: 2024-03-15
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_create_usage_daily_rollup'
+down_revision = '003_add_message_truncated'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建使用量日汇总表（历史数据用 scripts/backfill_usage_rollup.py 回填）"""
+    op.create_table(
+        'usage_daily_rollup',
+        sa.Column('organization_id', sa.String(36), sa.ForeignKey('organizations.id'), primary_key=True),
+        sa.Column('date', sa.Date(), primary_key=True),
+        sa.Column('resource_type', sa.String(50), primary_key=True),
+        sa.Column('total', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+    # 明细表按组织 + 日期查询（当天统计、回填）
+    op.create_index('ix_usage_records_org_date', 'usage_records', ['organization_id', 'date'])
+
+
+def downgrade() -> None:
+    """回滚：删除使用量日汇总表"""
+    op.drop_index('ix_usage_records_org_date', table_name='usage_records')
+    op.drop_table('usage_daily_rollup')
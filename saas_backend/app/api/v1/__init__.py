@@ -4,7 +4,7 @@ API v1 路由聚合
 from fastapi import APIRouter
 from app.api.v1.endpoints import (
     auth, organizations, subscriptions, payments, usage, auth_extended,
-    bots, conversations, chat, users, admin, knowledge, tenant
+    bots, conversations, chat, users, admin, knowledge, tenant, api_keys
 )
 
 api_router = APIRouter()
@@ -25,6 +25,9 @@ api_router.include_router(payments.router, prefix="/payments", tags=["支付"])
 # 使用量相关路由
 api_router.include_router(usage.router, prefix="/usage", tags=["使用量"])
 
+# API 密钥管理路由（服务端集成）
+api_router.include_router(api_keys.router, prefix="/api-keys", tags=["API 密钥"])
+
 # 机器人相关路由
 api_router.include_router(bots.router, prefix="/bots", tags=["机器人"])
 
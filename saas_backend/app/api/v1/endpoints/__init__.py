@@ -2,6 +2,6 @@
 API 端点依赖导入
 """
 from app.api.v1.endpoints.deps import get_current_user, get_current_active_user
-from app.db.session import get_db
+from app.db.session import get_db, get_async_db
 
-__all__ = ["get_current_user", "get_current_active_user", "get_db"]
+__all__ = ["get_current_user", "get_current_active_user", "get_db", "get_async_db"]
@@ -3,72 +3,38 @@
 """
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from sqlalchemy import text
 
 from app.api.v1.endpoints import deps
 from app.api.v1.endpoints.rbac import require_platform_admin, require_org_admin
 from app.schemas.admin import DashboardStats, SystemSettings, SystemSettingsUpdate
 from app.schemas.user import User
-from app.models.user import User as UserModel
-from app.models.conversation import Conversation as ConversationModel
-from app.models.bot import Bot
-from app.models.organization import Organization
 from app.models.subscription import Subscription
-from app.models.order import Order
+from app.core.metrics import metrics
+from app.services.answer_cache import answer_cache
+from app.services.api_key_service import api_key_cache, last_used_tracker
+from app.services.org_membership import membership_cache
+from app.services.quota_engine import quota_engine
+from app.services.rate_limiter import rate_limiter
+from app.services.usage_accumulator import usage_accumulator
+from app.services.token_cache import token_cache
+from app.services.coze_service import coze_service
+from app.services.dashboard_stats import dashboard_stats
+from app.services.fair_scheduler import fair_scheduler
+from app.services.message_persister import message_persister
+from app.services.wechat_login_waiter import login_status_waiter
 
 router = APIRouter()
 
 
 @router.get("/dashboard/stats", response_model=DashboardStats)
-def get_dashboard_stats(
+async def get_dashboard_stats(
     current_admin: User = Depends(require_platform_admin),
-    db: Session = Depends(deps.get_db),
 ):
     """
-    获取仪表板统计数据
+    获取仪表板统计数据（按需刷新的快照，generated_at / age_seconds 标明新鲜度）
     """
-    # 用户统计
-    total_users = db.query(UserModel).count()
-    active_users = db.query(UserModel).filter(UserModel.is_active == True).count()
-
-    # 对话统计
-    total_conversations = db.query(ConversationModel).count()
-
-    # 消息统计（简化：使用对话的消息计数总和）
-    result = db.query(func.sum(ConversationModel.message_count)).scalar()
-    total_messages = result if result else 0
-
-    # 机器人统计
-    total_bots = db.query(Bot).count()
-
-    # 组织统计
-    total_organizations = db.query(Organization).count()
-
-    # 收入统计（从订单表）
-    result = db.query(func.sum(Order.amount)).filter(
-        Order.status == "completed"
-    ).scalar()
-    revenue_total = float(result) if result else 0.0
-
-    # 当月收入
-    from datetime import datetime, timedelta
-    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    result = db.query(func.sum(Order.amount)).filter(
-        Order.status == "completed",
-        Order.created_at >= month_start
-    ).scalar()
-    revenue_month = float(result) if result else 0.0
-
-    return DashboardStats(
-        total_users=total_users,
-        active_users=active_users,
-        total_conversations=total_conversations,
-        total_messages=total_messages,
-        total_bots=total_bots,
-        total_organizations=total_organizations,
-        revenue_month=revenue_month,
-        revenue_total=revenue_total
-    )
+    return await dashboard_stats.get()
 
 
 @router.get("/system/settings", response_model=SystemSettings)
@@ -123,5 +89,29 @@ def get_system_health(
             "database": db_status,
             "redis": "unknown",  # TODO: 实现 Redis 健康检查
             "coze_api": "unknown"  # TODO: 实现 Coze API 健康检查
-        }
+        },
+        "coze_pool": coze_service.pool_stats(),
+        "coze_breaker": coze_service.breaker.stats(),
+        "coze_scheduler": fair_scheduler.stats(),
+        "message_persister": message_persister.stats(),
+        "answer_cache": answer_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "org_cache": membership_cache.stats(),
+        "api_key_cache": api_key_cache.stats(),
+        "api_key_last_used": last_used_tracker.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "usage_accumulator": usage_accumulator.stats(),
+        "quota_engine": quota_engine.stats(),
+        "wechat_login_waiter": login_status_waiter.stats(),
+        "dashboard_stats": dashboard_stats.stats(),
     }
+
+
+@router.get("/system/metrics")
+def get_system_metrics(
+    current_admin: User = Depends(require_platform_admin),
+):
+    """
+    获取进程内运行指标（缓存命中率、队列深度等）
+    """
+    return metrics.snapshot()
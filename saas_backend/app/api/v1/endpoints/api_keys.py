@@ -0,0 +1,73 @@
+"""
+API 密钥管理端点（组织管理员为服务端集成创建、吊销密钥）
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints import deps
+from app.api.v1.endpoints.rbac import require_org_admin
+from app.schemas.api_key import APIKey, APIKeyCreate, APIKeyCreated
+from app.schemas.user import User
+from app.models.organization import Organization
+from app.services.api_key_service import APIKeyService
+
+router = APIRouter()
+
+
+@router.get("", response_model=List[APIKey])
+def list_api_keys(
+    current_user: User = Depends(require_org_admin),
+    db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
+):
+    """
+    获取组织的 API 密钥列表
+    """
+    return APIKeyService(db).list_keys(org.id)
+
+
+@router.post("", response_model=APIKeyCreated, status_code=status.HTTP_201_CREATED)
+def create_api_key(
+    key_in: APIKeyCreate,
+    current_user: User = Depends(require_org_admin),
+    db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
+):
+    """
+    创建 API 密钥（明文只在本次响应中返回）
+    """
+    try:
+        api_key, raw_key = APIKeyService(db).create_key(
+            organization_id=org.id,
+            user_id=current_user.id,
+            name=key_in.name,
+            scopes=key_in.scopes,
+            expires_at=key_in.expires_at,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return APIKeyCreated(**APIKey.model_validate(api_key).model_dump(), key=raw_key)
+
+
+@router.delete("/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_api_key(
+    key_id: str,
+    current_user: User = Depends(require_org_admin),
+    db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
+):
+    """
+    吊销 API 密钥
+    """
+    if not APIKeyService(db).revoke_key(org.id, key_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+
+    return None
@@ -7,13 +7,15 @@ from sqlalchemy.orm import Session
 
 from app.api.v1.endpoints import deps
 from app.schemas.user import User, UserCreate, UserLogin, Token, UserRegister
+from app.models.user import User as UserModel
 from app.services.auth_service import AuthService
+from app.services.token_cache import token_cache
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=User)
-def register(
+async def register(
     user_in: UserRegister,
     db: Session = Depends(deps.get_db),
 ):
@@ -22,7 +24,7 @@ def register(
     """
     try:
         auth_service = AuthService(db)
-        user = auth_service.register_user(user_in)
+        user = await auth_service.register_user_async(user_in)
         return user
     except ValueError as e:
         raise HTTPException(
@@ -32,7 +34,7 @@ def register(
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(deps.get_db),
 ):
@@ -42,7 +44,7 @@ def login(
     auth_service = AuthService(db)
 
     try:
-        token = auth_service.login(form_data.username, form_data.password)
+        token = await auth_service.login_async(form_data.username, form_data.password)
         return token
     except ValueError as e:
         raise HTTPException(
@@ -97,7 +99,7 @@ def get_current_user(
 @router.put("/me", response_model=User)
 def update_current_user(
     user_update: dict,
-    current_user: User = Depends(deps.get_current_user),
+    current_user: UserModel = Depends(deps.get_current_user_model),
     db: Session = Depends(deps.get_db),
 ):
     """
@@ -109,5 +111,7 @@ def update_current_user(
 
     db.commit()
     db.refresh(current_user)
+    # 缓存中的用户快照已过期
+    token_cache.invalidate_user(current_user.id)
 
     return current_user
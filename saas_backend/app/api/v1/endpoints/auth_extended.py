@@ -6,11 +6,15 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from app.api.v1.endpoints import deps
+from app.core.config import settings
+from app.db.session import SessionLocal
 from app.schemas.user import User, Token
 from app.services.sms_service import VerificationCodeService
 from app.services.wechat_service import WeChatAuthService, WeChatLoginSession
+from app.services.wechat_login_waiter import TERMINAL_STATUSES, login_status_waiter
 from app.models.user import User as UserModel
 
 router = APIRouter()
@@ -164,7 +168,7 @@ def get_wechat_qr_code(
     获取微信登录二维码
 
     返回微信登录二维码URL和状态参数。
-    前端应该使用这个URL生成二维码，并轮询检查登录状态。
+    前端应该使用这个URL生成二维码，并通过 check-status 长轮询登录状态。
     """
     wechat_service = WeChatAuthService(db)
     session_manager = WeChatLoginSession(db)
@@ -185,19 +189,64 @@ def get_wechat_qr_code(
     )
 
 
+def _login_session_status(state: str) -> Optional[dict]:
+    """查询登录会话状态（独立的短会话，查询后立即归还连接，长轮询等待期间不占用连接池）"""
+    db = SessionLocal()
+    try:
+        return WeChatLoginSession(db).get_session_status(state)
+    finally:
+        db.close()
+
+
 @router.get("/wechat/check-status", response_model=CheckWeChatStatusResponse)
-def check_wechat_login_status(
+async def check_wechat_login_status(
     state: str = Query(..., description="状态参数"),
-    db: Session = Depends(deps.get_db),
+    wait: int = Query(
+        0,
+        ge=0,
+        le=settings.WECHAT_LOGIN_LONG_POLL_SECONDS,
+        description="长轮询最长等待秒数，0 表示立即返回",
+    ),
+    last_status: Optional[str] = Query(None, description="客户端已知的状态，状态变化后才返回"),
 ):
     """
     检查微信登录状态
 
-    前端应该定期轮询此接口来检查用户是否已扫码确认登录。
+    wait > 0 时为长轮询：请求挂起直到回调更新了该 state 的状态（立即返回）或等待超时
+    （回退为查询数据库）。前端收到非终态后带上 last_status 再次发起请求即可，无需定时轮询；
+    不带 last_status 时以当前状态为准，等待下一次变化。
+    数据库查询在线程池中执行，等待期间不持有数据库连接。
     """
-    session_manager = WeChatLoginSession(db)
+    session_data = None
+
+    known = login_status_waiter.peek(state)
+    if known is None:
+        # 本进程没有该 state 的记录（二维码由其他 worker 签发、记录已过期或 state 不存在）：
+        # 先查库确认会话存在再记录，不为不存在的 state 挂起请求
+        session_data = await run_in_threadpool(_login_session_status, state)
+        if not session_data:
+            return CheckWeChatStatusResponse(
+                status="expired",
+                access_token=None,
+                refresh_token=None,
+            )
+        login_status_waiter.notify(state, session_data["status"], session_data["user_id"])
+        known = session_data
+
+    if known["status"] in TERMINAL_STATUSES:
+        return CheckWeChatStatusResponse(status=known["status"])
+
+    if wait > 0:
+        changed = await login_status_waiter.wait(
+            state, timeout=wait, known_status=last_status or known["status"]
+        )
+        if changed is not None:
+            return CheckWeChatStatusResponse(status=changed["status"])
+        # 等待超时（回调可能由其他 worker 处理）：重新查询数据库
+        session_data = None
 
-    session_data = session_manager.get_session_status(state)
+    if session_data is None:
+        session_data = await run_in_threadpool(_login_session_status, state)
 
     if not session_data:
         return CheckWeChatStatusResponse(
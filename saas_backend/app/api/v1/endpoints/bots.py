@@ -12,33 +12,11 @@ from app.schemas.bot import (
 from app.schemas.user import User
 from app.models.bot import Bot as BotModel
 from app.models.organization import Organization
+from app.services.answer_cache import answer_cache
 
 router = APIRouter()
 
 
-def get_current_org(
-    current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(deps.get_db)
-) -> Organization:
-    """获取当前用户所属组织（简化版：取第一个组织）"""
-    from app.models.organization import OrganizationMember
-    from app.models.user import User
-
-    # 查询用户的组织成员记录
-    membership = db.query(OrganizationMember).filter(
-        OrganizationMember.user_id == current_user.id
-    ).first()
-
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User does not belong to any organization"
-        )
-
-    org = db.query(Organization).filter(Organization.id == membership.organization_id).first()
-    return org
-
-
 @router.get("", response_model=BotListResponse)
 def list_bots(
     page: int = Query(1, ge=1),
@@ -46,12 +24,11 @@ def list_bots(
     is_active: Optional[bool] = None,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取机器人列表（用户端：只能看到自己组织的机器人）
     """
-    org = get_current_org(current_user, db)
-
     query = db.query(BotModel).filter(BotModel.organization_id == org.id)
 
     if is_active is not None:
@@ -74,12 +51,11 @@ def create_bot(
     bot_in: BotCreate,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     创建机器人
     """
-    org = get_current_org(current_user, db)
-
     # 检查 bot_id 是否已存在
     existing_bot = db.query(BotModel).filter(
         BotModel.bot_id == bot_in.bot_id,
@@ -108,12 +84,11 @@ def get_bot(
     bot_id: str,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取机器人详情
     """
-    org = get_current_org(current_user, db)
-
     bot = db.query(BotModel).filter(
         BotModel.id == bot_id,
         BotModel.organization_id == org.id
@@ -134,12 +109,11 @@ def update_bot(
     bot_in: BotUpdate,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     更新机器人
     """
-    org = get_current_org(current_user, db)
-
     bot = db.query(BotModel).filter(
         BotModel.id == bot_id,
         BotModel.organization_id == org.id
@@ -159,6 +133,9 @@ def update_bot(
     db.commit()
     db.refresh(bot)
 
+    # 机器人配置变更，清除其缓存回答
+    answer_cache.invalidate_bot(bot.id)
+
     return bot
 
 
@@ -167,12 +144,11 @@ def delete_bot(
     bot_id: str,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     删除机器人
     """
-    org = get_current_org(current_user, db)
-
     bot = db.query(BotModel).filter(
         BotModel.id == bot_id,
         BotModel.organization_id == org.id
@@ -187,6 +163,8 @@ def delete_bot(
     db.delete(bot)
     db.commit()
 
+    answer_cache.invalidate_bot(bot_id)
+
     return None
 
 
@@ -196,12 +174,11 @@ def test_bot(
     test_request: BotTestRequest,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     测试机器人
     """
-    org = get_current_org(current_user, db)
-
     bot = db.query(BotModel).filter(
         BotModel.id == bot_id,
         BotModel.organization_id == org.id
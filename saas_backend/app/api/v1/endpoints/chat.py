@@ -1,43 +1,178 @@
 """
 聊天 API 端点（用户端核心功能）- 集成 Coze API
 """
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from starlette.websockets import WebSocketState
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 import asyncio
+import time
 
 from app.api.v1.endpoints import deps
-from app.api.v1.endpoints.bots import get_current_org
-from app.api.v1.endpoints.rbac import require_active_user
-from app.schemas.conversation import ChatRequest, ChatResponse, ChatStreamChunk
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.security import decode_token
+from app.core.tasks import spawn_background
+from app.core.tracing import (
+    DISCONNECTED, ERROR, FALLBACK, SUCCESS, RequestTrace, current_trace, span, start_trace, traced,
+)
+from app.db.session import AsyncSessionLocal
+from app.schemas.conversation import ChatRequest, ChatResponse
 from app.schemas.user import User
-from app.models.conversation import Conversation as ConversationModel
 from app.models.bot import Bot
-from app.models.message import Message as MessageModel
+from app.models.user import User as UserModel
+from app.models.conversation import Conversation as ConversationModel
+from app.models.organization import Organization
+from app.services.answer_cache import answer_cache
+from app.services.chat_coalescer import chat_coalescer, coalesce_key
+from app.services.chat_service import ChatService
+from app.services.circuit_breaker import CircuitOpenError
 from app.services.coze_service import coze_service
+from app.services.delta_coalescer import delta_coalescer
+from app.services.fair_scheduler import SchedulerTimeout, fair_scheduler
+from app.services.message_persister import message_persister
+from app.services.quota_engine import quota_engine
+from app.services.rate_limiter import plan_rate_limits, rate_limiter, retry_after_header
+from app.services.sse_encoder import SSEFrameEncoder
+from app.services.usage_accumulator import usage_accumulator
 
 router = APIRouter()
 
+stream_disconnects = metrics.counter(
+    "chat_stream_disconnects_total", "回复完成前客户端断开的流式请求数"
+)
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(
+
+async def _finish_disconnected_stream(
+    stream,
+    conversation: ConversationModel,
+    user_id: str,
+    partial_content: str,
+    coze_message_id: Optional[str],
+    coze_conversation_id_changed: bool = False,
+) -> None:
+    """
+    客户端断开后的收尾（后台任务）
+
+    关闭增量合并流会取消上游读取任务，随之断开 httpx 连接、归还调度名额，
+    并由 CozeService 取消 Coze 生成；已收到的部分回复标记为截断后保存。
+    """
+    if stream is not None:
+        await stream.aclose()
+
+    await _save_unfinished_reply(
+        conversation, user_id, partial_content, coze_message_id, coze_conversation_id_changed
+    )
+
+
+async def _save_unfinished_reply(
+    conversation: ConversationModel,
+    user_id: str,
+    partial_content: str,
+    coze_message_id: Optional[str],
+    coze_conversation_id_changed: bool = False,
+) -> None:
+    """保存没有正常结束（客户端断开或上游出错）的回复：部分回复标记为截断"""
+    if coze_conversation_id_changed:
+        await _save_coze_conversation_id(conversation)
+
+    if partial_content:
+        await message_persister.enqueue_message(
+            conversation_id=conversation.id,
+            user_id=user_id,
+            role="assistant",
+            content=partial_content,
+            coze_message_id=coze_message_id,
+            message_count_delta=2,
+            coze_conversation_id=conversation.conversation_id,
+            is_truncated=True,
+        )
+
+
+async def _save_coze_conversation_id(conversation: ConversationModel) -> None:
+    """立即写入新获得的 Coze 对话 ID（失败时仍由消息批量刷写带上）"""
+    try:
+        await message_persister.save_coze_conversation_id(conversation.id, conversation.conversation_id)
+    except Exception as e:
+        print(f"⚠️ 写入 Coze 对话 ID 失败 {conversation.id}: {str(e)}")
+
+
+async def _resolve_chat_context(
+    chat_service: ChatService,
     request: ChatRequest,
-    current_user: User = Depends(require_active_user),
-    db: Session = Depends(deps.get_db),
-):
+    current_user: User,
+    organization_id: Optional[str] = None,
+) -> tuple[Organization, Bot, ConversationModel]:
     """
-    非流式聊天 - 集成 Coze API
+    解析聊天上下文：组织、机器人、对话（不存在则创建）
+
+    organization_id 为 API 密钥所属组织；用户登录时为 None，按成员关系解析
     """
-    org = get_current_org(current_user, db)
+    with span("org_lookup"):
+        if organization_id:
+            org = await chat_service.get_organization(organization_id)
+        else:
+            org = await chat_service.get_user_organization(current_user.id)
+
+    if not org:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User does not belong to any organization"
+        )
+
+    await _check_message_quota(org)
 
     # 验证 bot 是否存在且属于该组织
-    bot = db.query(Bot).filter(
-        Bot.id == request.bot_id,
-        Bot.organization_id == org.id
-    ).first()
+    with span("bot_lookup"):
+        bot = await chat_service.get_bot(request.bot_id, org.id)
+    _check_bot(bot)
+
+    with span("conversation"):
+        conversation = await _get_or_create_conversation(
+            chat_service, request, bot, org.id, current_user.id
+        )
+
+    return org, bot, conversation
+
+
+async def _traced_chat_context(
+    trace: RequestTrace,
+    chat_service: ChatService,
+    request: ChatRequest,
+    caller: deps.Caller,
+) -> tuple[Organization, Bot, ConversationModel]:
+    """解析聊天上下文并设置 trace 标签；解析失败（如机器人不存在）时以 error 结束 trace"""
+    try:
+        org, bot, conversation = await _resolve_chat_context(
+            chat_service, request, caller.user, caller.organization_id
+        )
+    except BaseException:
+        trace.finish(ERROR)
+        raise
+    trace.set_labels(plan=org.plan_type)
+    return org, bot, conversation
+
+
+async def _check_message_quota(org: Organization) -> None:
+    """本月消息数达到计划上限时拒绝（在调用上游之前，通常不访问数据库）"""
+    if not settings.QUOTA_ENFORCEMENT_ENABLED:
+        return
+    with span("quota_check"):
+        allowed = await quota_engine.check(org.id, org.plan_type, "message")
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Monthly message quota exceeded"
+        )
+
 
+def _check_bot(bot: Optional[Bot]) -> None:
+    """验证机器人存在且已启用"""
     if not bot:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -50,77 +185,143 @@ async def chat(
             detail="Bot is not active"
         )
 
-    # 获取或创建对话
+
+async def _seed_coze_conversation(
+    bot: Bot,
+    user_id: str,
+    question: str,
+    answer: str,
+) -> Optional[str]:
+    """
+    为没有调用上游的首轮对话（命中缓存或合并到其他请求）创建 Coze 对话，写入本轮问答作为上下文，
+    后续提问才能带上历史；失败时返回 None（下一轮没有上下文，但不影响本轮回复）
+    """
+    try:
+        data = await coze_service.create_conversation(
+            bot_id=bot.bot_id,
+            user_id=str(user_id),
+            messages=[
+                {"role": "user", "content": question, "content_type": "text"},
+                {"role": "assistant", "type": "answer", "content": answer, "content_type": "text"},
+            ],
+        )
+    except Exception as e:
+        print(f"⚠️ 创建 Coze 对话失败: {str(e)}")
+        return None
+    return data.get("id")
+
+
+async def _get_or_create_conversation(
+    chat_service: ChatService,
+    request: ChatRequest,
+    bot: Bot,
+    organization_id: str,
+    user_id: str,
+) -> ConversationModel:
+    """获取请求指定的对话，不存在则创建"""
     conversation = None
     if request.conversation_id:
-        conversation = db.query(ConversationModel).filter(
-            ConversationModel.id == request.conversation_id,
-            ConversationModel.organization_id == org.id,
-            ConversationModel.user_id == current_user.id
-        ).first()
+        conversation = await chat_service.get_conversation(
+            request.conversation_id, organization_id, user_id
+        )
 
     if not conversation:
-        conversation = ConversationModel(
-            bot_id=bot.id,
-            user_id=current_user.id,
-            organization_id=org.id,
-            title=request.message[:50] + "..." if len(request.message) > 50 else request.message,
-            message_count=0
+        conversation = await chat_service.create_conversation(
+            bot=bot,
+            user_id=user_id,
+            organization_id=organization_id,
+            first_message=request.message,
         )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
 
-    try:
-        # 调用 Coze API
-        coze_response = await coze_service.chat(
-            bot_id=bot.bot_id,  # 使用 Coze bot ID
-            message=request.message,
-            conversation_id=conversation.conversation_id,
-            user_id=str(current_user.id),
-        )
+    return conversation
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    trace: RequestTrace = Depends(traced("chat")),
+    caller: deps.Caller = Depends(deps.get_caller("chat")),
+    db: AsyncSession = Depends(deps.get_async_db),
+):
+    """
+    非流式聊天 - 集成 Coze API（登录用户或带 chat 权限的 API 密钥）
+    """
+    trace.mark("auth")
+    current_user = caller.user
+    chat_service = ChatService(db)
+    org, bot, conversation = await _traced_chat_context(trace, chat_service, request, caller)
 
-        # 解析 Coze 响应
-        # Coze API v3 响应格式参考: https://www.coze.com/docs/developer_guides/api_v3
+    # 新对话的首轮提问（没有 Coze 对话上下文）的回答可以缓存复用、合并请求
+    cacheable = not request.conversation_id and not conversation.conversation_id
+    cached = answer_cache.get(bot, request.message) if cacheable else None
+
+    try:
         content = ""
         msg_id = None
+        coze_response = {}
+        is_leader = True
+
+        if cached:
+            content = cached.content
+            msg_id = cached.coze_message_id
+        else:
+            # 调用 Coze API
+            async def call_coze():
+                # 按租户公平排队获取上游名额
+                async with fair_scheduler.slot(org.id, org.plan_type):
+                    return await coze_service.chat(
+                        bot_id=bot.bot_id,  # 使用 Coze bot ID
+                        message=request.message,
+                        conversation_id=conversation.conversation_id,
+                        user_id=str(current_user.id),
+                    )
 
-        if "data" in coze_response:
-            # 提取 AI 回复内容
-            for item in coze_response.get("data", []):
-                if item.get("type") == "answer":
-                    content = item.get("content", "")
-                    msg_id = item.get("id")
-                    break
+            if cacheable:
+                # 没有上下文的相同问题并发到达时共享一次 Coze 调用
+                coze_response, is_leader = await chat_coalescer.call(
+                    coalesce_key(bot.bot_id, request.message), call_coze
+                )
+            else:
+                coze_response = await call_coze()
+
+            # 解析 Coze 响应
+            # Coze API v3 响应格式参考: https://www.coze.com/docs/developer_guides/api_v3
+            if "data" in coze_response:
+                # 提取 AI 回复内容
+                for item in coze_response.get("data", []):
+                    if item.get("type") == "answer":
+                        content = item.get("content", "")
+                        msg_id = item.get("id")
+                        break
+
+            if cacheable and is_leader:
+                answer_cache.set(bot, request.message, content, msg_id)
 
         # 保存用户消息
-        user_message = MessageModel(
-            conversation_id=conversation.id,
-            user_id=current_user.id,
-            role="user",
-            content=request.message,
-        )
-        db.add(user_message)
+        chat_service.add_message(conversation, current_user.id, "user", request.message)
 
         # 保存 AI 回复
         if content:
-            ai_message = MessageModel(
-                conversation_id=conversation.id,
-                user_id=current_user.id,
-                role="assistant",
-                content=content,
-                coze_message_id=msg_id,
+            chat_service.add_message(
+                conversation, current_user.id, "assistant", content, coze_message_id=msg_id
             )
-            db.add(ai_message)
 
-        # 更新对话
+        # 更新对话（合并请求的 Coze 对话属于发起者；命中缓存和其他请求创建自己的 Coze 对话）
         conversation.message_count += 2
-        if coze_response.get("conversation_id"):
+        if coze_response.get("conversation_id") and is_leader:
             conversation.conversation_id = coze_response["conversation_id"]
+        elif (cached or not is_leader) and content:
+            conversation.conversation_id = await _seed_coze_conversation(
+                bot, current_user.id, request.message, content
+            )
+
+        with trace.span("db_commit"):
+            await chat_service.commit(conversation)
 
-        db.commit()
-        db.refresh(conversation)
+        # 计入本月消息用量
+        usage_accumulator.record(org.id, current_user.id, "message")
 
+        trace.finish(SUCCESS)
         return ChatResponse(
             message_id=msg_id or "unknown",
             conversation_id=conversation.id,
@@ -132,6 +333,7 @@ async def chat(
     except Exception as e:
         # 记录错误但不要中断用户体验
         print(f"Coze API error: {str(e)}")
+        trace.finish(FALLBACK)
 
         # 返回模拟回复作为降级处理
         return ChatResponse(
@@ -143,143 +345,233 @@ async def chat(
         )
 
 
-@router.post("/chat/stream")
-async def chat_stream(
-    request: ChatRequest,
-    current_user: User = Depends(require_active_user),
-    db: Session = Depends(deps.get_db),
-):
+async def _stream_reply(
+    org: Organization,
+    bot: Bot,
+    conversation: ConversationModel,
+    user_id: str,
+    message: str,
+    started_at: float,
+    new_conversation: bool = False,
+) -> AsyncIterator[Tuple[str, Optional[str], Optional[str]]]:
     """
-    流式聊天 - 集成 Coze API (SSE)
-    """
-    org = get_current_org(current_user, db)
+    流式回复管线（SSE 与 WebSocket 共用）
 
-    # 验证 bot 是否存在且属于该组织
-    bot = db.query(Bot).filter(
-        Bot.id == request.bot_id,
-        Bot.organization_id == org.id
-    ).first()
+    new_conversation 表示请求没有指定已有对话；只有新对话的首轮提问才会命中缓存或合并请求。
 
-    if not bot:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Bot not found"
-        )
+    Yields:
+        ("message", 增量内容, Coze 消息 ID) / ("error", 错误信息, None) / ("done", None, None)
+    """
+    content_parts = []
+    msg_id = None
+    stream = None
+    saved = False
+    trace = current_trace()
+    # 本轮开始前的 Coze 对话 ID；本轮获得新 ID 时立即写库
+    known_coze_conversation_id = conversation.conversation_id
+
+    async def abort_stream() -> None:
+        # 上游出错：关闭上游流，已收到的部分回复标记为截断后保存
+        if stream is not None:
+            await stream.aclose()
+        if not saved:
+            try:
+                await _save_unfinished_reply(
+                    conversation,
+                    user_id,
+                    "".join(content_parts),
+                    msg_id,
+                    coze_conversation_id_changed=bool(conversation.conversation_id)
+                    and conversation.conversation_id != known_coze_conversation_id,
+                )
+            except Exception as e:
+                print(f"⚠️ 保存不完整回复失败 {conversation.id}: {str(e)}")
 
-    if not bot.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Bot is not active"
+    try:
+        # 保存用户消息（写后批量持久化，不阻塞请求）
+        await message_persister.enqueue_message(
+            conversation_id=conversation.id,
+            user_id=user_id,
+            role="user",
+            content=message,
         )
 
-    # 获取或创建对话
-    conversation = None
-    if request.conversation_id:
-        conversation = db.query(ConversationModel).filter(
-            ConversationModel.id == request.conversation_id,
-            ConversationModel.organization_id == org.id,
-            ConversationModel.user_id == current_user.id
-        ).first()
+        failed = False
+        is_leader = True
+
+        async def open_coze_stream():
+            # 上游名额在整条流期间占用
+            async with fair_scheduler.slot(org.id, org.plan_type):
+                async for chunk in coze_service.chat_stream(
+                    bot_id=bot.bot_id,
+                    message=message,
+                    conversation_id=conversation.conversation_id,
+                    user_id=str(user_id),
+                ):
+                    yield chunk
+
+        # 首轮提问命中缓存时回放缓存回答，否则调用 Coze 流式 API
+        cacheable = new_conversation and not conversation.conversation_id
+        cached = answer_cache.get(bot, message) if cacheable else None
+        if cached:
+            chunks = answer_cache.replay_stream(cached)
+        elif cacheable:
+            # 没有上下文的相同问题并发到达时共享一条上游流
+            subscription = chat_coalescer.subscribe(
+                coalesce_key(bot.bot_id, message), open_coze_stream
+            )
+            is_leader = subscription.is_leader
+            chunks = subscription
+        else:
+            chunks = open_coze_stream()
+
+        # 合并细碎的增量事件，减少输出帧数
+        stream = delta_coalescer.coalesce(chunks, started_at)
+        async for chunk in stream:
+            # 转发 Coze 的流式响应
+            if chunk.get("type") == "done":
+                # 完成
+                break
+            elif chunk.get("type") == "error":
+                # 错误
+                yield "error", chunk.get("error", "Unknown error"), None
+                failed = True
+                break
+            else:
+                data = chunk.get("data")
+                if not isinstance(data, dict):
+                    continue
+
+                # 提取内容
+                if chunk.get("event") == "conversation.message.delta":
+                    content = data.get("content", "")
+                    if content:
+                        if not content_parts and trace is not None:
+                            # 首字延迟（从请求开始计）
+                            trace.mark("first_token")
+                        content_parts.append(content)
+                        msg_id = data.get("id")
+                        yield "message", content, msg_id
+
+                # 更新 conversation_id（合并请求的 Coze 对话属于发起者）
+                if data.get("conversation_id") and is_leader:
+                    conversation.conversation_id = data["conversation_id"]
+
+        # 收到完成或错误事件后提前结束：立即关闭合并流，释放上游连接和调度名额
+        await stream.aclose()
+
+        full_content = "".join(content_parts)
+
+        if cacheable and not cached and not failed and is_leader:
+            answer_cache.set(bot, message, full_content, msg_id)
+
+        if (cached or not is_leader) and not failed and full_content:
+            # 命中缓存或合并到其他请求：创建自己的 Coze 对话，后续提问才有上下文
+            conversation.conversation_id = await _seed_coze_conversation(
+                bot, user_id, message, full_content
+            )
 
-    if not conversation:
-        conversation = ConversationModel(
-            bot_id=bot.id,
-            user_id=current_user.id,
-            organization_id=org.id,
-            title=request.message[:50] + "..." if len(request.message) > 50 else request.message,
-            message_count=0
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+        if conversation.conversation_id and conversation.conversation_id != known_coze_conversation_id:
+            await _save_coze_conversation_id(conversation)
+            known_coze_conversation_id = conversation.conversation_id
 
-    async def generate():
-        """生成流式响应"""
-        try:
-            # 保存用户消息
-            user_message = MessageModel(
+        # 保存 AI 回复（上游中途报错时为不完整回复）
+        if full_content:
+            # 同时更新对话消息计数和 Coze 对话 ID
+            await message_persister.enqueue_message(
                 conversation_id=conversation.id,
-                user_id=current_user.id,
-                role="user",
-                content=request.message,
+                user_id=user_id,
+                role="assistant",
+                content=full_content,
+                coze_message_id=msg_id,
+                message_count_delta=2,
+                coze_conversation_id=conversation.conversation_id,
+                is_truncated=failed,
             )
-            db.add(user_message)
-            db.commit()
-
-            full_content = ""
-            msg_id = None
-
-            # 调用 Coze 流式 API
-            async for chunk in coze_service.chat_stream(
-                bot_id=bot.bot_id,
-                message=request.message,
-                conversation_id=conversation.conversation_id,
-                user_id=str(current_user.id),
-            ):
-                # 转发 Coze 的流式响应
-                if chunk.get("type") == "done":
-                    # 完成
-                    break
-                elif chunk.get("type") == "error":
-                    # 错误
-                    error_chunk = ChatStreamChunk(
-                        type="error",
-                        error=chunk.get("error", "Unknown error")
-                    )
-                    yield f"data: {error_chunk.model_dump_json()}\n\n"
-                    break
-                else:
-                    # 提取内容
-                    if chunk.get("event") == "conversation.message.delta":
-                        data = chunk.get("data", {})
-                        content = data.get("content", "")
-                        if content:
-                            full_content += content
-                            msg_id = data.get("id")
-
-                            response_chunk = ChatStreamChunk(
-                                type="message",
-                                content=content,
-                                message_id=msg_id,
-                                conversation_id=conversation.id,
-                            )
-                            yield f"data: {response_chunk.model_dump_json()}\n\n"
-
-                    # 更新 conversation_id
-                    if chunk.get("conversation_id"):
-                        conversation.conversation_id = chunk["conversation_id"]
-
-            # 保存 AI 回复
-            if full_content:
-                ai_message = MessageModel(
-                    conversation_id=conversation.id,
-                    user_id=current_user.id,
-                    role="assistant",
-                    content=full_content,
-                    coze_message_id=msg_id,
-                )
-                db.add(ai_message)
+        saved = True
+
+        if not failed:
+            # 计入本月消息用量
+            usage_accumulator.record(org.id, user_id, "message")
+
+        # 发送完成事件
+        yield "done", None, None
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开：Starlette 收到 http.disconnect 后取消本协程，或发送失败后关闭生成器。
+        # 此时不能再 await，关闭上游流、保存不完整回复交给后台任务
+        if not saved:
+            stream_disconnects.inc()
+            spawn_background(_finish_disconnected_stream(
+                stream,
+                conversation,
+                user_id,
+                "".join(content_parts),
+                msg_id,
+                coze_conversation_id_changed=bool(conversation.conversation_id)
+                and conversation.conversation_id != known_coze_conversation_id,
+            ))
+        raise
+
+    except (CircuitOpenError, SchedulerTimeout) as e:
+        # 上游熔断中或排队超时：快速失败，不打印堆栈
+        print(f"Stream rejected: {str(e)}")
+        await abort_stream()
+        yield "error", f"服务暂时不可用: {str(e)}", None
 
-                # 更新对话消息计数
-                conversation.message_count += 2
-                if conversation.conversation_id:
-                    db.commit()
+    except Exception as e:
+        # 发送错误事件
+        import traceback
+        print(f"Stream error: {str(e)}")
+        print(traceback.format_exc())
 
-            # 发送完成事件
-            done_chunk = ChatStreamChunk(type="done")
-            yield f"data: {done_chunk.model_dump_json()}\n\n"
+        await abort_stream()
+        yield "error", f"服务暂时不可用: {str(e)}", None
 
-        except Exception as e:
-            # 发送错误事件
-            import traceback
-            print(f"Stream error: {str(e)}")
-            print(traceback.format_exc())
-
-            error_chunk = ChatStreamChunk(
-                type="error",
-                error=f"服务暂时不可用: {str(e)}"
-            )
-            yield f"data: {error_chunk.model_dump_json()}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    trace: RequestTrace = Depends(traced("chat_stream")),
+    caller: deps.Caller = Depends(deps.get_caller("chat")),
+    db: AsyncSession = Depends(deps.get_async_db),
+):
+    """
+    流式聊天 - 集成 Coze API (SSE)（登录用户或带 chat 权限的 API 密钥）
+    """
+    trace.mark("auth")
+    started_at = time.perf_counter()
+    current_user = caller.user
+    chat_service = ChatService(db)
+    org, bot, conversation = await _traced_chat_context(trace, chat_service, request, caller)
+
+    async def generate():
+        """生成流式响应"""
+        encoder = SSEFrameEncoder(conversation.id)
+        # 没有正常结束（done 之前生成器被关闭）即客户端断开
+        outcome = DISCONNECTED
+        try:
+            async with aclosing(_stream_reply(
+                org, bot, conversation, current_user.id, request.message, started_at,
+                new_conversation=not request.conversation_id,
+            )) as reply:
+                async for kind, content, message_id in reply:
+                    if kind == "message":
+                        frame = encoder.message(content, message_id)
+                    elif kind == "error":
+                        outcome = ERROR
+                        frame = SSEFrameEncoder.error(content)
+                    else:
+                        if outcome != ERROR:
+                            outcome = SUCCESS
+                        frame = encoder.done()
+
+                    # yield 挂起期间即 Starlette 发送这一帧的耗时（含客户端背压）
+                    sent_at = time.perf_counter()
+                    yield frame
+                    trace.record("sse_send", time.perf_counter() - sent_at)
+        finally:
+            trace.finish(outcome)
 
     return StreamingResponse(
         generate(),
@@ -290,3 +582,387 @@ async def chat_stream(
             "X-Accel-Buffering": "no"
         }
     )
+
+
+class _SocketStream:
+    """WebSocket 连接上的一路回复流（带发送额度的流量控制）"""
+
+    def __init__(self, stream_id: str, credits: int):
+        self.stream_id = stream_id
+        self.credits = credits
+        self.task: Optional[asyncio.Task] = None
+        self._credit_available = asyncio.Event()
+        if credits > 0:
+            self._credit_available.set()
+
+    def grant(self, credits: int) -> None:
+        """客户端追加发送额度"""
+        self.credits += credits
+        if self.credits > 0:
+            self._credit_available.set()
+
+    async def consume(self) -> None:
+        """消耗一帧额度；额度用完时等待客户端追加（上游随之被背压）"""
+        while self.credits <= 0:
+            self._credit_available.clear()
+            await self._credit_available.wait()
+        self.credits -= 1
+
+
+class ChatSocketSession:
+    """
+    WebSocket 聊天会话
+
+    连接建立时认证一次，之后在连接内缓存用户、组织和机器人（用户和组织随心跳定期重新校验，
+    机器人缓存超过 WS_USER_RECHECK_INTERVAL 秒后重新查询，停用的机器人不再回答）；
+    一个连接上可以并发多路对话，每条消息用 stream_id 区分。
+
+    客户端 -> 服务端:
+        {"type": "auth", "token": "..."}                 未在查询参数中携带 token 时的首条消息
+        {"type": "chat", "stream_id": "s1", "bot_id": "...", "message": "...", "conversation_id": null}
+        {"type": "credit", "stream_id": "s1", "credits": 32}   追加发送额度（流量控制）
+        {"type": "cancel", "stream_id": "s1"}            取消一路回复
+        {"type": "ping"} / {"type": "pong"}
+
+    服务端 -> 客户端:
+        {"type": "ready", "user_id": "...", "organization_id": "...", "credits": 64}
+        {"type": "message", "stream_id": "s1", "content": "...", "message_id": "...", "conversation_id": "..."}
+        {"type": "done", "stream_id": "s1", "conversation_id": "..."}
+        {"type": "error", "stream_id": "s1", "error": "..."}       超出限流时带 retry_after（秒）
+        {"type": "ping"} / {"type": "pong"}
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.user: Optional[UserModel] = None
+        self.org: Optional[Organization] = None
+        self.token_expires_at: Optional[float] = None
+        # 机器人 ID -> (机器人, 加载时间)
+        self.bots: Dict[str, Tuple[Bot, float]] = {}
+        self.conversations: "OrderedDict[str, ConversationModel]" = OrderedDict()
+        self.streams: Dict[str, _SocketStream] = {}
+        self._send_lock = asyncio.Lock()
+        self._last_received = time.monotonic()
+        self._checked_at = time.monotonic()
+
+    async def run(self, token: Optional[str]) -> None:
+        """处理整个连接"""
+        await self.websocket.accept()
+
+        try:
+            if token is None:
+                message = await asyncio.wait_for(self._receive(), settings.WS_AUTH_TIMEOUT)
+                token = message.get("token") if message and message.get("type") == "auth" else None
+
+            error = await self._authenticate(token)
+            if error:
+                await self.send({"type": "error", "error": error})
+                await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+        except (asyncio.TimeoutError, WebSocketDisconnect):
+            await self._close_quietly(status.WS_1008_POLICY_VIOLATION)
+            return
+
+        await self.send({
+            "type": "ready",
+            "user_id": self.user.id,
+            "organization_id": self.org.id,
+            "credits": settings.WS_INITIAL_CREDITS,
+        })
+
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                message = await self._receive()
+                if message is not None:
+                    await self._dispatch(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            heartbeat.cancel()
+            # 连接关闭：取消所有进行中的回复（上游随之取消，部分回复按截断保存）
+            for stream in list(self.streams.values()):
+                if stream.task is not None:
+                    stream.task.cancel()
+
+    async def send(self, payload: Dict[str, Any]) -> None:
+        """发送一帧（多路回复共用一个连接，发送需要串行）"""
+        text = json.dumps(payload, ensure_ascii=False)
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def _receive(self) -> Optional[Dict[str, Any]]:
+        """接收一帧 JSON；格式错误时回复错误并返回 None"""
+        text = await self.websocket.receive_text()
+        self._last_received = time.monotonic()
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            message = None
+        if not isinstance(message, dict):
+            await self.send({"type": "error", "error": "Invalid message"})
+            return None
+        return message
+
+    async def _authenticate(self, token: Optional[str]) -> Optional[str]:
+        """认证并加载用户和组织；失败返回错误信息"""
+        payload = decode_token(token) if token else None
+        if not payload or not payload.get("sub"):
+            return "Could not validate credentials"
+        if payload.get("type") != "access":
+            return "Invalid token type"
+
+        error = await self._load_user(payload["sub"])
+        if error is None:
+            self.token_expires_at = payload.get("exp")
+        return error
+
+    async def _load_user(self, user_id: str) -> Optional[str]:
+        """加载用户和组织（认证时及连接期间定期调用）；失败返回错误信息"""
+        async with AsyncSessionLocal() as db:
+            chat_service = ChatService(db)
+            user = await chat_service.get_user(user_id)
+            if user is None:
+                return "Could not validate credentials"
+            if not user.is_active:
+                return "User account is inactive"
+
+            org = await chat_service.get_user_organization(user.id)
+            if not org:
+                return "User does not belong to any organization"
+
+        if self.org is not None and self.org.id != org.id:
+            # 换了组织：缓存的机器人和对话属于原组织
+            self.bots.clear()
+            self.conversations.clear()
+        self.user = user
+        self.org = org
+        self._checked_at = time.monotonic()
+        return None
+
+    async def _dispatch(self, message: Dict[str, Any]) -> None:
+        """处理客户端消息"""
+        message_type = message.get("type")
+        stream_id = message.get("stream_id")
+
+        if message_type == "chat":
+            await self._start_stream(message)
+        elif message_type == "credit":
+            stream = self.streams.get(stream_id)
+            credits = message.get("credits")
+            if stream is not None and isinstance(credits, int) and credits > 0:
+                stream.grant(credits)
+        elif message_type == "cancel":
+            stream = self.streams.get(stream_id)
+            if stream is not None and stream.task is not None:
+                stream.task.cancel()
+        elif message_type == "ping":
+            await self.send({"type": "pong"})
+        elif message_type == "pong":
+            pass
+        else:
+            await self.send({"type": "error", "stream_id": stream_id, "error": "Unknown message type"})
+
+    async def _start_stream(self, message: Dict[str, Any]) -> None:
+        """开始一路回复"""
+        stream_id = message.get("stream_id")
+        if not isinstance(stream_id, str) or not stream_id or len(stream_id) > 64:
+            await self.send({"type": "error", "error": "Invalid stream_id"})
+            return
+        if stream_id in self.streams:
+            await self.send({"type": "error", "stream_id": stream_id, "error": "stream_id already in use"})
+            return
+        if len(self.streams) >= settings.WS_MAX_STREAMS:
+            await self.send({"type": "error", "stream_id": stream_id, "error": "Too many concurrent streams"})
+            return
+
+        # 长连接期间 token 可能过期：过期后不再接受新对话
+        if self.token_expires_at is not None and time.time() >= self.token_expires_at:
+            await self.send({"type": "error", "stream_id": stream_id, "error": "Token expired"})
+            await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+        # 限流中间件只检查握手：每条 chat 消息与 HTTP 请求共用同一个用户限流键
+        if rate_limiter.enabled:
+            result = await rate_limiter.check("user", self.user.id, plan_rate_limits(self.org.plan_type))
+            if not result.allowed:
+                await self.send({
+                    "type": "error",
+                    "stream_id": stream_id,
+                    "error": "Rate limit exceeded",
+                    "retry_after": int(retry_after_header(result)),
+                })
+                return
+
+        try:
+            request = ChatRequest(
+                bot_id=message.get("bot_id") or "",
+                message=message.get("message") or "",
+                conversation_id=message.get("conversation_id"),
+                stream=True,
+            )
+        except ValidationError:
+            await self.send({"type": "error", "stream_id": stream_id, "error": "Invalid chat request"})
+            return
+
+        stream = _SocketStream(stream_id, settings.WS_INITIAL_CREDITS)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._run_stream(stream, request))
+
+    async def _resolve(self, request: ChatRequest) -> Tuple[Bot, ConversationModel]:
+        """解析机器人和对话（连接内缓存；机器人缓存过期后重新查库，检查是否仍存在且已启用）"""
+        await _check_message_quota(self.org)
+
+        bot = None
+        cached = self.bots.get(request.bot_id)
+        if cached is not None and time.monotonic() - cached[1] < settings.WS_USER_RECHECK_INTERVAL:
+            bot = cached[0]
+        conversation = (
+            self.conversations.get(request.conversation_id) if request.conversation_id else None
+        )
+        if bot is not None and conversation is not None and conversation.bot_id == bot.id:
+            self.conversations.move_to_end(conversation.id)
+            return bot, conversation
+
+        async with AsyncSessionLocal() as db:
+            chat_service = ChatService(db)
+            if bot is None:
+                self.bots.pop(request.bot_id, None)
+                with span("bot_lookup"):
+                    bot = await chat_service.get_bot(request.bot_id, self.org.id)
+                _check_bot(bot)
+                self.bots[bot.id] = (bot, time.monotonic())
+            with span("conversation"):
+                conversation = await _get_or_create_conversation(
+                    chat_service, request, bot, self.org.id, self.user.id
+                )
+
+        self.conversations[conversation.id] = conversation
+        while len(self.conversations) > 100:
+            self.conversations.popitem(last=False)
+        return bot, conversation
+
+    async def _run_stream(self, stream: _SocketStream, request: ChatRequest) -> None:
+        """执行一路回复"""
+        # 本任务独立的 trace（连接级认证不计入）
+        trace = start_trace("ws")
+        trace.set_labels(plan=self.org.plan_type)
+        started_at = trace.started_at
+        stream_id = stream.stream_id
+        outcome = DISCONNECTED
+        try:
+            bot, conversation = await self._resolve(request)
+
+            async with aclosing(_stream_reply(
+                self.org, bot, conversation, self.user.id, request.message, started_at,
+                new_conversation=not request.conversation_id,
+            )) as reply:
+                async for kind, content, message_id in reply:
+                    sent_at = time.perf_counter()
+                    if kind == "message":
+                        await stream.consume()
+                        await self.send({
+                            "type": "message",
+                            "stream_id": stream_id,
+                            "content": content,
+                            "message_id": message_id,
+                            "conversation_id": conversation.id,
+                        })
+                    elif kind == "error":
+                        outcome = ERROR
+                        await self.send({"type": "error", "stream_id": stream_id, "error": content})
+                    else:
+                        if outcome != ERROR:
+                            outcome = SUCCESS
+                        await self.send({
+                            "type": "done",
+                            "stream_id": stream_id,
+                            "conversation_id": conversation.id,
+                        })
+                    # 含等待发送额度的时间
+                    trace.record("ws_send", time.perf_counter() - sent_at)
+
+        except HTTPException as e:
+            outcome = ERROR
+            await self._send_quietly({"type": "error", "stream_id": stream_id, "error": e.detail})
+        except WebSocketDisconnect:
+            # 连接已关闭，发送失败
+            pass
+        except Exception as e:
+            if isinstance(e, RuntimeError) and self.closed:
+                # 连接关闭后发送（Starlette 抛出 RuntimeError）
+                return
+            outcome = ERROR
+            print(f"❌ WebSocket stream {stream_id} failed: {type(e).__name__}: {str(e)}")
+            await self._send_quietly({"type": "error", "stream_id": stream_id, "error": "Internal server error"})
+        finally:
+            trace.finish(outcome)
+            self.streams.pop(stream_id, None)
+
+    async def _heartbeat(self) -> None:
+        """
+        定期发送心跳；超时未收到客户端任何消息则关闭连接
+
+        每隔 WS_USER_RECHECK_INTERVAL 秒重新加载用户和组织，用户被停用或移出组织后关闭连接
+        （进行中的回复随之取消）。
+        """
+        interval = settings.WS_HEARTBEAT_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._last_received > settings.WS_HEARTBEAT_TIMEOUT:
+                await self._close_quietly(status.WS_1001_GOING_AWAY)
+                return
+
+            if time.monotonic() - self._checked_at >= settings.WS_USER_RECHECK_INTERVAL:
+                try:
+                    error = await self._load_user(self.user.id)
+                except Exception as e:
+                    # 数据库暂时不可用：沿用已加载的用户，下次心跳重试
+                    print(f"⚠️ WebSocket user recheck failed: {str(e)}")
+                    error = None
+                if error:
+                    await self._send_quietly({"type": "error", "error": error})
+                    await self._close_quietly(status.WS_1008_POLICY_VIOLATION)
+                    return
+
+            await self._send_quietly({"type": "ping"})
+
+    @property
+    def closed(self) -> bool:
+        """连接是否已关闭（任一方向）"""
+        return (
+            self.websocket.client_state == WebSocketState.DISCONNECTED
+            or self.websocket.application_state == WebSocketState.DISCONNECTED
+        )
+
+    async def _send_quietly(self, payload: Dict[str, Any]) -> None:
+        """发送一帧，忽略连接已关闭的错误"""
+        try:
+            await self.send(payload)
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError as e:
+            if not self.closed:
+                print(f"❌ WebSocket send failed: {str(e)}")
+
+    async def _close_quietly(self, code: int) -> None:
+        """关闭连接，忽略重复关闭的错误"""
+        try:
+            await self.websocket.close(code=code)
+        except RuntimeError:
+            pass
+
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+):
+    """
+    WebSocket 聊天（多路复用）
+
+    认证一次后在同一连接上并发多路对话，省去每条消息的 JWT 解码、组织和机器人查询；
+    浏览器无法自定义 WebSocket 请求头，token 通过查询参数或首条 auth 消息传入。
+    协议见 ChatSocketSession。
+    """
+    await ChatSocketSession(websocket).run(token)
@@ -1,12 +1,13 @@
 """
 对话管理 API 端点
 """
+from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api.v1.endpoints import deps
-from app.api.v1.endpoints.bots import get_current_org
 from app.api.v1.endpoints.rbac import require_org_admin
 from app.schemas.conversation import (
     Conversation, ConversationCreate, ConversationUpdate,
@@ -15,8 +16,12 @@ from app.schemas.conversation import (
 from app.schemas.user import User
 from app.models.conversation import Conversation as ConversationModel
 from app.models.bot import Bot
+from app.models.organization import Organization
 from app.models.user import User as UserModel
 from app.models.message import Message as MessageModel
+from app.services.export_service import (
+    MESSAGE_EXPORT_COLUMNS, export_filename, export_media_type, message_export_statement, stream_export
+)
 
 router = APIRouter()
 
@@ -28,12 +33,11 @@ def list_conversations(
     bot_id: Optional[str] = None,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取对话列表（用户端：只能看到自己的对话）
     """
-    org = get_current_org(current_user, db)
-
     query = db.query(ConversationModel).filter(
         ConversationModel.organization_id == org.id,
         ConversationModel.user_id == current_user.id
@@ -62,12 +66,11 @@ def create_conversation(
     conversation_in: ConversationCreate,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     创建新对话
     """
-    org = get_current_org(current_user, db)
-
     # 验证 bot 是否存在且属于该组织
     bot = db.query(Bot).filter(
         Bot.id == conversation_in.bot_id,
@@ -106,12 +109,11 @@ def get_conversation(
     conversation_id: str,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取对话详情
     """
-    org = get_current_org(current_user, db)
-
     conversation = db.query(ConversationModel).filter(
         ConversationModel.id == conversation_id,
         ConversationModel.organization_id == org.id,
@@ -133,12 +135,11 @@ def update_conversation(
     conversation_in: ConversationUpdate,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     更新对话（如标题）
     """
-    org = get_current_org(current_user, db)
-
     conversation = db.query(ConversationModel).filter(
         ConversationModel.id == conversation_id,
         ConversationModel.organization_id == org.id,
@@ -167,12 +168,11 @@ def delete_conversation(
     conversation_id: str,
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     删除对话
     """
-    org = get_current_org(current_user, db)
-
     conversation = db.query(ConversationModel).filter(
         ConversationModel.id == conversation_id,
         ConversationModel.organization_id == org.id,
@@ -198,12 +198,11 @@ def get_conversation_messages(
     page_size: int = Query(50, ge=1, le=100),
     current_user: User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取对话的消息列表
     """
-    org = get_current_org(current_user, db)
-
     conversation = db.query(ConversationModel).filter(
         ConversationModel.id == conversation_id,
         ConversationModel.organization_id == org.id,
@@ -233,6 +232,39 @@ def get_conversation_messages(
     }
 
 
+@router.get("/{conversation_id}/messages/export")
+def export_conversation_messages(
+    conversation_id: str,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(False),
+    current_user: User = Depends(deps.get_current_user),
+    db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
+):
+    """
+    导出对话的全部消息（CSV 或 NDJSON，流式输出）
+    """
+    conversation = db.query(ConversationModel.id).filter(
+        ConversationModel.id == conversation_id,
+        ConversationModel.organization_id == org.id,
+        ConversationModel.user_id == current_user.id
+    ).first()
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    statement = message_export_statement(org.id, conversation_id=conversation_id)
+    filename = export_filename(f"conversation-{conversation_id}", format, gzip)
+    return StreamingResponse(
+        stream_export("messages", statement, MESSAGE_EXPORT_COLUMNS, format, gzip=gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 # ==================== 管理端：所有对话管理 ====================
 
 @router.get("/admin/all", response_model=ConversationListResponse)
@@ -243,12 +275,11 @@ def list_all_conversations(
     user_id: Optional[str] = None,
     current_admin: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取所有对话列表（管理端）
     """
-    org = get_current_org(current_admin, db)
-
     query = db.query(ConversationModel).filter(
         ConversationModel.organization_id == org.id
     )
@@ -272,3 +303,28 @@ def list_all_conversations(
         page_size=page_size,
         has_more=page * page_size < total
     )
+
+
+@router.get("/admin/export")
+def export_all_messages(
+    bot_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(False),
+    current_admin: User = Depends(require_org_admin),
+    org: Organization = Depends(deps.get_current_org),
+):
+    """
+    导出组织的全部消息（管理端；CSV 或 NDJSON，流式输出）
+
+    可按机器人、用户和消息时间范围 [start, end) 过滤。
+    """
+    statement = message_export_statement(org.id, user_id=user_id, bot_id=bot_id, start=start, end=end)
+    filename = export_filename(f"messages-{org.id}", format, gzip)
+    return StreamingResponse(
+        stream_export("messages", statement, MESSAGE_EXPORT_COLUMNS, format, gzip=gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
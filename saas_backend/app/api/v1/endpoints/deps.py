@@ -1,27 +1,50 @@
 """
 FastAPI 依赖注入
+
+依赖使用同步会话：需要查库的步骤放到线程池执行（run_in_threadpool，或声明为普通 def 由 FastAPI
+放到线程池），不阻塞事件循环；只读缓存、不查库的步骤保持 async，命中缓存时不切换线程。
 """
-from typing import Optional
+from dataclasses import dataclass
+from typing import Callable, Optional
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.db.session import get_db
-from app.core.security import decode_token
+from app.db.session import get_db, get_async_db
+from app.core.security import decode_token, hash_api_key
 from app.models.user import User
 from app.models.organization import Organization
+from app.services.api_key_service import APIKeyPrincipal, APIKeyService, accept_principal, api_key_cache
+from app.services.org_membership import OrgMembership, resolve_membership
+from app.services.token_cache import UserSnapshot, token_cache
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+# 同时接受 API 密钥的接口使用：缺少凭据时由 get_caller 统一报错
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
 async def get_current_user(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
-) -> User:
+) -> UserSnapshot:
     """
     获取当前登录用户
+
+    返回只读快照：同一 token 在缓存有效期内不再解码 JWT、不再查询 users 表。
+    需要修改用户时使用 get_current_user_model。
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached.user
+
+    return await run_in_threadpool(_authenticate_token, db, token)
+
+
+def _authenticate_token(db: Session, token: str) -> UserSnapshot:
+    """校验 JWT 并查询用户（缓存未命中时在线程池执行），校验通过后写入缓存"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,12 +78,34 @@ async def get_current_user(
             detail="User account is inactive"
         )
 
+    # 只缓存校验通过的活跃用户
+    snapshot = UserSnapshot.from_model(user)
+    token_cache.set(token, payload, snapshot)
+    return snapshot
+
+
+def get_current_user_model(
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> User:
+    """
+    获取当前用户的 ORM 对象（不走缓存）
+
+    用于需要修改当前用户的端点；修改提交后应调用 token_cache.invalidate_user。
+    """
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if user is None or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: UserSnapshot = Depends(get_current_user)
+) -> UserSnapshot:
     """
     获取当前活跃用户
     """
@@ -72,38 +117,114 @@ async def get_current_active_user(
     return current_user
 
 
-async def get_current_tenant(
-    current_user: User = Depends(get_current_user),
+@dataclass(frozen=True)
+class Caller:
+    """
+    接口调用方：登录用户，或服务端使用的 API 密钥
+
+    API 密钥调用时 user 为创建密钥的用户，组织固定为密钥所属组织。
+    """
+    user: UserSnapshot
+    api_key: Optional[APIKeyPrincipal] = None
+
+    @property
+    def organization_id(self) -> Optional[str]:
+        """API 密钥所属组织（用户登录时为 None，按成员关系解析）"""
+        return self.api_key.organization_id if self.api_key else None
+
+
+def get_caller(scope: str) -> Callable:
+    """
+    依赖工厂：接受 Bearer Token 或 X-API-Key 认证
+
+    请求带 X-API-Key 时按密钥认证并检查权限范围 scope；否则按登录用户认证（要求用户未被禁用）。
+    """
+    async def dependency(
+        api_key: Optional[str] = Depends(api_key_header),
+        token: Optional[str] = Depends(optional_oauth2_scheme),
+        db: Session = Depends(get_db),
+    ) -> Caller:
+        if api_key:
+            # 命中缓存时在事件循环上完成认证，只有未命中才到线程池查库
+            key_hash = hash_api_key(api_key)
+            cached = api_key_cache.get(key_hash)
+            if cached is not None:
+                principal = accept_principal(cached.principal)
+            else:
+                principal = await run_in_threadpool(APIKeyService(db).authenticate_hash, key_hash)
+            if principal is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid API key",
+                )
+            if not principal.allows(scope):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=f"API key does not have the '{scope}' scope",
+                )
+            return Caller(user=principal.user, api_key=principal)
+
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        user = await get_current_user(db, token)
+        if not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="用户账户已被禁用",
+            )
+        return Caller(user=user)
+
+    return dependency
+
+
+async def get_current_membership(
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
-) -> Organization:
+) -> Optional[OrgMembership]:
     """
-    获取当前用户的租户（组织）
-    - 从用户信息中获取所属组织
-    - 用于客服/运营人员登录后的租户隔离
+    解析当前用户的组织和成员角色（一次 JOIN 查询）
+
+    get_current_org、get_current_tenant 都依赖它，FastAPI 在同一请求内只解析一次；
+    用户不属于任何组织时返回 None，由上层依赖决定错误响应。
     """
-    # 检查用户是否属于某个组织
-    from app.models.organization_member import OrganizationMember
+    return await run_in_threadpool(resolve_membership, db, current_user.id)
 
-    membership = db.query(OrganizationMember).filter(
-        OrganizationMember.user_id == current_user.id
-    ).first()
 
-    if not membership:
+async def get_current_org(
+    membership: Optional[OrgMembership] = Depends(get_current_membership)
+) -> Organization:
+    """
+    获取当前用户所属组织（用户端、管理端接口的组织隔离）
+    """
+    if membership is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
+            status_code=status.HTTP_404_NOT_FOUND,
             detail="User does not belong to any organization"
         )
+    return membership.organization
 
-    organization = db.query(Organization).filter(
-        Organization.id == membership.organization_id
-    ).first()
 
-    if not organization:
+async def get_current_tenant(
+    membership: Optional[OrgMembership] = Depends(get_current_membership)
+) -> Organization:
+    """
+    获取当前用户的租户（组织）
+    - 从用户信息中获取所属组织
+    - 用于客服/运营人员登录后的租户隔离
+    """
+    # 检查用户是否属于某个组织
+    if membership is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Organization not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User does not belong to any organization"
         )
 
+    organization = membership.organization
     if not organization.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -113,7 +234,7 @@ async def get_current_tenant(
     return organization
 
 
-async def get_tenant_from_uuid(
+def get_tenant_from_uuid(
     tenant_uuid: str,
     db: Session = Depends(get_db)
 ) -> Organization:
@@ -142,8 +263,8 @@ async def get_tenant_from_uuid(
 
 
 async def require_org_admin(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: UserSnapshot = Depends(get_current_user)
+) -> UserSnapshot:
     """
     要求用户必须是组织管理员
     """
@@ -156,8 +277,8 @@ async def require_org_admin(
 
 
 async def require_platform_admin(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: UserSnapshot = Depends(get_current_user)
+) -> UserSnapshot:
     """
     要求用户必须是平台管理员
     """
@@ -23,6 +23,7 @@ from app.schemas.user import User
 from app.models.knowledge_base import KnowledgeBase as KnowledgeBaseModel, Document as DocumentModel
 from app.models.organization import Organization
 from app.models.user import User as UserModel
+from app.services.answer_cache import answer_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -30,27 +31,6 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def get_current_org(
-    current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(deps.get_db)
-) -> Organization:
-    """获取当前用户所属组织"""
-    from app.models.organization_member import OrganizationMember
-
-    membership = db.query(OrganizationMember).filter(
-        OrganizationMember.user_id == current_user.id
-    ).first()
-
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User does not belong to any organization"
-        )
-
-    org = db.query(Organization).filter(Organization.id == membership.organization_id).first()
-    return org
-
-
 # ==================== 知识库管理 ====================
 
 @router.get("", response_model=KnowledgeBaseListResponse)
@@ -60,12 +40,11 @@ def list_knowledge_bases(
     is_active: Optional[bool] = None,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取知识库列表
     """
-    org = get_current_org(current_user, db)
-
     query = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.organization_id == org.id
     )
@@ -90,12 +69,11 @@ def create_knowledge_base(
     kb_in: KnowledgeBaseCreate,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     创建知识库
     """
-    org = get_current_org(current_user, db)
-
     # 检查同名知识库
     existing_kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.organization_id == org.id,
@@ -126,12 +104,11 @@ def get_knowledge_base(
     kb_id: str,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取知识库详情
     """
-    org = get_current_org(current_user, db)
-
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
         KnowledgeBaseModel.organization_id == org.id
@@ -152,12 +129,11 @@ def update_knowledge_base(
     kb_in: KnowledgeBaseUpdate,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     更新知识库
     """
-    org = get_current_org(current_user, db)
-
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
         KnowledgeBaseModel.organization_id == org.id
@@ -177,6 +153,9 @@ def update_knowledge_base(
     db.commit()
     db.refresh(kb)
 
+    # 知识库变更后该租户的缓存回答可能过期
+    answer_cache.invalidate_org_knowledge(db, org.id)
+
     return kb
 
 
@@ -185,12 +164,11 @@ def delete_knowledge_base(
     kb_id: str,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     删除知识库（及其所有文档）
     """
-    org = get_current_org(current_user, db)
-
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
         KnowledgeBaseModel.organization_id == org.id
@@ -205,6 +183,8 @@ def delete_knowledge_base(
     db.delete(kb)
     db.commit()
 
+    answer_cache.invalidate_org_knowledge(db, org.id)
+
     return None
 
 
@@ -218,12 +198,11 @@ def list_documents(
     status: Optional[str] = None,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取知识库的文档列表
     """
-    org = get_current_org(current_user, db)
-
     # 验证知识库属于当前组织
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
@@ -259,12 +238,11 @@ def create_document(
     doc_in: DocumentCreate,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     创建文档（手动输入内容）
     """
-    org = get_current_org(current_user, db)
-
     # 验证知识库属于当前组织
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
@@ -292,6 +270,8 @@ def create_document(
     kb.document_count += 1
     db.commit()
 
+    answer_cache.invalidate_org_knowledge(db, org.id)
+
     return document
 
 
@@ -301,12 +281,11 @@ async def upload_document(
     file: UploadFile = File(...),
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     上传文档文件
     """
-    org = get_current_org(current_user, db)
-
     # 验证知识库属于当前组织
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
@@ -349,6 +328,8 @@ async def upload_document(
     document.status = "completed"
     db.commit()
 
+    answer_cache.invalidate_org_knowledge(db, org.id)
+
     return document
 
 
@@ -358,12 +339,11 @@ def get_document(
     doc_id: str,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     获取文档详情
     """
-    org = get_current_org(current_user, db)
-
     # 验证知识库属于当前组织
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
@@ -396,14 +376,13 @@ def delete_document(
     doc_id: str,
     current_user: User = Depends(require_org_admin),
     db: Session = Depends(deps.get_db),
+    org: Organization = Depends(deps.get_current_org),
 ):
     """
     删除文档
     """
     logger.info(f"[知识库管理] 用户 {current_user.email} 尝试删除文档 - KB_ID: {kb_id}, Doc_ID: {doc_id}")
 
-    org = get_current_org(current_user, db)
-
     # 验证知识库属于当前组织
     kb = db.query(KnowledgeBaseModel).filter(
         KnowledgeBaseModel.id == kb_id,
@@ -441,6 +420,8 @@ def delete_document(
     kb.document_count = max(0, kb.document_count - 1)
     db.commit()
 
+    answer_cache.invalidate_org_knowledge(db, org.id)
+
     logger.info(f"[知识库管理] 成功删除文档 - Doc_ID: {doc_id}, Title: {doc.title}, "
                 f"知识库文档计数: {old_count} -> {kb.document_count}, 操作者: {current_user.email}")
 
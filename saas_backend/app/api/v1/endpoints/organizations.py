@@ -17,6 +17,8 @@ from app.schemas.organization import (
 from app.models.organization import Organization as OrganizationModel
 from app.models.organization_member import OrganizationMember, MemberRole
 from app.models.user import User
+from app.services.api_key_service import api_key_cache
+from app.services.org_membership import membership_cache
 
 router = APIRouter()
 
@@ -72,6 +74,7 @@ def create_organization(
 
     db.add(member)
     db.commit()
+    membership_cache.invalidate_user(current_user.id)
 
     return organization
 
@@ -157,6 +160,8 @@ def update_organization(
 
     db.commit()
     db.refresh(organization)
+    membership_cache.invalidate_organization(organization.id)
+    api_key_cache.invalidate_organization(organization.id)
 
     return organization
 
@@ -213,6 +218,7 @@ def invite_member(
 
     db.add(member)
     db.commit()
+    membership_cache.invalidate_user(user.id)
 
     return {"message": "Member added successfully"}
 
@@ -253,5 +259,6 @@ def remove_member(
 
     db.delete(member)
     db.commit()
+    membership_cache.invalidate_user(user_id)
 
     return {"message": "Member removed successfully"}
@@ -3,29 +3,71 @@
 """
 from datetime import date, datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from uuid import UUID
 
 from app.api.v1.endpoints import deps
 from app.schemas.usage import UsageStats, UsageHistory
-from app.services.usage_service import UsageService
-from app.models.user import User
+from app.services.org_membership import resolve_membership
+from app.services.export_service import (
+    USAGE_EXPORT_COLUMNS, export_filename, export_media_type, stream_export, usage_export_statement
+)
+from app.services.usage_accumulator import usage_accumulator
+from app.services.usage_service import RESOURCE_LIMIT_KEYS, UsageService
 
 router = APIRouter()
 
 
+def _check_organization(caller: deps.Caller, organization_id: UUID) -> None:
+    """API 密钥只能访问所属组织的使用量"""
+    if caller.api_key and str(organization_id) != caller.organization_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="API key does not belong to this organization"
+        )
+
+
+def _check_member(caller: deps.Caller, organization_id: UUID, db: Session) -> None:
+    """登录用户只能访问自己所属的组织"""
+    membership = resolve_membership(db, caller.user.id)
+    if membership is None or membership.organization.id != str(organization_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User does not belong to this organization"
+        )
+
+
+def _check_export_access(caller: deps.Caller, organization_id: UUID, db: Session) -> None:
+    """
+    导出明细的权限：API 密钥只能导出所属组织；
+    登录用户须为组织管理员，且只能导出自己所属的组织
+    """
+    _check_organization(caller, organization_id)
+    if caller.api_key:
+        return
+
+    if not (caller.user.is_admin or caller.user.is_org_admin):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要组织管理员权限",
+        )
+    _check_member(caller, organization_id, db)
+
+
 @router.get("/stats", response_model=UsageStats)
 def get_usage_stats(
     organization_id: UUID,
     period_start: Optional[date] = Query(None),
     period_end: Optional[date] = Query(None),
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user),
+    caller: deps.Caller = Depends(deps.get_caller("usage:read")),
 ):
     """
-    获取使用量统计
+    获取使用量统计（登录用户或带 usage:read 权限的 API 密钥）
     """
+    _check_organization(caller, organization_id)
     usage_service = UsageService(db)
 
     stats = usage_service.get_usage_stats(
@@ -42,11 +84,12 @@ def get_usage_history(
     organization_id: UUID,
     days: int = Query(30, ge=1, le=365),
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user),
+    caller: deps.Caller = Depends(deps.get_caller("usage:read")),
 ):
     """
-    获取使用量历史
+    获取使用量历史（登录用户或带 usage:read 权限的 API 密钥）
     """
+    _check_organization(caller, organization_id)
     usage_service = UsageService(db)
 
     history = usage_service.get_usage_history(
@@ -57,24 +100,67 @@ def get_usage_history(
     return history
 
 
+@router.get("/export")
+def export_usage(
+    organization_id: UUID,
+    period_start: Optional[date] = Query(None),
+    period_end: Optional[date] = Query(None),
+    resource_type: Optional[str] = Query(None),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(False),
+    db: Session = Depends(deps.get_db),
+    caller: deps.Caller = Depends(deps.get_caller("usage:read")),
+):
+    """
+    导出使用量明细（CSV 或 NDJSON，流式输出；本组织的管理员或带 usage:read 权限的 API 密钥）
+
+    默认导出当前月份。gzip=true 时返回 .gz 文件。
+    """
+    _check_export_access(caller, organization_id, db)
+    if not period_start:
+        period_start = date.today().replace(day=1)
+    if not period_end:
+        period_end = date.today()
+
+    statement = usage_export_statement(str(organization_id), period_start, period_end, resource_type)
+    filename = export_filename(f"usage-{organization_id}-{period_start}-{period_end}", format, gzip)
+    return StreamingResponse(
+        stream_export("usage", statement, USAGE_EXPORT_COLUMNS, format, gzip=gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.post("/record")
 def record_usage(
     organization_id: UUID,
     resource_type: str,
     quantity: int = Query(1, ge=1),
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user),
+    caller: deps.Caller = Depends(deps.get_caller("usage:write")),
 ):
     """
-    记录使用量（内部 API）
+    记录使用量（内部 API，所属组织的登录用户或带 usage:write 权限的 API 密钥）
+
+    使用量先在内存中累加，由后台任务批量写库（最多延迟 USAGE_FLUSH_INTERVAL 秒）。
+    明细行在刷写时才生成（同一键的增量合并为一行），响应不再包含 record_id；
+    需要立即拿到明细行的调用方使用 UsageService.record_usage。
+    resource_type 只接受计费的资源类型（message / api_call / storage）。
     """
-    usage_service = UsageService(db)
+    if resource_type not in RESOURCE_LIMIT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown resource type: {resource_type[:50]}"
+        )
+    _check_organization(caller, organization_id)
+    if not caller.api_key:
+        _check_member(caller, organization_id, db)
 
-    record = usage_service.record_usage(
+    usage_accumulator.record(
         organization_id=organization_id,
-        user_id=current_user.id,
+        user_id=caller.user.id,
         resource_type=resource_type,
         quantity=quantity,
     )
 
-    return {"message": "Usage recorded", "record_id": str(record.id)}
+    return {"message": "Usage recorded"}
@@ -12,6 +12,8 @@ from app.schemas.admin import UserListResponse, UserUpdateByAdmin
 from app.schemas.user import User
 from app.models.user import User as UserModel
 from app.models.organization_member import OrganizationMember
+from app.services.api_key_service import api_key_cache
+from app.services.token_cache import token_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -119,6 +121,9 @@ def update_user(
 
     db.commit()
     db.refresh(user)
+    # 已登录会话的用户快照失效（如被停用、取消管理员）
+    token_cache.invalidate_user(user.id)
+    api_key_cache.invalidate_user(user.id)
 
     logger.info(f"[用户管理] 成功更新用户 - ID: {user_id}, Email: {user.email}, 操作者: {current_admin.email}")
     return user
@@ -174,6 +179,9 @@ def delete_user(
     # 软删除：设置为不活跃
     user.is_active = False
     db.commit()
+    # 已签发的 token 和该用户创建的 API 密钥随即不可用（本进程立即生效，其他 worker 最多延迟缓存 TTL）
+    token_cache.invalidate_user(user.id)
+    api_key_cache.invalidate_user(user.id)
 
     logger.info(f"[用户管理] 成功软删除用户 - ID: {user_id}, Email: {user.email}, 操作者: {current_admin.email}")
     return None
@@ -24,12 +24,111 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
+    # 密码哈希配置
+    PASSWORD_BCRYPT_ROUNDS: int = 12  # bcrypt cost，每加 1 耗时翻倍；修改后旧哈希在用户下次登录时自动升级
+    PASSWORD_HASH_WORKERS: int = 4  # 每个 worker 的密码哈希线程数（建议不超过 CPU 核数）
+
+    # API 密钥配置（X-API-Key 认证，数据库保存以 API_KEY_HMAC_SECRET 计算的摘要）
+    API_KEY_HMAC_SECRET: str = "your-api-key-hmac-secret-change-this-in-production"  # 与 SECRET_KEY 分开，修改会使已有密钥全部失效
+    API_KEY_CACHE_TTL_SECONDS: int = 300  # 有效密钥的缓存有效期（秒），也是多 worker 下吊销生效的最长延迟
+    API_KEY_NEGATIVE_CACHE_TTL_SECONDS: int = 30  # 未知密钥的负缓存有效期（秒）
+    API_KEY_CACHE_MAX_ENTRIES: int = 10000  # 最大条目数
+    API_KEY_LAST_USED_FLUSH_INTERVAL: float = 60.0  # last_used_at 批量写库间隔（秒）
+
     # Coze API 配置
     COZE_API_TOKEN: Optional[str] = None
     COZE_API_BASE: str = "https://api.coze.cn"
     COZE_WORKSPACE_ID: Optional[str] = None
     COZE_BOT_ID: Optional[str] = None
 
+    # Coze HTTP 连接池配置（每个 worker 共享一个客户端）
+    COZE_HTTP_MAX_CONNECTIONS: int = 100  # 最大连接数
+    COZE_HTTP_MAX_KEEPALIVE: int = 20  # 最大空闲保活连接数
+    COZE_HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保活时间（秒）
+    COZE_HTTP2: bool = True  # 启用 HTTP/2 多路复用
+    COZE_CONNECT_TIMEOUT: float = 5.0  # 建连超时（秒）
+    COZE_READ_TIMEOUT: float = 60.0  # 读超时（秒），流式响应两个分片之间的最大间隔
+    COZE_POOL_TIMEOUT: float = 10.0  # 等待连接池空闲连接的超时（秒）
+
+    # Coze 熔断器配置（滚动窗口内失败率或慢调用率超过阈值时快速失败）
+    COZE_BREAKER_ENABLED: bool = True
+    COZE_BREAKER_WINDOW_SECONDS: int = 30  # 滚动统计窗口（秒）
+    COZE_BREAKER_MIN_CALLS: int = 20  # 窗口内至少有这么多调用才判断熔断
+    COZE_BREAKER_FAILURE_RATE: float = 0.5  # 失败率阈值
+    COZE_BREAKER_SLOW_CALL_SECONDS: float = 10.0  # 慢调用阈值（秒，流式按首包时间计）
+    COZE_BREAKER_SLOW_CALL_RATE: float = 0.5  # 慢调用率阈值
+    COZE_BREAKER_OPEN_SECONDS: float = 30.0  # 熔断持续时间（秒）
+    COZE_BREAKER_HALF_OPEN_CALLS: int = 3  # 半开状态的探测请求数
+
+    # Coze 上游公平调度（全局并发上限；租户并发上限和权重见订阅计划）
+    COZE_SCHEDULER_ENABLED: bool = True
+    COZE_MAX_CONCURRENCY: int = 100  # 每个 worker 的在途上游调用上限
+    COZE_QUEUE_TIMEOUT: float = 10.0  # 最长排队时间（秒）
+    COZE_TENANT_CONCURRENCY_LIMITS: bool = False  # 按订阅计划的 concurrent_chats 限制租户并发（免费版为 2）
+
+    # Coze 对冲请求（仅非流式首轮聊天）：超过 p95 延迟仍未返回时再发一个请求，取先返回者
+    COZE_HEDGE_ENABLED: bool = False
+    COZE_HEDGE_QUANTILE: float = 0.95  # 对冲延迟取历史延迟的分位数
+    COZE_HEDGE_MIN_DELAY: float = 0.5  # 对冲延迟下限（秒）
+    COZE_HEDGE_MIN_SAMPLES: int = 20  # 延迟样本不足时不对冲
+
+    # 流式聊天消息批量持久化配置（write-behind）
+    MESSAGE_PERSIST_QUEUE_SIZE: int = 10000  # 队列容量，满时请求等待（背压）
+    MESSAGE_PERSIST_BATCH_SIZE: int = 500  # 单次刷写的最大消息数
+    MESSAGE_PERSIST_FLUSH_INTERVAL: float = 0.2  # 刷写时间窗口（秒）
+    MESSAGE_PERSIST_ENQUEUE_TIMEOUT: float = 5.0  # 队列满时入队等待超时（秒）
+
+    # 使用量批量写入配置（内存中累加，按间隔或事件数合并写库）
+    USAGE_FLUSH_INTERVAL: float = 5.0  # 刷写间隔（秒）
+    USAGE_FLUSH_MAX_EVENTS: int = 1000  # 累加的事件数达到该值时立即刷写
+    USAGE_JOURNAL_DIR: Optional[str] = None  # 预写日志目录（崩溃保护，未设置时关闭）
+    USAGE_JOURNAL_FSYNC: bool = False  # 每个事件都 fsync（防断电，代价较高）
+
+    # 管理台仪表板统计（请求时按需刷新的快照）
+    DASHBOARD_STATS_REFRESH_SECONDS: float = 60.0  # 快照有效期（秒），超过后下一次请求重新查询
+
+    # 数据导出配置（服务端游标分批读取，流式写出 CSV / NDJSON）
+    EXPORT_BATCH_SIZE: int = 1000  # 每批从游标读取的行数
+    EXPORT_CHUNK_BYTES: int = 65536  # 编码后累积到该大小再写出一块
+
+    # 认证缓存配置（按 token 缓存 JWT 校验结果和当前用户，有效期不超过 token 过期时间）
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_TTL_SECONDS: int = 60  # 缓存有效期（秒），也是多 worker 下用户变更生效的最长延迟
+    AUTH_CACHE_MAX_ENTRIES: int = 10000  # 最大条目数
+
+    # 组织解析缓存配置（按用户缓存所属组织和成员角色，成员或组织变更时失效）
+    ORG_CACHE_ENABLED: bool = True
+    ORG_CACHE_TTL_SECONDS: int = 60  # 缓存有效期（秒），也是多 worker 下成员、计划变更生效的最长延迟
+    ORG_CACHE_MAX_ENTRIES: int = 10000  # 最大条目数
+
+    # 用量配额配置（按组织在内存中维护本月用量，每条聊天消息调用上游前检查）
+    QUOTA_ENFORCEMENT_ENABLED: bool = True
+    QUOTA_RESYNC_SECONDS: float = 60.0  # 从数据库重新装载用量的间隔（其他 worker 的用量在此后可见）
+    QUOTA_MAX_ENTRIES: int = 100000  # 内存中维护用量的最大组织数
+
+    # 机器人回答缓存配置
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL_SECONDS: int = 3600  # 缓存有效期（秒）
+    ANSWER_CACHE_MAX_ENTRIES: int = 10000  # 全局最大条目数
+    ANSWER_CACHE_MAX_ENTRIES_PER_ORG: int = 1000  # 每个租户最大条目数
+
+    # 流式聊天增量合并配置（首个增量总是立即输出）
+    SSE_COALESCE_ENABLED: bool = True
+    SSE_COALESCE_MAX_BYTES: int = 256  # 缓冲内容达到该字节数时输出
+    SSE_COALESCE_MAX_DELAY_MS: int = 30  # 缓冲的最长时间窗口（毫秒）
+
+    # WebSocket 聊天配置
+    WS_AUTH_TIMEOUT: float = 10.0  # 连接后等待 auth 消息的超时（秒）
+    WS_HEARTBEAT_INTERVAL: float = 20.0  # 服务端心跳间隔（秒）
+    WS_HEARTBEAT_TIMEOUT: float = 60.0  # 超过该时间未收到客户端任何消息则断开（秒）
+    WS_USER_RECHECK_INTERVAL: float = 60.0  # 连接期间重新校验用户状态（停用、移出组织）和机器人状态的间隔（秒）
+    WS_MAX_STREAMS: int = 8  # 单个连接的并发回复数
+    WS_INITIAL_CREDITS: int = 64  # 每路回复的初始发送额度（帧）
+
+    # Prometheus 指标端点（/metrics）
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None  # 抓取时需携带的 Bearer Token，为空时只允许本机 / 内网直连抓取
+
     # 微信支付配置
     WECHAT_PAY_APP_ID: Optional[str] = None
     WECHAT_PAY_MCH_ID: Optional[str] = None
@@ -47,6 +146,8 @@ class Settings(BaseSettings):
     WECHAT_APP_ID: Optional[str] = None
     WECHAT_APP_SECRET: Optional[str] = None
     WECHAT_REDIRECT_URI: Optional[str] = None  # 微信登录回调地址
+    WECHAT_LOGIN_LONG_POLL_SECONDS: int = 25  # 扫码状态长轮询的最长等待秒数（应小于反向代理的读超时）
+    WECHAT_LOGIN_WAITER_MAX_STATES: int = 10000  # 内存中保留的登录会话状态数
 
     # 短信服务配置（阿里云或腾讯云）
     SMS_PROVIDER: Optional[str] = "aliyun"  # 短信服务商：aliyun 或 tencent
@@ -67,8 +168,13 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "uploads"
 
     # 速率限制配置
-    RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory（每个 worker 独立计数）或 redis（使用 REDIS_URL 共享计数）
+    RATE_LIMIT_PER_MINUTE: int = 60  # 按 IP 限流的上限；登录用户和 API 密钥的上限见订阅计划
     RATE_LIMIT_PER_HOUR: int = 1000
+    RATE_LIMIT_TENANT_PER_MINUTE: int = 600  # 公开租户接口按租户汇总的上限
+    RATE_LIMIT_MAX_KEYS: int = 100000  # memory 后端最多跟踪的限流键数
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # 部署在反向代理之后时按 X-Forwarded-For 识别客户端 IP
 
     # CORS 配置
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:8000"]
@@ -0,0 +1,235 @@
+"""
+进程内指标注册表
+轻量级计数器/仪表盘/直方图，供各服务上报运行指标（缓存命中率、队列深度、延迟分布等）；
+可导出为 JSON（管理后台）或 Prometheus 文本格式（/metrics）
+"""
+import bisect
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+def _escape(value: str) -> str:
+    """Prometheus 标签值转义"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """格式化标签：{a="1",b="2"}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值"""
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类：按标签值分组存储"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """将标签字典转换为有序的标签值元组"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        """获取全部样本（标签, 值）"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(dict(zip(self.labelnames, key)), value) for key, value in items]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出为 JSON 友好的结构"""
+        return {
+            "type": self.type_name,
+            "help": self.documentation,
+            "samples": [
+                {"labels": labels, "value": value} for labels, value in self.samples()
+            ],
+        }
+
+    def render(self) -> List[str]:
+        """导出为 Prometheus 文本格式的行"""
+        lines = self._header()
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+    def _header(self) -> List[str]:
+        """HELP / TYPE 行"""
+        documentation = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        return [f"# HELP {self.name} {documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """计数器增加"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """获取当前值"""
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表盘"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        """设置当前值"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """增加"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        """减少"""
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        """获取当前值"""
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """分桶直方图（桶计数为非累积值，导出时再累积）"""
+
+    type_name = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合：[各桶计数..., +Inf 桶计数, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """记录一次观测值"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * (len(self.buckets) + 3)
+                self._values[key] = state
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[Tuple[Dict[str, str], Dict[str, Any]]]:
+        """获取全部样本（标签, {buckets, sum, count}）"""
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+
+        result = []
+        for key, state in items:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-2]):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+            result.append((
+                dict(zip(self.labelnames, key)),
+                {"buckets": buckets, "sum": state[-2], "count": state[-1]},
+            ))
+        return result
+
+    def render(self) -> List[str]:
+        """导出为 Prometheus 文本格式的行（_bucket / _sum / _count）"""
+        lines = self._header()
+        for labels, sample in self.samples():
+            for bound, count in sample["buckets"].items():
+                bucket_labels = dict(labels, le=bound)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {count}")
+            suffix = _format_labels(labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(sample['sum'])}")
+            lines.append(f"{self.name}_count{suffix} {sample['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, documentation: str, labelnames: Tuple[str, ...], **kwargs):
+        """注册指标（同名指标只注册一次）"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """获取或创建计数器"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """获取或创建仪表盘"""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """获取或创建直方图"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render_prometheus(self) -> str:
+        """导出全部指标（Prometheus 文本格式 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
@@ -0,0 +1,162 @@
+"""
+限流中间件（纯 ASGI）
+在路由、依赖注入和数据库会话之前按调用方身份限流，被拒绝的请求不会触达数据库：
+    X-API-Key       按密钥 ID，上限取组织的订阅计划（密钥必须已在 API 密钥缓存中，否则按 IP）
+    Bearer token    按用户 ID（本地校验 JWT 签名），上限取所属组织的计划（组织未缓存时取免费版）
+    /tenant/{uuid}  公开接口另按租户汇总限流
+    其他            按客户端 IP
+中间件只读取各缓存（peek），不查询数据库；凭据是否真正有效仍由路由依赖判断。
+WebSocket 只在握手时检查（token 可在查询参数中）；连接内的每条 chat 消息由 ChatSocketSession 按用户限流。
+"""
+import json
+import re
+from typing import List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from app.core.config import settings
+from app.core.security import decode_token, hash_api_key
+from app.services.api_key_service import api_key_cache
+from app.services.org_membership import membership_cache
+from app.services.rate_limiter import (
+    RateLimit,
+    RateLimitResult,
+    RateLimiter,
+    anonymous_rate_limits,
+    plan_rate_limits,
+    rate_limiter,
+    retry_after_header,
+    tenant_rate_limits,
+)
+from app.services.token_cache import token_cache
+
+
+# 不限流的路径（健康检查）
+EXEMPT_PATHS = {"/", "/health"}
+
+_TENANT_PATH = re.compile(r"^/api/v1/tenant/([^/]+)")
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    """读取请求头（ASGI 头名为小写字节串）"""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _query_token(scope) -> Optional[str]:
+    """WebSocket 握手查询参数中的 token（浏览器无法自定义 WebSocket 请求头）"""
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token")
+    return values[0] if values else None
+
+
+def _client_ip(scope) -> str:
+    """客户端 IP（部署在可信反向代理之后时取 X-Forwarded-For 的第一个地址）"""
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _user_identity(token: str) -> Optional[Tuple[str, str, Sequence[RateLimit]]]:
+    """Bearer token 对应的限流键（签名无效或非访问令牌时返回 None）"""
+    cached = token_cache.peek(token)
+    if cached is not None:
+        user_id = cached.user.id
+    else:
+        payload = decode_token(token)
+        if payload is None or payload.get("type") != "access" or not payload.get("sub"):
+            return None
+        user_id = str(payload["sub"])
+
+    membership = membership_cache.peek(user_id)
+    plan_type = membership.values.get("plan_type") if membership is not None else None
+    return "user", user_id, plan_rate_limits(plan_type)
+
+
+def _api_key_identity(api_key: str) -> Optional[Tuple[str, str, Sequence[RateLimit]]]:
+    """API 密钥对应的限流键（密钥未缓存或无效时返回 None，按 IP 限流）"""
+    cached = api_key_cache.peek(hash_api_key(api_key))
+    if cached is None or cached.principal is None:
+        return None
+    return "api_key", cached.principal.key_id, plan_rate_limits(cached.principal.plan)
+
+
+def resolve_identities(scope) -> List[Tuple[str, str, Sequence[RateLimit]]]:
+    """
+    请求需要检查的限流键
+
+    Returns:
+        [(类型, 键, 上限)]，全部通过才放行
+    """
+    identity = None
+    api_key = _header(scope, b"x-api-key")
+    if api_key:
+        identity = _api_key_identity(api_key)
+    else:
+        authorization = _header(scope, b"authorization")
+        if authorization and authorization[:7].lower() == "bearer ":
+            identity = _user_identity(authorization[7:].strip())
+        elif scope["type"] == "websocket":
+            token = _query_token(scope)
+            if token:
+                identity = _user_identity(token)
+
+    identities = [identity or ("ip", _client_ip(scope), anonymous_rate_limits())]
+
+    match = _TENANT_PATH.match(scope.get("path", ""))
+    if match:
+        identities.append(("tenant", match.group(1), tenant_rate_limits()))
+    return identities
+
+
+class RateLimitMiddleware:
+    """限流中间件（HTTP 请求与 WebSocket 握手；生命周期事件直接放行）"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] not in ("http", "websocket")
+            or not self.limiter.enabled
+            or scope.get("method") == "OPTIONS"
+            or scope.get("path") in EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        for kind, key, limits in resolve_identities(scope):
+            result = await self.limiter.check(kind, key, limits)
+            if not result.allowed:
+                if scope["type"] == "websocket":
+                    await self._reject_websocket(receive, send)
+                else:
+                    await self._reject(send, result)
+                return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, result: RateLimitResult) -> None:
+        """返回 429"""
+        body = json.dumps({"detail": "Rate limit exceeded"}).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", retry_after_header(result).encode("latin-1")),
+        ]
+        if result.limit is not None:
+            headers.append((b"x-ratelimit-limit", str(result.limit.limit).encode("latin-1")))
+        await send({"type": "http.response.start", "status": 429, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _reject_websocket(receive, send) -> None:
+        """拒绝 WebSocket 握手（接受前关闭，服务器返回 403）"""
+        message = await receive()
+        if message["type"] == "websocket.connect":
+            await send({"type": "websocket.close", "code": 1008})
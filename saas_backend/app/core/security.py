@@ -1,19 +1,45 @@
 """
 安全相关功能：密码哈希、Token 生成等
 """
+import asyncio
+import hashlib
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Tuple, TypeVar
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
+from app.core.config import settings
+from app.core.metrics import metrics
+
 # 配置
 SECRET_KEY = "your-secret-key-change-this-in-production"  # 生产环境应该从环境变量读取
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 密码加密上下文（cost 不等于配置值的哈希在登录时重新生成，见 verify_and_update_password）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+)
+
+password_hash_seconds = metrics.histogram(
+    "password_hash_seconds",
+    "密码哈希 / 校验耗时（秒，含线程池排队）",
+    ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+password_hash_pending = metrics.gauge("password_hash_pending", "等待或正在进行的密码哈希任务数")
+
+T = TypeVar("T")
+
+# 密码哈希专用线程池：bcrypt 计算期间释放 GIL，放到线程池中不阻塞事件循环；
+# 线程数有上限，登录高峰时多余的请求排队，不会占满 Starlette 的默认线程池
+_hash_executor: Optional[ThreadPoolExecutor] = None
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -26,6 +52,63 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    验证密码，cost 与当前配置不一致时同时生成新哈希
+
+    Returns:
+        (是否通过, 新哈希)；不需要升级时新哈希为 None
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    """获取密码哈希线程池（首次使用时创建）"""
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="password-hash",
+        )
+    return _hash_executor
+
+
+async def _run_in_hash_pool(operation: str, func: Callable[..., T], *args) -> T:
+    """在密码哈希线程池中执行"""
+    started = time.perf_counter()
+    password_hash_pending.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), func, *args)
+    finally:
+        password_hash_pending.dec()
+        password_hash_seconds.observe(time.perf_counter() - started, operation=operation)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（线程池中执行，不阻塞事件循环）"""
+    return await _run_in_hash_pool("verify", verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """验证密码并按需生成新哈希（线程池中执行）"""
+    return await _run_in_hash_pool("verify", verify_and_update_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """生成密码哈希（线程池中执行）"""
+    return await _run_in_hash_pool("hash", get_password_hash, password)
+
+
+def shutdown_hash_executor() -> None:
+    """关闭密码哈希线程池（应用关闭时调用）"""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False)
+        _hash_executor = None
+
+
 def create_access_token(subject: str, claims: Optional[Dict[str, Any]] = None) -> str:
     """创建访问 Token"""
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -71,5 +154,12 @@ def generate_api_key() -> str:
 
 
 def hash_api_key(api_key: str) -> str:
-    """哈希 API 密钥"""
-    return get_password_hash(api_key)
+    """
+    哈希 API 密钥
+
+    密钥本身是 256 位随机数，不需要 bcrypt 这样的慢哈希；HMAC-SHA256 摘要是确定的，
+    可以直接按唯一索引查询，每次认证只需微秒级计算
+    """
+    return hmac.new(
+        settings.API_KEY_HMAC_SECRET.encode("utf-8"), api_key.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
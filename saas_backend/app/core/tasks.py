@@ -0,0 +1,31 @@
+"""
+后台任务
+请求被取消（如客户端断开）后，收尾工作不能在原协程里 await，
+改为启动独立的后台任务；这里持有任务的强引用，防止任务在完成前被垃圾回收
+"""
+import asyncio
+from typing import Awaitable, Set
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def spawn_background(coroutine: Awaitable) -> asyncio.Task:
+    """启动后台任务（异常只记录日志）"""
+    task = asyncio.get_running_loop().create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def _on_done(task: asyncio.Task) -> None:
+    """任务结束：释放引用并记录未处理的异常"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ 后台任务失败: {task.exception()!r}")
+
+
+async def drain_background(timeout: float = 5.0) -> None:
+    """等待进行中的后台任务完成（应用关闭时调用）"""
+    if _background_tasks:
+        await asyncio.wait(set(_background_tasks), timeout=timeout)
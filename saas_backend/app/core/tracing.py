@@ -0,0 +1,132 @@
+"""
+请求耗时分解
+一次聊天请求按阶段记录耗时（认证、组织查询、机器人查询、数据库提交、上游排队、Coze 首包/首字、SSE 发送等），
+请求结束时按 订阅计划 / 结果 标签写入直方图，由 /metrics 导出。
+标签只用取值有限的维度（不按机器人、组织 ID 区分），时间序列数不随租户数增长。
+
+当前请求的 RequestTrace 放在 contextvar 中，服务层（CozeService、FairScheduler）无需传参即可打点；
+没有进行中的 trace 时打点为空操作。每次打点只有一次 perf_counter 和一次字典累加，
+直方图在请求结束时统一写入，可以在生产环境常开。
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from app.core.metrics import metrics
+
+
+# 各阶段耗时大多在毫秒级，桶比默认值更细
+STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+# 请求结果
+SUCCESS = "success"
+FALLBACK = "fallback"
+ERROR = "error"
+DISCONNECTED = "disconnected"
+
+stage_seconds = metrics.histogram(
+    "chat_stage_seconds",
+    "聊天请求各阶段耗时（秒）",
+    ("endpoint", "stage", "plan", "outcome"),
+    buckets=STAGE_BUCKETS,
+)
+request_seconds = metrics.histogram(
+    "chat_request_seconds",
+    "聊天请求总耗时（秒，流式请求到流结束为止）",
+    ("endpoint", "plan", "outcome"),
+    buckets=STAGE_BUCKETS,
+)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """一次请求的阶段耗时"""
+
+    __slots__ = ("endpoint", "started_at", "plan", "_stages", "_finished")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started_at = time.perf_counter()
+        self.plan = ""
+        # 同一阶段多次打点（如逐帧发送）累加为一个值
+        self._stages: Dict[str, float] = {}
+        self._finished = False
+
+    def record(self, stage: str, seconds: float) -> None:
+        """记录一个阶段的耗时"""
+        self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def mark(self, stage: str) -> None:
+        """记录从请求开始到现在的耗时（如认证完成、首字到达）"""
+        self.record(stage, time.perf_counter() - self.started_at)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """统计代码块耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def set_labels(self, plan: Any = None) -> None:
+        """设置订阅计划标签（解析出组织后调用）"""
+        if plan is not None:
+            self.plan = str(getattr(plan, "value", plan))
+
+    def finish(self, outcome: str) -> None:
+        """请求结束：写入直方图（只生效一次）"""
+        if self._finished:
+            return
+        self._finished = True
+
+        labels = {"endpoint": self.endpoint, "plan": self.plan, "outcome": outcome}
+        for stage, seconds in self._stages.items():
+            stage_seconds.observe(seconds, stage=stage, **labels)
+        request_seconds.observe(time.perf_counter() - self.started_at, **labels)
+
+
+def start_trace(endpoint: str) -> RequestTrace:
+    """开始一个请求的 trace，并设为当前上下文的 trace"""
+    trace = RequestTrace(endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """获取当前上下文的 trace（没有时为 None）"""
+    return _current_trace.get()
+
+
+def record_span(stage: str, seconds: float) -> None:
+    """向当前 trace 记录阶段耗时（没有 trace 时忽略）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """统计代码块耗时并记入当前 trace（没有 trace 时只计时不记录）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def traced(endpoint: str) -> Callable[[], Awaitable[RequestTrace]]:
+    """
+    FastAPI 依赖：请求开始时创建 trace
+
+    要声明在认证等依赖之前，端点内 trace.mark("auth") 即为依赖解析（认证）耗时。
+    异步依赖与端点在同一任务中执行，contextvar 对端点及其创建的任务可见。
+    """
+    async def dependency() -> RequestTrace:
+        return start_trace(endpoint)
+
+    return dependency
@@ -14,7 +14,7 @@ def get_model_classes() -> dict[str, Type]:
     from app.models.organization import Organization
     from app.models.organization_member import OrganizationMember
     from app.models.subscription import Subscription
-    from app.models.usage import UsageRecord
+    from app.models.usage import UsageRecord, UsageDailyRollup
     from app.models.order import Order
     from app.models.bot import Bot
     from app.models.conversation import Conversation
@@ -26,6 +26,7 @@ def get_model_classes() -> dict[str, Type]:
         "organization_members": OrganizationMember,
         "subscriptions": Subscription,
         "usage_records": UsageRecord,
+        "usage_daily_rollup": UsageDailyRollup,
         "orders": Order,
         "bots": Bot,
         "conversations": Conversation,
@@ -3,7 +3,8 @@
 """
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Generator
 
 import os
 from dotenv import load_dotenv
@@ -28,6 +29,42 @@ engine = create_engine(
 # 创建 SessionLocal 类
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 同步驱动 -> 异步驱动映射
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """将同步数据库 URL 转换为对应异步驱动的 URL"""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+# 异步数据库 URL（默认由 DATABASE_URL 推导）
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# 创建异步数据库引擎（用于聊天等高频异步路径，避免阻塞事件循环）
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20,
+)
+
+# 创建 AsyncSessionLocal 类
+# expire_on_commit=False：提交后仍可读取对象属性，避免在流式响应中触发隐式 IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -41,6 +78,15 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取异步数据库会话
+    用于 FastAPI 依赖注入（async 端点）
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """初始化数据库（创建所有表）"""
     from app.db.base import Base
@@ -0,0 +1,51 @@
+"""
+多行累加 upsert
+按唯一键插入多行，键已存在时把增量累加到现有值上（一条语句、一次往返）。
+MySQL 使用 ON DUPLICATE KEY UPDATE，PostgreSQL / SQLite 使用 ON CONFLICT DO UPDATE。
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import Table
+
+
+def increment_upsert(
+    table: Table,
+    rows: List[Dict[str, Any]],
+    key_columns: Sequence[str],
+    increment_columns: Sequence[str],
+    dialect_name: str,
+):
+    """
+    构造累加 upsert 语句
+
+    Args:
+        table: 目标表（需要在 key_columns 上有主键或唯一索引）
+        rows: 待写入的行
+        key_columns: 唯一键列
+        increment_columns: 键冲突时累加的列；表有 updated_at 列时同时刷新
+        dialect_name: 数据库方言名（mysql / postgresql / sqlite）
+    """
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(table).values(rows)
+        incoming = stmt.inserted
+    elif dialect_name in ("postgresql", "sqlite"):
+        if dialect_name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(table).values(rows)
+        incoming = stmt.excluded
+    else:
+        raise NotImplementedError(f"Upsert is not supported for dialect: {dialect_name}")
+
+    values = {column: table.c[column] + incoming[column] for column in increment_columns}
+    if "updated_at" in table.c:
+        values["updated_at"] = datetime.utcnow()
+
+    if dialect_name == "mysql":
+        return stmt.on_duplicate_key_update(values)
+    return stmt.on_conflict_do_update(index_elements=list(key_columns), set_=values)
@@ -1,14 +1,25 @@
 """
 智能客服 SaaS 平台 - 主应用
 """
+import hmac
+import ipaddress
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.security import shutdown_hash_executor
+from app.core.tasks import drain_background
 from app.api import router as api_router
-from app.db.session import engine
+from app.db.session import engine, async_engine
+from app.services.api_key_service import last_used_tracker
+from app.services.coze_service import coze_service
+from app.services.message_persister import message_persister
+from app.services.rate_limiter import rate_limiter
+from app.services.usage_accumulator import usage_accumulator
 
 
 @asynccontextmanager
@@ -19,12 +30,28 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     print(f"🚀 {settings.APP_NAME} v{settings.APP_VERSION} starting...")
     print(f"📧 Debug mode: {settings.DEBUG}")
+    await coze_service.startup()
+    await message_persister.start()
+    await last_used_tracker.start()
+    await usage_accumulator.start()
 
     yield
 
     # 关闭时执行
     print("👋 Shutting down...")
+    # 等待断开连接的收尾任务（取消 Coze 生成、保存不完整回复）
+    await drain_background()
+    await coze_service.shutdown()
+    # 刷写尚未持久化的消息
+    await message_persister.stop()
+    # 写入 API 密钥的 last_used_at
+    await last_used_tracker.stop()
+    # 写入累加的使用量
+    await usage_accumulator.stop()
+    await rate_limiter.close()
+    shutdown_hash_executor()
     engine.dispose()
+    await async_engine.dispose()
 
 
 # 创建 FastAPI 应用
@@ -37,6 +64,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# 限流（在路由和数据库之前拒绝超限请求；先于 CORS 注册，429 响应同样带 CORS 头）
+app.add_middleware(RateLimitMiddleware)
+
 # 配置 CORS
 app.add_middleware(
     CORSMiddleware,
@@ -58,6 +88,42 @@ async def health_check():
     }
 
 
+# Prometheus 指标
+def _is_private_scrape(request: Request) -> bool:
+    """是否为本机 / 内网直连的抓取（经反向代理转发的请求不算，代理地址通常也是内网地址）"""
+    if request.headers.get("X-Forwarded-For") or request.headers.get("Forwarded"):
+        return False
+    try:
+        address = ipaddress.ip_address(request.client.host if request.client else "")
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """
+    Prometheus 抓取端点（文本格式）
+
+    配置了 METRICS_TOKEN 时需携带 Bearer Token；未配置时只允许本机 / 内网直连抓取。
+    """
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        provided = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(provided.encode(), expected.encode()):
+            return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+    elif not _is_private_scrape(request):
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 # 根路径
 @app.get("/")
 async def root():
@@ -5,7 +5,7 @@ from app.models.user import User
 from app.models.organization import Organization
 from app.models.organization_member import OrganizationMember
 from app.models.subscription import Subscription
-from app.models.usage import UsageRecord
+from app.models.usage import UsageRecord, UsageDailyRollup
 from app.models.order import Order
 from app.models.bot import Bot
 from app.models.conversation import Conversation
@@ -20,6 +20,7 @@ __all__ = [
     "OrganizationMember",
     "Subscription",
     "UsageRecord",
+    "UsageDailyRollup",
     "Order",
     "Bot",
     "Conversation",
@@ -4,7 +4,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, String, ForeignKey, Text
+from sqlalchemy import Boolean, Column, DateTime, String, ForeignKey, Text
 
 from app.db.base_class import Base
 
@@ -20,6 +20,7 @@ class Message(Base):
     role = Column(String(20), nullable=False)  # 'user', 'assistant', 'system'
     content = Column(Text, nullable=False)
     coze_message_id = Column(String(100), nullable=True)  # Coze 消息 ID
+    is_truncated = Column(Boolean, default=False, nullable=False)  # 客户端中途断开或上游出错，回复不完整
 
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
@@ -5,7 +5,7 @@ import uuid
 from datetime import datetime, date
 from typing import Optional
 
-from sqlalchemy import Column, DateTime, Date, String, ForeignKey, Integer, JSON
+from sqlalchemy import BigInteger, Column, DateTime, Date, String, ForeignKey, Index, Integer, JSON
 from sqlalchemy.orm import relationship
 
 from app.db.base_class import Base
@@ -31,5 +31,31 @@ class UsageRecord(Base):
     organization = relationship("Organization", back_populates="usage_records")
     user = relationship("User", back_populates="usage_records")
 
+    __table_args__ = (
+        # 按组织 + 日期范围查询（当天明细、回填）
+        Index("ix_usage_records_org_date", "organization_id", "date"),
+    )
+
     def __repr__(self):
         return f"<UsageRecord {self.organization_id}:{self.resource_type}:{self.quantity}>"
+
+
+class UsageDailyRollup(Base):
+    """
+    使用量日汇总表
+
+    每个组织、每天、每种资源一行，记录使用量时增量累加；统计接口对汇总表 GROUP BY，
+    不再读取明细行。历史数据由 scripts/backfill_usage_rollup.py 回填。
+    """
+    __tablename__ = "usage_daily_rollup"
+
+    organization_id = Column(String(36), ForeignKey("organizations.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    resource_type = Column(String(50), primary_key=True)
+
+    total = Column(BigInteger, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UsageDailyRollup {self.organization_id}:{self.date}:{self.resource_type}:{self.total}>"
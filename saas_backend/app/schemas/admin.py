@@ -17,6 +17,9 @@ class DashboardStats(BaseModel):
     total_organizations: int = 0
     revenue_month: float = 0
     revenue_total: float = 0
+    # 快照生成时间（UTC）和距今秒数（统计由后台任务定期刷新）
+    generated_at: Optional[datetime] = None
+    age_seconds: float = 0
 
 
 class UserListResponse(BaseModel):
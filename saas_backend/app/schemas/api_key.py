@@ -0,0 +1,32 @@
+"""
+API 密钥相关的 Pydantic Schemas
+"""
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict
+
+
+class APIKeyCreate(BaseModel):
+    """创建 API 密钥 Schema"""
+    name: Optional[str] = Field(None, max_length=255)
+    # 权限范围：chat、usage:read、usage:write，支持 usage:* 和 * 通配
+    scopes: List[str] = Field(default_factory=lambda: ["chat"], min_length=1)
+    expires_at: Optional[datetime] = None
+
+
+class APIKey(BaseModel):
+    """返回给客户端的 API 密钥 Schema（不含密钥明文）"""
+    id: str
+    name: Optional[str] = None
+    scopes: Optional[List[str]] = None
+    is_active: bool
+    last_used_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class APIKeyCreated(APIKey):
+    """创建 API 密钥的响应（密钥明文只返回这一次）"""
+    key: str
@@ -74,6 +74,7 @@ class MessageInDB(MessageBase):
     id: str
     conversation_id: str
     user_id: str
+    is_truncated: bool = False
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -76,6 +76,10 @@ SUBSCRIPTION_PLANS = {
             "bots": 1,
             "members": 1,
             "storage_mb": 100,
+            "concurrent_chats": 2,  # 同时进行的 AI 对话数
+            "scheduling_weight": 1,  # 排队时的调度权重
+            "requests_per_minute": 60,  # API 请求速率上限（每个用户 / API 密钥）
+            "requests_per_hour": 1000,
         }
     ),
     "pro": SubscriptionPlan(
@@ -96,6 +100,10 @@ SUBSCRIPTION_PLANS = {
             "bots": 10,
             "members": 20,
             "storage_mb": 10000,
+            "concurrent_chats": 10,
+            "scheduling_weight": 4,
+            "requests_per_minute": 300,
+            "requests_per_hour": 10000,
         }
     ),
     "enterprise": SubscriptionPlan(
@@ -117,6 +125,10 @@ SUBSCRIPTION_PLANS = {
             "bots": -1,
             "members": -1,
             "storage_mb": -1,
+            "concurrent_chats": 50,
+            "scheduling_weight": 10,
+            "requests_per_minute": 1200,
+            "requests_per_hour": 50000,
         }
     ),
 }
@@ -0,0 +1,271 @@
+"""
+机器人回答缓存
+客服场景问题高度重复，对同一机器人、同一问题（规范化后）、同一机器人配置版本的首轮提问
+直接返回缓存回答，不再调用 Coze
+
+缓存在每个 worker 的进程内存中，清除只对本进程生效。跨 worker 的失效依赖写在数据库中的版本：
+缓存键包含机器人的 updated_at，机器人配置变更、租户知识库变更（刷新该租户全部机器人的 updated_at）
+后，其他 worker 的旧条目不再命中，等 TTL 或 LRU 淘汰。
+"""
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.bot import Bot
+
+
+# 问句末尾可忽略的标点
+_TRAILING_PUNCTUATION = "?？!！。.,，~～…;；:："
+_WHITESPACE_RE = re.compile(r"\s+")
+
+cache_requests = metrics.counter(
+    "answer_cache_requests_total", "回答缓存查询次数", ("result",)
+)
+cache_bytes_saved = metrics.counter(
+    "answer_cache_bytes_saved_total", "命中缓存后未从 Coze 传输的回答字节数"
+)
+cache_evictions = metrics.counter(
+    "answer_cache_evictions_total", "回答缓存淘汰次数", ("reason",)
+)
+cache_entries = metrics.gauge("answer_cache_entries", "回答缓存条目数")
+
+
+def normalize_question(text: str) -> str:
+    """
+    规范化问题文本：全角转半角、转小写、合并空白、去掉末尾标点
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION).strip()
+
+
+def bot_config_version(bot: Bot) -> str:
+    """机器人配置版本：配置更新时 updated_at 变化，旧缓存自然失效"""
+    return bot.updated_at.isoformat() if bot.updated_at else "0"
+
+
+@dataclass
+class CachedAnswer:
+    """缓存的回答"""
+    organization_id: str
+    bot_id: str
+    question: str
+    content: str
+    coze_message_id: Optional[str]
+    expires_at: float
+    size: int
+
+
+class AnswerCache:
+    """回答缓存（TTL + LRU，按租户限制条目数）"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        max_entries: int = 10000,
+        max_entries_per_org: int = 1000,
+        enabled: bool = True,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entries_per_org = max_entries_per_org
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[Tuple[str, str, str], CachedAnswer]" = OrderedDict()
+        self._org_entries: Dict[str, "OrderedDict[Tuple[str, str, str], None]"] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(bot: Bot, message: str) -> Tuple[str, str, str]:
+        """缓存键：(机器人, 配置版本, 规范化问题)"""
+        return (bot.id, bot_config_version(bot), normalize_question(message))
+
+    def get(self, bot: Bot, message: str) -> Optional[CachedAnswer]:
+        """
+        查询缓存
+
+        Returns:
+            命中返回缓存回答，未命中或已过期返回 None
+        """
+        if not self.enabled:
+            return None
+
+        key = self.make_key(bot, message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                cache_evictions.inc(reason="expired")
+                entry = None
+
+            if entry is None:
+                cache_requests.inc(result="miss")
+                return None
+
+            # LRU：移到队尾
+            self._entries.move_to_end(key)
+            self._org_entries[entry.organization_id].move_to_end(key)
+
+        cache_requests.inc(result="exact_hit" if entry.question == message else "normalized_hit")
+        cache_bytes_saved.inc(entry.size)
+        return entry
+
+    def set(
+        self,
+        bot: Bot,
+        message: str,
+        content: str,
+        coze_message_id: Optional[str] = None,
+    ) -> None:
+        """写入缓存"""
+        if not self.enabled or not content:
+            return
+
+        key = self.make_key(bot, message)
+        entry = CachedAnswer(
+            organization_id=bot.organization_id,
+            bot_id=bot.id,
+            question=message,
+            content=content,
+            coze_message_id=coze_message_id,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            size=len(content.encode("utf-8")),
+        )
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            org_keys = self._org_entries.setdefault(entry.organization_id, OrderedDict())
+
+            # 租户条目上限：淘汰该租户最久未使用的条目
+            while org_keys and len(org_keys) >= self.max_entries_per_org:
+                self._remove(next(iter(org_keys)))
+                cache_evictions.inc(reason="org_capacity")
+
+            # 全局条目上限：淘汰全局最久未使用的条目
+            while self._entries and len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                cache_evictions.inc(reason="capacity")
+
+            self._entries[key] = entry
+            self._org_entries.setdefault(entry.organization_id, OrderedDict())[key] = None
+            cache_entries.set(len(self._entries))
+
+    def invalidate_bot(self, bot_id: str) -> int:
+        """机器人配置变更/删除时清除本进程中该机器人的缓存（其他 worker 由配置版本失效）"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == bot_id]
+            for key in keys:
+                self._remove(key)
+            cache_entries.set(len(self._entries))
+        if keys:
+            cache_evictions.inc(len(keys), reason="invalidated")
+        return len(keys)
+
+    def invalidate_org_knowledge(self, db: Session, organization_id: str) -> int:
+        """
+        租户知识库变更：刷新该租户全部机器人的配置版本（updated_at），所有 worker 的旧缓存键失效；
+        同时清除本进程中该租户的缓存
+        """
+        db.execute(
+            update(Bot)
+            .where(Bot.organization_id == organization_id)
+            .values(updated_at=datetime.utcnow())
+        )
+        db.commit()
+        return self.invalidate_org(organization_id)
+
+    def invalidate_org(self, organization_id: str) -> int:
+        """清除本进程中该租户的全部缓存"""
+        with self._lock:
+            keys = list(self._org_entries.get(organization_id, ()))
+            for key in keys:
+                self._remove(key)
+            cache_entries.set(len(self._entries))
+        if keys:
+            cache_evictions.inc(len(keys), reason="invalidated")
+        return len(keys)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._org_entries.clear()
+            cache_entries.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        hits = (
+            cache_requests.value(result="exact_hit")
+            + cache_requests.value(result="normalized_hit")
+        )
+        total = hits + cache_requests.value(result="miss")
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "organizations": len(self._org_entries),
+            "hits": hits,
+            "misses": cache_requests.value(result="miss"),
+            "hit_rate": hits / total if total else 0.0,
+            "bytes_saved": cache_bytes_saved.value(),
+        }
+
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        """删除条目（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        org_keys = self._org_entries.get(entry.organization_id)
+        if org_keys is not None:
+            org_keys.pop(key, None)
+            if not org_keys:
+                del self._org_entries[entry.organization_id]
+
+    @staticmethod
+    async def replay_stream(
+        entry: CachedAnswer,
+        chunk_size: int = 8,
+        delay: float = 0.0,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        以 Coze 流式事件的格式回放缓存回答（模拟 SSE 流）
+
+        Args:
+            entry: 缓存的回答
+            chunk_size: 每个增量事件的字符数
+            delay: 事件之间的间隔（秒），0 表示不等待
+        """
+        content = entry.content
+        for start in range(0, len(content), chunk_size):
+            yield {
+                "event": "conversation.message.delta",
+                "data": {
+                    "id": entry.coze_message_id,
+                    "type": "answer",
+                    "content": content[start:start + chunk_size],
+                },
+            }
+            if delay:
+                await asyncio.sleep(delay)
+        yield {"type": "done"}
+
+
+# 全局回答缓存实例
+answer_cache = AnswerCache(
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    max_entries_per_org=settings.ANSWER_CACHE_MAX_ENTRIES_PER_ORG,
+    enabled=settings.ANSWER_CACHE_ENABLED,
+)
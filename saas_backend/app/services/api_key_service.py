@@ -0,0 +1,435 @@
+"""
+API 密钥认证
+服务端到服务端调用（聊天、使用量接口）通过 X-API-Key 请求头认证。数据库只保存密钥的 HMAC-SHA256 摘要，
+认证时计算摘要后按唯一索引查询；结果按摘要缓存，未知密钥也做短时负缓存，热路径上一次字典查找即可完成认证。
+权限范围在加载时展开为具体权限的集合，检查只是一次集合查找；last_used_at 只在内存中记录，
+由后台任务定期批量写库，不在每个请求上写数据库。
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.security import generate_api_key, hash_api_key
+from app.db.session import AsyncSessionLocal
+from app.models.apikey import APIKey
+from app.models.organization import Organization
+from app.models.user import User
+from app.services.token_cache import UserSnapshot
+
+
+# 可授予的权限
+API_KEY_SCOPES = ("chat", "usage:read", "usage:write")
+
+cache_requests = metrics.counter(
+    "api_key_cache_requests_total", "API 密钥缓存查询次数", ("result",)
+)
+cache_entries = metrics.gauge("api_key_cache_entries", "API 密钥缓存条目数")
+auth_results = metrics.counter(
+    "api_key_auth_total", "API 密钥认证次数", ("result",)
+)
+last_used_flushes = metrics.counter(
+    "api_key_last_used_flushes_total", "last_used_at 批量写入次数"
+)
+
+
+def compile_scopes(scopes: Optional[Iterable[str]]) -> FrozenSet[str]:
+    """
+    把密钥保存的权限范围展开为具体权限集合
+
+    支持 "*"（全部权限）和 "usage:*"（某一类权限）形式的通配；未知的权限忽略。
+    """
+    granted = set()
+    for pattern in scopes or ():
+        if pattern == "*":
+            granted.update(API_KEY_SCOPES)
+        elif pattern.endswith(":*"):
+            prefix = pattern[:-1]
+            granted.update(scope for scope in API_KEY_SCOPES if scope.startswith(prefix))
+        elif pattern in API_KEY_SCOPES:
+            granted.add(pattern)
+    return frozenset(granted)
+
+
+def validate_scopes(scopes: Iterable[str]) -> List[str]:
+    """
+    检查权限范围（创建密钥时调用）
+
+    Raises:
+        ValueError: 存在无法匹配任何权限的范围
+    """
+    result = []
+    for pattern in scopes:
+        if not compile_scopes([pattern]):
+            raise ValueError(f"Unknown scope: {pattern}")
+        if pattern not in result:
+            result.append(pattern)
+    if not result:
+        raise ValueError("At least one scope is required")
+    return result
+
+
+@dataclass(frozen=True)
+class APIKeyPrincipal:
+    """API 密钥认证结果（只读，可跨请求共享）"""
+    key_id: str
+    organization_id: str
+    name: Optional[str]
+    user: UserSnapshot
+    scopes: FrozenSet[str]
+    # 所属组织的订阅计划（限流按计划取上限）
+    plan: Optional[str]
+    # 过期时间（时间戳），None 表示不过期
+    expires_at: Optional[float]
+
+    def allows(self, scope: str) -> bool:
+        """是否拥有权限"""
+        return scope in self.scopes
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        """是否已过期"""
+        return self.expires_at is not None and self.expires_at <= (now or time.time())
+
+
+@dataclass
+class CachedAPIKey:
+    """缓存条目；principal 为 None 表示未知或不可用的密钥（负缓存）"""
+    principal: Optional[APIKeyPrincipal]
+    expires_at: float
+
+
+def accept_principal(principal: Optional[APIKeyPrincipal]) -> Optional[APIKeyPrincipal]:
+    """检查认证结果（未知或已过期的密钥返回 None），记录最近使用时间"""
+    if principal is None or principal.expired():
+        auth_results.inc(result="rejected")
+        return None
+
+    last_used_tracker.touch(principal.key_id)
+    auth_results.inc(result="accepted")
+    return principal
+
+
+class APIKeyCache:
+    """API 密钥缓存（按摘要，TTL + LRU，含负缓存）"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = 300,
+        negative_ttl_seconds: float = 30,
+        max_entries: int = 10000,
+        enabled: bool = True,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, CachedAPIKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash: str) -> Optional[CachedAPIKey]:
+        """
+        查询摘要
+
+        Returns:
+            未过期的缓存条目（可能是负缓存）；未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key_hash]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key_hash)
+
+        if entry is None:
+            cache_requests.inc(result="miss")
+        else:
+            cache_requests.inc(result="hit" if entry.principal is not None else "negative_hit")
+        return entry
+
+    def peek(self, key_hash: str) -> Optional[CachedAPIKey]:
+        """查询摘要但不计入命中统计、不调整 LRU 顺序（限流中间件使用）"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key_hash)
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return entry
+
+    def set(self, key_hash: str, principal: Optional[APIKeyPrincipal]) -> None:
+        """缓存查询结果（有效密钥的缓存有效期不超过密钥过期时间）"""
+        if not self.enabled:
+            return
+
+        if principal is None:
+            expires_at = time.time() + self.negative_ttl_seconds
+        else:
+            expires_at = time.time() + self.ttl_seconds
+            if principal.expires_at is not None:
+                expires_at = min(expires_at, principal.expires_at)
+
+        with self._lock:
+            self._entries.pop(key_hash, None)
+            self._entries[key_hash] = CachedAPIKey(principal=principal, expires_at=expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            cache_entries.set(len(self._entries))
+
+    def invalidate(self, key_hash: str) -> None:
+        """使一个密钥的缓存失效（吊销后调用）"""
+        with self._lock:
+            self._entries.pop(key_hash, None)
+            cache_entries.set(len(self._entries))
+
+    def invalidate_where(self, predicate: Callable[[APIKeyPrincipal], bool]) -> int:
+        """
+        使满足条件的密钥缓存失效（用户停用、组织变更等低频操作，遍历一次缓存）
+
+        Returns:
+            失效的条目数
+        """
+        with self._lock:
+            keys = [
+                key_hash for key_hash, entry in self._entries.items()
+                if entry.principal is not None and predicate(entry.principal)
+            ]
+            for key_hash in keys:
+                del self._entries[key_hash]
+            cache_entries.set(len(self._entries))
+        return len(keys)
+
+    def invalidate_user(self, user_id: str) -> int:
+        """使用户创建的所有密钥缓存失效"""
+        return self.invalidate_where(lambda principal: principal.user.id == str(user_id))
+
+    def invalidate_organization(self, organization_id: str) -> int:
+        """使组织的所有密钥缓存失效"""
+        return self.invalidate_where(lambda principal: principal.organization_id == str(organization_id))
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            cache_entries.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存状态"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds,
+            "max_entries": self.max_entries,
+        }
+
+
+class LastUsedTracker:
+    """last_used_at 批量写入：请求路径只更新内存中的时间，后台任务按间隔合并写库"""
+
+    def __init__(self, flush_interval: float = 60.0):
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.flushes = 0
+        self.keys_written = 0
+
+    @property
+    def running(self) -> bool:
+        """后台写入任务是否在运行"""
+        return self._task is not None and not self._task.done()
+
+    def touch(self, key_id: str) -> None:
+        """记录一次使用（同一密钥在一个间隔内只写一次）"""
+        self._pending[key_id] = datetime.utcnow()
+
+    async def start(self) -> None:
+        """启动后台写入任务（在应用 lifespan 启动阶段调用）"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止并写入剩余记录（在应用 lifespan 关闭阶段调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """
+        写入目前记录的使用时间
+
+        Returns:
+            写入的密钥数
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        rows = [{"id": key_id, "last_used_at": used_at} for key_id, used_at in pending.items()]
+        try:
+            async with AsyncSessionLocal() as db:
+                # 按主键的批量 UPDATE（executemany）
+                await db.execute(update(APIKey), rows)
+                await db.commit()
+        except Exception as e:
+            print(f"❌ API key last_used_at flush failed: {e}")
+            # 放回去下次再写（期间的新记录更晚，优先保留）
+            for key_id, used_at in pending.items():
+                self._pending.setdefault(key_id, used_at)
+            return 0
+
+        self.flushes += 1
+        self.keys_written += len(rows)
+        last_used_flushes.inc()
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取写入统计"""
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "flush_interval": self.flush_interval,
+            "flushes": self.flushes,
+            "keys_written": self.keys_written,
+        }
+
+    async def _run(self) -> None:
+        """后台写入循环"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+class APIKeyService:
+    """API 密钥服务类"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_key(
+        self,
+        organization_id: str,
+        user_id: str,
+        name: Optional[str],
+        scopes: List[str],
+        expires_at: Optional[datetime] = None,
+    ) -> Tuple[APIKey, str]:
+        """
+        创建密钥
+
+        Returns:
+            (密钥记录, 明文密钥)；明文只在创建时返回一次
+        """
+        raw_key = generate_api_key()
+        api_key = APIKey(
+            organization_id=organization_id,
+            user_id=user_id,
+            key_hash=hash_api_key(raw_key),
+            name=name,
+            scopes=validate_scopes(scopes),
+            is_active=True,
+            expires_at=expires_at,
+        )
+        self.db.add(api_key)
+        self.db.commit()
+        self.db.refresh(api_key)
+        return api_key, raw_key
+
+    def list_keys(self, organization_id: str) -> List[APIKey]:
+        """组织的全部密钥"""
+        return self.db.query(APIKey).filter(
+            APIKey.organization_id == organization_id
+        ).order_by(APIKey.created_at.desc()).all()
+
+    def revoke_key(self, organization_id: str, key_id: str) -> Optional[APIKey]:
+        """吊销密钥（本进程立即生效，其他 worker 最多延迟缓存 TTL）"""
+        api_key = self.db.query(APIKey).filter(
+            APIKey.id == key_id,
+            APIKey.organization_id == organization_id,
+        ).first()
+        if not api_key:
+            return None
+
+        api_key.is_active = False
+        self.db.commit()
+        api_key_cache.invalidate(api_key.key_hash)
+        return api_key
+
+    def authenticate(self, raw_key: str) -> Optional[APIKeyPrincipal]:
+        """
+        认证明文密钥
+
+        Returns:
+            认证结果；密钥未知、已吊销、已过期，或所属用户 / 组织已停用时返回 None
+        """
+        key_hash = hash_api_key(raw_key)
+        cached = api_key_cache.get(key_hash)
+        if cached is not None:
+            return accept_principal(cached.principal)
+        return self.authenticate_hash(key_hash)
+
+    def authenticate_hash(self, key_hash: str) -> Optional[APIKeyPrincipal]:
+        """按摘要查库认证并写入缓存（缓存未命中时调用；异步调用方放到线程池执行）"""
+        principal = self._load(key_hash)
+        api_key_cache.set(key_hash, principal)
+        return accept_principal(principal)
+
+    def _load(self, key_hash: str) -> Optional[APIKeyPrincipal]:
+        """按摘要查询密钥、所属用户和组织状态（一次 JOIN）"""
+        row = self.db.query(APIKey, User, Organization.is_active, Organization.plan_type).join(
+            User, User.id == APIKey.user_id
+        ).join(
+            Organization, Organization.id == APIKey.organization_id
+        ).filter(
+            APIKey.key_hash == key_hash,
+            APIKey.is_active == True,
+        ).first()
+
+        if row is None:
+            return None
+
+        api_key, user, org_active, plan_type = row
+        if not user.is_active or not org_active:
+            return None
+
+        return APIKeyPrincipal(
+            key_id=api_key.id,
+            organization_id=api_key.organization_id,
+            name=api_key.name,
+            user=UserSnapshot.from_model(user),
+            scopes=compile_scopes(api_key.scopes),
+            plan=getattr(plan_type, "value", plan_type),
+            expires_at=(
+                api_key.expires_at.replace(tzinfo=timezone.utc).timestamp() if api_key.expires_at else None
+            ),
+        )
+
+
+# 全局 API 密钥缓存和 last_used_at 写入实例
+api_key_cache = APIKeyCache(
+    ttl_seconds=settings.API_KEY_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.API_KEY_NEGATIVE_CACHE_TTL_SECONDS,
+    max_entries=settings.API_KEY_CACHE_MAX_ENTRIES,
+)
+last_used_tracker = LastUsedTracker(flush_interval=settings.API_KEY_LAST_USED_FLUSH_INTERVAL)
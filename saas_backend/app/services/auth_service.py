@@ -4,6 +4,7 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from uuid import UUID
 
 from app.models.user import User
@@ -13,7 +14,10 @@ from app.schemas.user import UserCreate, UserRegister, Token
 from app.schemas.organization import OrganizationCreate
 from app.core.security import (
     verify_password,
+    verify_and_update_password,
+    verify_and_update_password_async,
     get_password_hash,
+    get_password_hash_async,
     create_access_token,
     create_refresh_token,
 )
@@ -29,16 +33,30 @@ class AuthService:
         """
         用户注册
         """
-        # 检查邮箱是否已存在
-        existing_user = self.db.query(User).filter(User.email == user_in.email).first()
+        self._check_email_available(user_in.email)
+        return self._create_user(user_in, get_password_hash(user_in.password))
+
+    async def register_user_async(self, user_in: UserRegister) -> User:
+        """
+        用户注册（供异步端点使用：密码哈希在专用线程池中计算，数据库操作在默认线程池中执行）
+        """
+        await run_in_threadpool(self._check_email_available, user_in.email)
+        password_hash = await get_password_hash_async(user_in.password)
+        return await run_in_threadpool(self._create_user, user_in, password_hash)
+
+    def _check_email_available(self, email: str) -> None:
+        """检查邮箱是否已存在（在计算密码哈希之前检查）"""
+        existing_user = self.db.query(User).filter(User.email == email).first()
         if existing_user:
             raise ValueError("Email already registered")
 
+    def _create_user(self, user_in: UserRegister, password_hash: str) -> User:
+        """创建用户及其默认组织"""
         # 创建用户
         user = User(
             email=user_in.email,
             username=user_in.username,
-            password_hash=get_password_hash(user_in.password),
+            password_hash=password_hash,
             is_active=True,
             is_verified=False,  # 需要邮箱验证
         )
@@ -68,6 +86,8 @@ class AuthService:
 
         self.db.add(member)
         self.db.commit()
+        # 提交后属性已过期，重新加载，避免调用方（如异步端点序列化响应）访问属性时再查询
+        self.db.refresh(user)
 
         return user
 
@@ -75,6 +95,26 @@ class AuthService:
         """
         验证用户邮箱和密码
         """
+        user = self._get_password_user(email)
+        if not user:
+            return None
+
+        valid, new_hash = verify_and_update_password(password, user.password_hash)
+        return self._verified_user(user, valid, new_hash)
+
+    async def authenticate_user_async(self, email: str, password: str) -> Optional[User]:
+        """
+        验证用户邮箱和密码（bcrypt 校验和数据库操作都在线程池中执行，不阻塞事件循环）
+        """
+        user = await run_in_threadpool(self._get_password_user, email)
+        if not user:
+            return None
+
+        valid, new_hash = await verify_and_update_password_async(password, user.password_hash)
+        return await run_in_threadpool(self._verified_user, user, valid, new_hash)
+
+    def _get_password_user(self, email: str) -> Optional[User]:
+        """查询设置了密码的用户"""
         user = self.db.query(User).filter(User.email == email).first()
 
         if not user:
@@ -83,17 +123,34 @@ class AuthService:
         if not user.password_hash:
             return None
 
-        if not verify_password(password, user.password_hash):
+        return user
+
+    def _verified_user(self, user: User, valid: bool, new_hash: Optional[str]) -> Optional[User]:
+        """处理校验结果：密码正确且哈希 cost 与配置不一致时保存新哈希"""
+        if not valid:
             return None
 
+        if new_hash:
+            user.password_hash = new_hash
+            self.db.commit()
+            self.db.refresh(user)
+
         return user
 
     def login(self, email: str, password: str) -> Token:
         """
         用户登录
         """
-        user = self.authenticate_user(email, password)
+        return self._issue_tokens(self.authenticate_user(email, password))
+
+    async def login_async(self, email: str, password: str) -> Token:
+        """
+        用户登录（供异步端点使用）
+        """
+        return self._issue_tokens(await self.authenticate_user_async(email, password))
 
+    def _issue_tokens(self, user: Optional[User]) -> Token:
+        """检查用户状态并签发 Token"""
         if not user:
             raise ValueError("Invalid email or password")
 
@@ -0,0 +1,214 @@
+"""
+相同请求合并（single-flight）
+同一机器人、同一问题（规范化后）、且没有历史对话上下文的并发请求共享一次 Coze 调用：
+第一个请求（leader）发起上游流，其余请求（follower）订阅同一条流并各自转发、各自保存消息
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.metrics import metrics
+from app.services.answer_cache import normalize_question
+
+
+coalesced_requests = metrics.counter(
+    "chat_coalesced_requests_total", "合并到已有上游调用的请求数", ("mode",)
+)
+inflight_upstreams = metrics.gauge(
+    "chat_coalescer_inflight", "正在进行的可合并上游调用数", ("mode",)
+)
+
+
+def coalesce_key(bot_id: str, message: str) -> Tuple[str, str]:
+    """合并键：(Coze 机器人 ID, 规范化问题)"""
+    return (bot_id, normalize_question(message))
+
+
+class _SharedStream:
+    """一条被多个订阅者共享的上游流"""
+
+    def __init__(self):
+        self.chunks: List[Dict[str, Any]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def publish(self, chunk: Optional[Dict[str, Any]] = None) -> None:
+        """追加分片并唤醒所有订阅者"""
+        if chunk is not None:
+            self.chunks.append(chunk)
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait(self) -> None:
+        """等待新分片"""
+        await self._updated.wait()
+
+
+class _SharedCall:
+    """一次被多个等待者共享的非流式上游调用"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class StreamSubscription:
+    """共享流的订阅"""
+
+    def __init__(self, coalescer: "ChatCoalescer", key: Tuple[str, str], shared: _SharedStream, is_leader: bool):
+        self._coalescer = coalescer
+        self._key = key
+        self._shared = shared
+        self.is_leader = is_leader
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        """从头回放已收到的分片，再跟随上游继续输出"""
+        shared = self._shared
+        index = 0
+        try:
+            while True:
+                if index < len(shared.chunks):
+                    chunk = shared.chunks[index]
+                    index += 1
+                    yield chunk
+                elif shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                else:
+                    await shared.wait()
+        finally:
+            self._coalescer._unsubscribe(self._key, shared)
+
+
+class ChatCoalescer:
+    """请求合并器"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._streams: Dict[Tuple[str, str], _SharedStream] = {}
+        self._calls: Dict[Tuple[str, str], _SharedCall] = {}
+
+    def subscribe(
+        self,
+        key: Tuple[str, str],
+        factory: Callable[[], AsyncIterator[Dict[str, Any]]],
+    ) -> StreamSubscription:
+        """
+        订阅流式调用：相同 key 的调用正在进行时复用它，否则用 factory 发起新的上游流
+
+        Args:
+            key: 合并键（见 coalesce_key）
+            factory: 创建上游流的函数
+
+        Returns:
+            订阅对象，is_leader 表示本请求是否为上游调用的发起者
+        """
+        shared = self._streams.get(key) if self.enabled else None
+        is_leader = shared is None
+
+        if is_leader:
+            shared = _SharedStream()
+            shared.task = asyncio.create_task(self._pump(key, shared, factory))
+            if self.enabled:
+                self._streams[key] = shared
+                inflight_upstreams.inc(mode="stream")
+        else:
+            coalesced_requests.inc(mode="stream")
+
+        shared.subscribers += 1
+        return StreamSubscription(self, key, shared, is_leader)
+
+    async def call(
+        self,
+        key: Tuple[str, str],
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        非流式调用合并：相同 key 的调用正在进行时等待其结果
+
+        上游调用在独立任务中执行，发起者被取消（如客户端断开）不影响其他等待者；
+        所有等待者都离开时才取消上游调用。
+
+        Returns:
+            (响应数据, 是否为上游调用的发起者)
+        """
+        if not self.enabled:
+            return await factory(), True
+
+        shared = self._calls.get(key)
+        is_leader = shared is None
+        if is_leader:
+            shared = _SharedCall()
+            shared.task = asyncio.create_task(self._run_call(key, shared, factory))
+            self._calls[key] = shared
+            inflight_upstreams.inc(mode="call")
+        else:
+            coalesced_requests.inc(mode="call")
+
+        shared.waiters += 1
+        try:
+            # shield：单个等待者被取消时不影响其他等待者
+            return await asyncio.shield(shared.task), is_leader
+        finally:
+            shared.waiters -= 1
+            if shared.waiters <= 0 and not shared.task.done():
+                self._release_call(key, shared)
+                shared.task.cancel()
+
+    async def _run_call(
+        self,
+        key: Tuple[str, str],
+        shared: _SharedCall,
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """执行共享的非流式调用"""
+        try:
+            return await factory()
+        finally:
+            self._release_call(key, shared)
+
+    def _release_call(self, key: Tuple[str, str], shared: _SharedCall) -> None:
+        """非流式调用结束或被放弃：之后到达的相同请求将发起新的调用"""
+        if self._calls.get(key) is shared:
+            del self._calls[key]
+            inflight_upstreams.dec(mode="call")
+
+    async def _pump(
+        self,
+        key: Tuple[str, str],
+        shared: _SharedStream,
+        factory: Callable[[], AsyncIterator[Dict[str, Any]]],
+    ) -> None:
+        """消费上游流并分发给所有订阅者"""
+        try:
+            async for chunk in factory():
+                shared.publish(chunk)
+        except asyncio.CancelledError:
+            shared.error = ConnectionAbortedError("Upstream stream cancelled")
+            raise
+        except Exception as e:
+            shared.error = e
+        finally:
+            shared.done = True
+            shared.publish()
+            self._release(key, shared)
+
+    def _release(self, key: Tuple[str, str], shared: _SharedStream) -> None:
+        """上游流结束：之后到达的相同请求将发起新的调用"""
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+            inflight_upstreams.dec(mode="stream")
+
+    def _unsubscribe(self, key: Tuple[str, str], shared: _SharedStream) -> None:
+        """订阅者离开；所有订阅者都离开时取消上游流"""
+        shared.subscribers -= 1
+        if shared.subscribers <= 0 and not shared.done and shared.task is not None:
+            self._release(key, shared)
+            shared.task.cancel()
+
+
+# 全局请求合并实例
+chat_coalescer = ChatCoalescer()
@@ -0,0 +1,125 @@
+"""
+聊天数据访问服务（异步）
+聊天热路径上的机器人、对话、消息查询，基于 AsyncSession，不阻塞事件循环
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.bot import Bot
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.organization import Organization
+from app.models.user import User
+from app.services.org_membership import resolve_membership_async
+
+
+class ChatService:
+    """聊天数据访问服务类"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_user(self, user_id: str) -> Optional[User]:
+        """
+        获取用户
+        """
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        return result.scalars().first()
+
+    async def get_user_organization(self, user_id: str) -> Optional[Organization]:
+        """
+        获取用户所属组织（简化版：取第一个组织，走组织解析缓存）
+        """
+        membership = await resolve_membership_async(self.db, user_id)
+        return membership.organization if membership else None
+
+    async def get_organization(self, organization_id: str) -> Optional[Organization]:
+        """
+        按 ID 获取组织（API 密钥调用时组织由密钥确定）
+        """
+        return await self.db.get(Organization, organization_id)
+
+    async def get_bot(self, bot_id: str, organization_id: str) -> Optional[Bot]:
+        """
+        获取组织下的机器人
+        """
+        result = await self.db.execute(
+            select(Bot).where(
+                Bot.id == bot_id,
+                Bot.organization_id == organization_id,
+            )
+        )
+        return result.scalars().first()
+
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        organization_id: str,
+        user_id: str,
+    ) -> Optional[Conversation]:
+        """
+        获取用户自己的对话
+        """
+        result = await self.db.execute(
+            select(Conversation).where(
+                Conversation.id == conversation_id,
+                Conversation.organization_id == organization_id,
+                Conversation.user_id == user_id,
+            )
+        )
+        return result.scalars().first()
+
+    async def create_conversation(
+        self,
+        bot: Bot,
+        user_id: str,
+        organization_id: str,
+        first_message: str,
+    ) -> Conversation:
+        """
+        创建对话（以首条消息作为标题）
+        """
+        conversation = Conversation(
+            bot_id=bot.id,
+            user_id=user_id,
+            organization_id=organization_id,
+            title=first_message[:50] + "..." if len(first_message) > 50 else first_message,
+            message_count=0,
+        )
+        self.db.add(conversation)
+        await self.db.commit()
+        await self.db.refresh(conversation)
+
+        return conversation
+
+    def add_message(
+        self,
+        conversation: Conversation,
+        user_id: str,
+        role: str,
+        content: str,
+        coze_message_id: Optional[str] = None,
+    ) -> Message:
+        """
+        添加消息（由调用方统一提交）
+        """
+        message = Message(
+            conversation_id=conversation.id,
+            user_id=user_id,
+            role=role,
+            content=content,
+            coze_message_id=coze_message_id,
+        )
+        self.db.add(message)
+
+        return message
+
+    async def commit(self, conversation: Optional[Conversation] = None) -> None:
+        """
+        提交事务，可选刷新对话（获取 updated_at 等数据库生成的字段）
+        """
+        await self.db.commit()
+        if conversation is not None:
+            await self.db.refresh(conversation)
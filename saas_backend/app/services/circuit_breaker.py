@@ -0,0 +1,244 @@
+"""
+熔断器
+按滚动时间窗口统计上游调用的失败率和慢调用率，超过阈值时熔断（open），
+熔断期间请求直接失败，不再等待上游超时；冷却后进入半开（half-open），
+放行少量探测请求，探测成功则恢复（closed），失败则重新熔断
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.metrics import metrics
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 仪表盘取值：0 = closed，1 = half_open，2 = open
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breaker_state = metrics.gauge(
+    "circuit_breaker_state", "熔断器状态（0=closed, 1=half_open, 2=open）", ("upstream",)
+)
+breaker_transitions = metrics.counter(
+    "circuit_breaker_transitions_total", "熔断器状态切换次数", ("upstream", "from_state", "to_state")
+)
+breaker_rejected = metrics.counter(
+    "circuit_breaker_rejected_total", "熔断期间被直接拒绝的请求数", ("upstream",)
+)
+breaker_calls = metrics.counter(
+    "circuit_breaker_calls_total", "经过熔断器的上游调用数", ("upstream", "outcome")
+)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit breaker '{name}' is open, retry after {retry_after:.1f}s")
+
+
+class CircuitPermit:
+    """一次调用的许可，调用结束时必须记录结果（success/failure）或释放（release）"""
+
+    __slots__ = ("_breaker", "_probe", "_settled")
+
+    def __init__(self, breaker: "CircuitBreaker", probe: bool):
+        self._breaker = breaker
+        self._probe = probe
+        self._settled = False
+
+    def success(self, latency: float) -> None:
+        """调用成功；latency 超过慢调用阈值时按慢调用统计"""
+        if not self._settled:
+            self._settled = True
+            self._breaker._record(self._probe, failed=False, latency=latency)
+
+    def failure(self, latency: float) -> None:
+        """调用失败"""
+        if not self._settled:
+            self._settled = True
+            self._breaker._record(self._probe, failed=True, latency=latency)
+
+    def release(self) -> None:
+        """调用被放弃（如客户端断开），不计入统计"""
+        if not self._settled:
+            self._settled = True
+            self._breaker._release(self._probe)
+
+
+class CircuitBreaker:
+    """熔断器（closed / open / half_open）"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate_threshold: float = 0.5,
+        window_seconds: int = 30,
+        min_calls: int = 20,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 3,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            name: 上游名称（用于日志和指标标签）
+            failure_rate_threshold: 窗口内失败率达到该值时熔断
+            slow_call_seconds: 耗时超过该值的调用记为慢调用
+            slow_call_rate_threshold: 窗口内慢调用率达到该值时熔断
+            window_seconds: 滚动统计窗口（秒）
+            min_calls: 窗口内调用数达到该值才判断是否熔断
+            open_seconds: 熔断持续时间，之后进入半开
+            half_open_max_calls: 半开状态放行的探测请求数，全部成功后恢复
+            enabled: 关闭时只统计不熔断
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.enabled = enabled
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        # 每秒一个桶：[秒, 调用数, 失败数, 慢调用数]
+        self._buckets: Deque[List[int]] = deque()
+        self._probes_inflight = 0
+        self._probe_successes = 0
+
+        breaker_state.set(_STATE_VALUES[CLOSED], upstream=name)
+
+    @property
+    def state(self) -> str:
+        """当前状态（open 状态冷却结束后视为 half_open）"""
+        if self._state == OPEN and time.monotonic() >= self._opened_at + self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def acquire(self) -> CircuitPermit:
+        """
+        申请调用许可
+
+        Raises:
+            CircuitOpenError: 熔断中，或半开状态的探测名额已满
+        """
+        state = self.state
+        if not self.enabled or state == CLOSED:
+            return CircuitPermit(self, probe=False)
+
+        if state == HALF_OPEN and self._probes_inflight < self.half_open_max_calls:
+            self._probes_inflight += 1
+            return CircuitPermit(self, probe=True)
+
+        breaker_rejected.inc(upstream=self.name)
+        retry_after = max(self._opened_at + self.open_seconds - time.monotonic(), 0.0)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _record(self, probe: bool, failed: bool, latency: float) -> None:
+        """记录调用结果并判断是否切换状态"""
+        slow = not failed and latency >= self.slow_call_seconds
+        breaker_calls.inc(
+            upstream=self.name,
+            outcome="failure" if failed else ("slow" if slow else "success"),
+        )
+
+        now = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+        self._prune(now)
+
+        if not self.enabled:
+            return
+
+        if probe:
+            self._probes_inflight = max(self._probes_inflight - 1, 0)
+            if self._state != HALF_OPEN:
+                return
+            if failed or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._transition(CLOSED)
+            return
+
+        if self._state == CLOSED:
+            calls, failures, slow_calls = self._window_totals()
+            if calls >= self.min_calls and (
+                failures / calls >= self.failure_rate_threshold
+                or slow_calls / calls >= self.slow_call_rate_threshold
+            ):
+                self._open()
+
+    def _release(self, probe: bool) -> None:
+        """放弃的调用只归还探测名额"""
+        if probe:
+            self._probes_inflight = max(self._probes_inflight - 1, 0)
+
+    def _prune(self, now: int) -> None:
+        """丢弃窗口之外的桶"""
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            self._buckets.popleft()
+
+    def _window_totals(self) -> tuple:
+        """窗口内 (调用数, 失败数, 慢调用数)"""
+        calls = failures = slow_calls = 0
+        for _, bucket_calls, bucket_failures, bucket_slow in self._buckets:
+            calls += bucket_calls
+            failures += bucket_failures
+            slow_calls += bucket_slow
+        return calls, failures, slow_calls
+
+    def _open(self) -> None:
+        """熔断"""
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        """切换状态并上报"""
+        previous = self._state
+        if previous == state:
+            return
+        self._state = state
+        self._probes_inflight = 0
+        self._probe_successes = 0
+        if state == CLOSED:
+            # 恢复后重新开始统计，避免熔断前的失败立刻再次触发熔断
+            self._buckets.clear()
+
+        breaker_state.set(_STATE_VALUES[state], upstream=self.name)
+        breaker_transitions.inc(upstream=self.name, from_state=previous, to_state=state)
+        icon = {CLOSED: "✅", HALF_OPEN: "🟡", OPEN: "🔴"}[state]
+        print(f"{icon} 熔断器 {self.name}: {previous} -> {state}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        self._prune(int(time.monotonic()))
+        calls, failures, slow_calls = self._window_totals()
+        state = self.state
+        retry_after: Optional[float] = None
+        if state == OPEN:
+            retry_after = round(max(self._opened_at + self.open_seconds - time.monotonic(), 0.0), 3)
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "state": state,
+            "window_calls": calls,
+            "window_failures": failures,
+            "window_slow_calls": slow_calls,
+            "failure_rate": failures / calls if calls else 0.0,
+            "slow_call_rate": slow_calls / calls if calls else 0.0,
+            "retry_after": retry_after,
+        }
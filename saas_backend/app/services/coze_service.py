@@ -3,12 +3,79 @@ Coze API 服务封装
 集成 Coze AI 对话功能
 """
 import os
+import asyncio
+import time
 import httpx
-from typing import AsyncIterator, Optional, Dict, Any
-from datetime import datetime
-import json
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Deque, FrozenSet, Iterable, List, Optional, Dict, Any
+from urllib.parse import urlparse
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tasks import spawn_background
+from app.core.tracing import record_span, span
+from app.services.circuit_breaker import CLOSED, CircuitBreaker, CircuitPermit
+from app.services.sse_parser import SSEEvent, SSEParser
+
+
+hedged_requests = metrics.counter(
+    "coze_hedged_requests_total", "发出的对冲请求数（按先返回的请求分类）", ("winner",)
+)
+# 流式聊天默认解析的事件；其他事件（如携带完整回复的 conversation.message.completed）不解码 JSON
+STREAM_EVENTS: FrozenSet[str] = frozenset({
+    "conversation.chat.created",
+    "conversation.message.delta",
+    "conversation.chat.completed",
+    "conversation.chat.failed",
+})
+
+cancelled_chats = metrics.counter(
+    "coze_cancelled_chats_total", "流式响应被提前关闭后取消的 Coze 对话数", ("result",)
+)
+
+
+def _h2_available() -> bool:
+    """检查是否安装了 HTTP/2 支持（httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("⚠️ h2 未安装，Coze 客户端回退到 HTTP/1.1")
+        return False
+    return True
+
+
+def _stream_error_message(event: SSEEvent) -> str:
+    """提取 error / conversation.chat.failed 事件的错误信息"""
+    try:
+        data = event.json()
+    except ValueError:
+        return event.text()
+    if isinstance(data, dict):
+        error = data.get("last_error") or data
+        if isinstance(error, dict) and error.get("msg"):
+            return str(error["msg"])
+    return event.text()
+
+
+async def _iter_sse(response: httpx.Response) -> AsyncIterator[List[SSEEvent]]:
+    """逐块解析响应体中的 SSE 事件；响应体结束后再处理缓冲区中没有以空行结尾的最后一帧"""
+    parser = SSEParser()
+    async for raw in response.aiter_raw():
+        events = parser.feed(raw)
+        if events:
+            yield events
+    events = parser.flush()
+    if events:
+        yield events
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """是否计为上游故障：4xx（429 除外）是请求本身的问题，不影响熔断"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code == 429
+    return True
 
 
 class CozeService:
@@ -19,7 +86,104 @@ class CozeService:
         # 从环境变量读取 Coze API Token
         self.api_token = os.getenv("COZE_API_TOKEN")
         self.base_url = os.getenv("COZE_API_BASE", "https://api.coze.com")
-        self.timeout = 60.0
+        # 建连与读取分开计时：建连失败要快速暴露，流式读取则允许较长的分片间隔
+        self.timeout = httpx.Timeout(
+            settings.COZE_READ_TIMEOUT,
+            connect=settings.COZE_CONNECT_TIMEOUT,
+            pool=settings.COZE_POOL_TIMEOUT,
+        )
+        self.limits = httpx.Limits(
+            max_connections=settings.COZE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.COZE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.COZE_HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = settings.COZE_HTTP2 and _h2_available()
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # 上游熔断器：Coze 不健康时快速失败，不再等满读取超时
+        self.breaker = CircuitBreaker(
+            name=urlparse(self.base_url).netloc or "coze",
+            failure_rate_threshold=settings.COZE_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.COZE_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate_threshold=settings.COZE_BREAKER_SLOW_CALL_RATE,
+            window_seconds=settings.COZE_BREAKER_WINDOW_SECONDS,
+            min_calls=settings.COZE_BREAKER_MIN_CALLS,
+            open_seconds=settings.COZE_BREAKER_OPEN_SECONDS,
+            half_open_max_calls=settings.COZE_BREAKER_HALF_OPEN_CALLS,
+            enabled=settings.COZE_BREAKER_ENABLED,
+        )
+        # 非流式聊天的近期延迟，用于计算对冲延迟
+        self.hedge_enabled = settings.COZE_HEDGE_ENABLED
+        self._chat_latencies: Deque[float] = deque(maxlen=512)
+
+    async def startup(self) -> None:
+        """创建共享 HTTP 客户端（在应用 lifespan 启动阶段调用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+
+    async def shutdown(self) -> None:
+        """关闭共享 HTTP 客户端，释放连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """构建带连接池、保活和 HTTP/2 的客户端"""
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        获取共享 HTTP 客户端
+
+        正常情况下由 lifespan 创建；脚本等未经过 lifespan 的场景按需懒加载。
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池状态
+
+        Returns:
+            in_use: 正在处理请求的连接数
+            idle: 空闲保活连接数
+            waiting: 等待空闲连接的请求数
+        """
+        stats = {
+            "in_use": 0,
+            "idle": 0,
+            "waiting": 0,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "http2": self.http2,
+        }
+
+        if self._client is None or self._client.is_closed:
+            return stats
+
+        # httpx 未公开连接池接口，这里读取 httpcore 连接池的内部状态
+        pool = getattr(self._client._transport, "_pool", None)
+        if pool is None:
+            return stats
+
+        for connection in pool.connections:
+            if connection.is_idle():
+                stats["idle"] += 1
+            else:
+                stats["in_use"] += 1
+
+        stats["waiting"] = sum(
+            1 for pool_request in getattr(pool, "_requests", [])
+            if pool_request.is_queued()
+        )
+
+        return stats
 
     async def _get_headers(self) -> Dict[str, str]:
         """获取请求头"""
@@ -29,6 +193,106 @@ class CozeService:
             "Accept": "application/json",
         }
 
+    @staticmethod
+    def _settle(
+        permit: CircuitPermit,
+        error: Optional[BaseException],
+        latency: float,
+        responded: bool,
+    ) -> None:
+        """
+        向熔断器记录调用结果
+
+        Args:
+            error: 调用抛出的异常，成功为 None
+            latency: 调用耗时（流式为首包时间）
+            responded: 上游是否已正常响应（取消发生在响应之后计为成功）
+        """
+        if error is None:
+            permit.success(latency)
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # 客户端断开或对冲请求落败，不代表上游故障
+            if responded:
+                permit.success(latency)
+            else:
+                permit.release()
+        elif _is_upstream_failure(error):
+            permit.failure(latency)
+        else:
+            permit.success(latency)
+
+    async def _post(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        latency_samples: Optional[Deque[float]] = None,
+    ) -> Dict[str, Any]:
+        """
+        发送 POST 请求（经过熔断器）
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        permit = self.breaker.acquire()
+        started = time.monotonic()
+        try:
+            response = await self.client.post(
+                url,
+                headers=await self._get_headers(),
+                json=payload,
+            )
+            response.raise_for_status()
+            data = response.json()
+        except BaseException as e:
+            self._settle(permit, e, time.monotonic() - started, responded=False)
+            raise
+
+        latency = time.monotonic() - started
+        permit.success(latency)
+        if latency_samples is not None:
+            latency_samples.append(latency)
+        return data
+
+    def _hedge_delay(self) -> Optional[float]:
+        """对冲延迟：近期非流式聊天延迟的分位数；样本不足时返回 None（不对冲）"""
+        if len(self._chat_latencies) < settings.COZE_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(self._chat_latencies)
+        index = min(int(len(samples) * settings.COZE_HEDGE_QUANTILE), len(samples) - 1)
+        return max(samples[index], settings.COZE_HEDGE_MIN_DELAY)
+
+    async def _hedged_post(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        对冲请求：首个请求超过对冲延迟仍未返回时再发一个相同请求，取先成功返回的结果，
+        另一个请求随即取消。熔断器不处于 closed 状态时不对冲，避免给不健康的上游加压。
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._post(url, payload, self._chat_latencies)
+
+        primary = asyncio.create_task(self._post(url, payload, self._chat_latencies))
+        pending = {primary}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self.breaker.state == CLOSED:
+                pending.add(asyncio.create_task(self._post(url, payload, self._chat_latencies)))
+                hedged = True
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            hedged_requests.inc(winner="primary" if task is primary else "hedge")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
     async def chat(
         self,
         bot_id: str,
@@ -62,18 +326,15 @@ class CozeService:
             ]
         }
 
-        if conversation_id:
-            payload["conversation_id"] = conversation_id
+        with span("coze_chat"):
+            if conversation_id:
+                payload["conversation_id"] = conversation_id
+                # 续聊请求会在 Coze 对话中追加消息，重复发送有副作用，不做对冲
+                return await self._post(url, payload, self._chat_latencies)
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                url,
-                headers=await self._get_headers(),
-                json=payload,
-            )
-
-            response.raise_for_status()
-            return response.json()
+            if self.hedge_enabled:
+                return await self._hedged_post(url, payload)
+            return await self._post(url, payload, self._chat_latencies)
 
     async def chat_stream(
         self,
@@ -81,6 +342,7 @@ class CozeService:
         message: str,
         conversation_id: Optional[str] = None,
         user_id: str = "default_user",
+        events: Optional[Iterable[str]] = None,
     ) -> AsyncIterator[Dict[str, Any]]:
         """
         发送聊天消息（流式）
@@ -90,9 +352,14 @@ class CozeService:
             message: 用户消息
             conversation_id: 对话 ID（可选）
             user_id: 用户 ID
+            events: 需要输出的事件类型，默认 STREAM_EVENTS；其他事件跳过，不解码 JSON
 
         Yields:
-            流式响应数据块
+            {"event": 事件类型, "data": 事件数据}；
+            结束时输出 {"type": "done"}，Coze 返回错误时输出 {"type": "error", "error": 错误信息}
+
+        流在 [DONE] 之前被关闭（客户端断开、上游流被取消）时立即断开 HTTP 连接，
+        并在后台调用 cancel_chat 停止 Coze 继续生成。
         """
         url = f"{self.base_url}/v3/chat"
 
@@ -112,53 +379,119 @@ class CozeService:
         if conversation_id:
             payload["conversation_id"] = conversation_id
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            async with client.stream(
+        # 熔断中直接抛出 CircuitOpenError；流式调用以首包时间计慢调用，整条流结束后记录结果
+        wanted = STREAM_EVENTS if events is None else frozenset(events)
+        headers = await self._get_headers()
+        headers["Accept"] = "text/event-stream"
+        # aiter_raw 不解压，要求上游不压缩
+        headers["Accept-Encoding"] = "identity"
+
+        permit = self.breaker.acquire()
+        started = time.monotonic()
+        latency: Optional[float] = None
+        chat_id: Optional[str] = None
+        coze_conversation_id = conversation_id
+        finished = False
+        first_token = True
+        try:
+            async with self.client.stream(
                 "POST",
                 url,
-                headers=await self._get_headers(),
+                headers=headers,
                 json=payload,
             ) as response:
                 response.raise_for_status()
-
-                async for line in response.aiter_lines():
-                    if line.startswith("data:"):
-                        data = line[5:].strip()
-
-                        if data == "[DONE]":
-                            yield {"type": "done"}
+                latency = time.monotonic() - started
+                record_span("coze_connect", latency)
+
+                stop = False
+                async with aclosing(_iter_sse(response)) as batches:
+                    async for batch in batches:
+                        for sse in batch:
+                            event = sse.event
+
+                            if event == "done" or sse.data == b"[DONE]":
+                                finished = stop = True
+                                yield {"type": "done"}
+                                break
+
+                            if event in ("error", "conversation.chat.failed"):
+                                finished = stop = True
+                                yield {"type": "error", "error": _stream_error_message(sse)}
+                                break
+
+                            # 对话创建事件总要解析：提前关闭时需要 chat_id 取消生成
+                            if event not in wanted and event != "conversation.chat.created":
+                                continue
+
+                            try:
+                                data = sse.json()
+                            except ValueError:
+                                # 跳过无效的 JSON
+                                continue
+
+                            if event == "conversation.chat.created" and isinstance(data, dict):
+                                chat_id = data.get("id") or chat_id
+                                coze_conversation_id = data.get("conversation_id") or coze_conversation_id
+                            elif event == "conversation.chat.completed":
+                                finished = True
+                            elif event == "conversation.message.delta" and first_token:
+                                first_token = False
+                                record_span("coze_first_token", time.monotonic() - started)
+
+                            if event in wanted:
+                                yield {"event": event, "data": data}
+
+                        if stop:
                             break
+        except BaseException as e:
+            self._settle(
+                permit,
+                e,
+                latency if latency is not None else time.monotonic() - started,
+                responded=latency is not None,
+            )
+            # 提前关闭：httpx 连接已随 async with 退出断开，再通知 Coze 停止生成
+            if (
+                isinstance(e, (asyncio.CancelledError, GeneratorExit))
+                and not finished and chat_id and coze_conversation_id
+            ):
+                # 调用方可能处于已取消的 cancel scope 中，不能直接 await
+                spawn_background(self._cancel_in_background(coze_conversation_id, chat_id))
+            raise
 
-                        try:
-                            chunk = json.loads(data)
-                            yield chunk
-                        except json.JSONDecodeError:
-                            # 跳过无效的 JSON
-                            continue
+        permit.success(latency)
 
     async def create_conversation(
         self,
         bot_id: str,
         user_id: str = "default_user",
+        messages: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         """
-        创建新对话
+        创建新对话（聊天时对话会自动创建；需要预置上下文时显式创建）
 
         Args:
             bot_id: Coze Bot ID
-            user_id: 用户 ID
+            user_id: 用户 ID（写入对话元数据）
+            messages: 初始消息（作为对话上下文），如
+                [{"role": "user", "content": "...", "content_type": "text"}]
 
         Returns:
-            对话信息
+            对话信息（id 为 Coze 对话 ID）
         """
-        # Coze API v3 中，对话在首次发送消息时自动创建
-        # 这里返回模拟数据
-        return {
-            "id": f"conv_{datetime.utcnow().timestamp()}",
+        url = f"{self.base_url}/v1/conversation/create"
+
+        payload: Dict[str, Any] = {
             "bot_id": bot_id,
-            "user_id": user_id,
-            "created_at": datetime.utcnow().isoformat(),
+            "meta_data": {"user_id": user_id},
         }
+        if messages:
+            payload["messages"] = messages
+
+        with span("coze_create_conversation"):
+            response = await self._post(url, payload)
+        return response.get("data") or {}
 
     async def get_conversation(
         self,
@@ -182,15 +515,7 @@ class CozeService:
             "conversation_id": conversation_id,
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                url,
-                headers=await self._get_headers(),
-                json=payload,
-            )
-
-            response.raise_for_status()
-            return response.json()
+        return await self._post(url, payload)
 
     async def get_conversation_messages(
         self,
@@ -214,27 +539,19 @@ class CozeService:
             "conversation_id": conversation_id,
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                url,
-                headers=await self._get_headers(),
-                json=payload,
-            )
-
-            response.raise_for_status()
-            return response.json()
+        return await self._post(url, payload)
 
     async def cancel_chat(
         self,
         conversation_id: str,
-        bot_id: str,
+        chat_id: str,
     ) -> Dict[str, Any]:
         """
         取消正在进行的对话
 
         Args:
-            conversation_id: 对话 ID
-            bot_id: Bot ID
+            conversation_id: Coze 对话 ID
+            chat_id: Coze 本轮对话 ID（conversation.chat.created 事件中的 id）
 
         Returns:
             取消结果
@@ -242,19 +559,20 @@ class CozeService:
         url = f"{self.base_url}/v3/chat/cancel"
 
         payload = {
-            "bot_id": bot_id,
             "conversation_id": conversation_id,
+            "chat_id": chat_id,
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                url,
-                headers=await self._get_headers(),
-                json=payload,
-            )
+        return await self._post(url, payload)
 
-            response.raise_for_status()
-            return response.json()
+    async def _cancel_in_background(self, conversation_id: str, chat_id: str) -> None:
+        """后台取消 Coze 生成（失败只记录日志）"""
+        try:
+            await self.cancel_chat(conversation_id, chat_id)
+            cancelled_chats.inc(result="ok")
+        except Exception as e:
+            cancelled_chats.inc(result="error")
+            print(f"⚠️ 取消 Coze 对话失败 {chat_id}: {str(e)}")
 
 
 # 全局 Coze 服务实例
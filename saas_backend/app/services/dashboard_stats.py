@@ -0,0 +1,138 @@
+"""
+平台仪表板统计快照
+一条查询算出全部指标：每张表一个带条件聚合的单行派生表，交叉连接成一行（每张表只扫描一次、
+一次往返）。快照按需刷新：请求时快照超过 refresh_interval 秒才重新查询（并发请求合并为一次），
+否则直接返回内存中的快照并标明生成时间；没有人打开管理台时不查询。
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, func, select, true
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
+from app.models.bot import Bot
+from app.models.conversation import Conversation
+from app.models.order import Order, OrderStatus
+from app.models.organization import Organization
+from app.models.user import User
+from app.schemas.admin import DashboardStats
+
+
+dashboard_refreshes = metrics.counter("dashboard_stats_refreshes_total", "仪表板统计刷新次数", ("result",))
+dashboard_refresh_seconds = metrics.histogram("dashboard_stats_refresh_seconds", "仪表板统计查询耗时（秒）")
+
+
+def dashboard_stats_statement(month_start: datetime):
+    """仪表板统计查询（返回一行，列名与 DashboardStats 字段一致）"""
+    users = select(
+        func.count().label("total_users"),
+        func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0).label("active_users"),
+    ).select_from(User).subquery()
+    conversations = select(
+        func.count().label("total_conversations"),
+        func.coalesce(func.sum(Conversation.message_count), 0).label("total_messages"),
+    ).select_from(Conversation).subquery()
+    bots = select(func.count().label("total_bots")).select_from(Bot).subquery()
+    organizations = select(func.count().label("total_organizations")).select_from(Organization).subquery()
+    # 收入只统计已支付订单，当月收入按支付时间
+    revenue = select(
+        func.coalesce(func.sum(Order.amount), 0).label("revenue_total"),
+        func.coalesce(func.sum(case((Order.paid_at >= month_start, Order.amount), else_=0)), 0).label("revenue_month"),
+    ).where(Order.status == OrderStatus.PAID).subquery()
+
+    return select(users, conversations, bots, organizations, revenue).select_from(
+        users.join(conversations, true())
+        .join(bots, true())
+        .join(organizations, true())
+        .join(revenue, true())
+    )
+
+
+class DashboardStatsCache:
+    """仪表板统计快照"""
+
+    def __init__(self, refresh_interval: float = 60):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[DashboardStats] = None
+        self._refreshed_at = 0.0
+        # 正在进行的刷新（合并并发刷新）
+        self._refreshing: Optional[asyncio.Task] = None
+
+        # 统计
+        self.refreshes = 0
+        self.failures = 0
+
+    async def get(self) -> DashboardStats:
+        """
+        获取统计快照（附带生成时间和已过去的秒数）
+
+        还没有快照或快照超过刷新间隔时当场刷新；刷新失败时继续返回旧快照，age_seconds 会持续增大。
+        """
+        if self._snapshot is None:
+            await asyncio.shield(self._start_refresh())
+        elif time.time() - self._refreshed_at > self.refresh_interval:
+            try:
+                await asyncio.shield(self._start_refresh())
+            except Exception:
+                pass
+
+        return self._snapshot.model_copy(
+            update={"age_seconds": round(time.time() - self._refreshed_at, 3)}
+        )
+
+    async def refresh(self) -> DashboardStats:
+        """执行统计查询并替换快照"""
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(dashboard_stats_statement(month_start))).mappings().one()
+        dashboard_refresh_seconds.observe(time.perf_counter() - started)
+
+        snapshot = DashboardStats(
+            total_users=int(row["total_users"]),
+            active_users=int(row["active_users"]),
+            total_conversations=int(row["total_conversations"]),
+            total_messages=int(row["total_messages"]),
+            total_bots=int(row["total_bots"]),
+            total_organizations=int(row["total_organizations"]),
+            revenue_month=float(row["revenue_month"]),
+            revenue_total=float(row["revenue_total"]),
+            generated_at=datetime.utcnow(),
+        )
+        self._snapshot = snapshot
+        self._refreshed_at = time.time()
+        self.refreshes += 1
+        dashboard_refreshes.inc(result="ok")
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """获取快照状态"""
+        return {
+            "refresh_interval": self.refresh_interval,
+            "age_seconds": round(time.time() - self._refreshed_at, 3) if self._snapshot else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+    def _start_refresh(self) -> asyncio.Task:
+        """开始刷新（同时只有一个刷新任务）"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self.refresh())
+            self._refreshing.add_done_callback(self._refresh_done)
+        return self._refreshing
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        """刷新结束"""
+        self._refreshing = None
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+            dashboard_refreshes.inc(result="failed")
+            print(f"❌ Dashboard stats refresh failed: {task.exception()}")
+
+
+# 全局仪表板统计快照实例
+dashboard_stats = DashboardStatsCache(refresh_interval=settings.DASHBOARD_STATS_REFRESH_SECONDS)
@@ -0,0 +1,212 @@
+"""
+SSE 增量合并
+Coze 的 conversation.message.delta 事件很碎（常常一个字一个事件），逐个转发会放大系统调用、
+代理开销和浏览器重绘次数。合并器把连续的增量缓冲起来，累计达到字节阈值或时间窗口（以先到者为准）
+时合并为一个事件输出；首个增量总是立即输出，不影响首字延迟（TTFT）。
+"""
+import asyncio
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+DELTA_EVENT = "conversation.message.delta"
+
+# 上游流结束标记
+_END = object()
+
+frames_per_response = metrics.histogram(
+    "chat_stream_frames_per_response", "每条流式回复输出的消息帧数",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000),
+)
+deltas_per_response = metrics.histogram(
+    "chat_stream_deltas_per_response", "每条流式回复收到的 Coze 增量事件数",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000),
+)
+time_to_first_token = metrics.histogram(
+    "chat_stream_ttft_seconds", "从收到请求到输出首个消息帧的时间（秒）"
+)
+
+
+class DeltaCoalescer:
+    """增量合并器"""
+
+    def __init__(self, max_bytes: int = 256, max_delay: float = 0.03, enabled: bool = True):
+        """
+        Args:
+            max_bytes: 缓冲内容达到该字节数时立即输出
+            max_delay: 缓冲首个增量后最多等待的时间（秒）
+            enabled: 关闭时逐个转发增量（仍然上报指标）
+        """
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.enabled = enabled
+
+    async def coalesce(
+        self,
+        chunks: AsyncIterator[Dict[str, Any]],
+        started_at: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        合并流中的增量事件，其他事件原样透传（透传前先输出已缓冲的增量）
+
+        Args:
+            chunks: Coze 格式的事件流
+            started_at: 请求开始时间（time.perf_counter()），用于统计 TTFT
+
+        Yields:
+            合并后的事件；合并的增量事件沿用最后一个增量的字段，content 为拼接后的内容
+        """
+        stats = {"frames": 0, "deltas": 0}
+
+        def on_frame() -> None:
+            if stats["frames"] == 0 and started_at is not None:
+                time_to_first_token.observe(time.perf_counter() - started_at)
+            stats["frames"] += 1
+
+        try:
+            if not self.enabled:
+                try:
+                    async for chunk in chunks:
+                        if _delta_content(chunk):
+                            stats["deltas"] += 1
+                            on_frame()
+                        yield chunk
+                finally:
+                    # 调用方提前关闭时一并关闭上游流，不等垃圾回收
+                    aclose = getattr(chunks, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+                return
+
+            # 调用方关闭合并流时立即关闭内层生成器（取消 pump 任务、释放上游连接）
+            async with aclosing(self._coalesce(chunks, stats, on_frame)) as merged:
+                async for chunk in merged:
+                    yield chunk
+        finally:
+            if stats["deltas"]:
+                frames_per_response.observe(stats["frames"])
+                deltas_per_response.observe(stats["deltas"])
+
+    async def _coalesce(
+        self,
+        chunks: AsyncIterator[Dict[str, Any]],
+        stats: Dict[str, int],
+        on_frame,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """合并主循环：上游在独立任务中读取，这里按时间窗口等待"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+        # 上游流只在 pump 任务中迭代，取消任务即可关闭上游连接
+        pump = asyncio.create_task(_pump(chunks, queue))
+
+        parts: List[str] = []
+        buffered_bytes = 0
+        last_delta: Optional[Dict[str, Any]] = None
+        deadline = 0.0
+
+        def flush() -> Dict[str, Any]:
+            nonlocal parts, buffered_bytes, last_delta
+            merged = dict(last_delta)
+            merged["data"] = dict(last_delta["data"], content="".join(parts))
+            parts, buffered_bytes, last_delta = [], 0, None
+            on_frame()
+            return merged
+
+        try:
+            while True:
+                if last_delta is not None:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        yield flush()
+                        continue
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        yield flush()
+                        continue
+                else:
+                    item = await queue.get()
+
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    if last_delta is not None:
+                        yield flush()
+                    raise item
+
+                content = _delta_content(item)
+                if not content:
+                    # 非增量事件：先输出缓冲内容，保持事件顺序
+                    if last_delta is not None:
+                        yield flush()
+                    yield item
+                    continue
+
+                stats["deltas"] += 1
+                if stats["frames"] == 0 and last_delta is None:
+                    # 首个增量立即输出
+                    on_frame()
+                    yield item
+                    continue
+
+                # 消息 ID 变化时不与上一条消息的内容合并
+                if last_delta is not None and item["data"].get("id") != last_delta["data"].get("id"):
+                    yield flush()
+
+                if last_delta is None:
+                    deadline = loop.time() + self.max_delay
+                parts.append(content)
+                buffered_bytes += len(content.encode("utf-8"))
+                last_delta = item
+
+                if buffered_bytes >= self.max_bytes:
+                    yield flush()
+
+            if last_delta is not None:
+                yield flush()
+        finally:
+            if not pump.done():
+                pump.cancel()
+                # 等上游流关闭完成后再返回
+                await asyncio.gather(pump, return_exceptions=True)
+
+
+def _delta_content(chunk: Dict[str, Any]) -> str:
+    """提取增量事件的内容（非增量事件返回空字符串）"""
+    if chunk.get("event") != DELTA_EVENT:
+        return ""
+    data = chunk.get("data")
+    if not isinstance(data, dict):
+        return ""
+    return data.get("content") or ""
+
+
+async def _pump(chunks: AsyncIterator[Dict[str, Any]], queue: asyncio.Queue) -> None:
+    """读取上游流写入队列；异常作为队列元素传给消费方"""
+    iterator = chunks.__aiter__()
+    try:
+        async for chunk in iterator:
+            await queue.put(chunk)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+        return
+    finally:
+        # 被取消时上游可能停在 yield 处，显式关闭以释放连接
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    await queue.put(_END)
+
+
+# 全局增量合并实例
+delta_coalescer = DeltaCoalescer(
+    max_bytes=settings.SSE_COALESCE_MAX_BYTES,
+    max_delay=settings.SSE_COALESCE_MAX_DELAY_MS / 1000,
+    enabled=settings.SSE_COALESCE_ENABLED,
+)
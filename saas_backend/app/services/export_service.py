@@ -0,0 +1,225 @@
+"""
+数据导出服务
+用服务端游标（yield_per）分批读取行，逐批编码为 CSV 或 NDJSON 并立即写出（可选 gzip 压缩），
+内存占用只与批大小有关，与导出的总行数无关。
+
+导出期间独占一个数据库连接；MySQL 下客户端接收过慢超过 net_write_timeout 时连接会被服务端断开。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.usage import UsageRecord
+
+
+export_rows = metrics.counter("export_rows_total", "导出的行数", ("kind", "format"))
+export_bytes = metrics.counter("export_bytes_total", "导出写出的字节数（压缩后）", ("kind", "format"))
+
+# 导出格式 -> 媒体类型
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+USAGE_EXPORT_COLUMNS = ("id", "date", "created_at", "user_id", "resource_type", "quantity", "extra_data")
+MESSAGE_EXPORT_COLUMNS = (
+    "id", "conversation_id", "bot_id", "user_id", "role", "content", "is_truncated", "created_at",
+)
+
+
+def _jsonable(value: Any) -> Any:
+    """转换为 JSON 可表示的值"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    """转换为 CSV 单元格的值（JSON 列写成 JSON 字符串）"""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return _jsonable(value)
+
+
+class ExportEncoder:
+    """
+    行编码器：把行写入缓冲区，缓冲区达到 chunk_bytes 时取出一块（gzip 时为压缩后的数据）
+    """
+
+    def __init__(self, fmt: str, columns: Sequence[str], gzip: bool = False, chunk_bytes: int = 65536):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.fmt = fmt
+        self.columns = tuple(columns)
+        self.chunk_bytes = chunk_bytes
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer) if fmt == "csv" else None
+        # wbits=31：带 gzip 头和尾
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+        if self._csv is not None:
+            self._csv.writerow(self.columns)
+
+    def write(self, row: Sequence[Any]) -> Optional[bytes]:
+        """
+        写入一行
+
+        Returns:
+            缓冲区达到 chunk_bytes 时返回一块数据，否则返回 None
+        """
+        if self._csv is not None:
+            self._csv.writerow([_csv_value(value) for value in row])
+        else:
+            record = {column: _jsonable(value) for column, value in zip(self.columns, row)}
+            self._buffer.write(json.dumps(record, ensure_ascii=False))
+            self._buffer.write("\n")
+
+        if self._buffer.tell() >= self.chunk_bytes:
+            return self._take()
+        return None
+
+    def finish(self) -> bytes:
+        """取出剩余数据（gzip 时包括压缩流的结尾）"""
+        data = self._take()
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+    def _take(self) -> bytes:
+        """取出并清空缓冲区"""
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        return data
+
+
+def export_media_type(fmt: str, gzip: bool = False) -> str:
+    """导出响应的媒体类型"""
+    return "application/gzip" if gzip else EXPORT_FORMATS[fmt]
+
+
+def export_filename(name: str, fmt: str, gzip: bool = False) -> str:
+    """导出文件名"""
+    return f"{name}.{fmt}.gz" if gzip else f"{name}.{fmt}"
+
+
+def usage_export_statement(
+    organization_id: str,
+    period_start: date,
+    period_end: date,
+    resource_type: Optional[str] = None,
+):
+    """组织在期间内的使用量明细（按日期、时间排序）"""
+    statement = select(
+        UsageRecord.id,
+        UsageRecord.date,
+        UsageRecord.created_at,
+        UsageRecord.user_id,
+        UsageRecord.resource_type,
+        UsageRecord.quantity,
+        UsageRecord.extra_data,
+    ).where(
+        UsageRecord.organization_id == organization_id,
+        UsageRecord.date >= period_start,
+        UsageRecord.date <= period_end,
+    )
+    if resource_type:
+        statement = statement.where(UsageRecord.resource_type == resource_type)
+    return statement.order_by(UsageRecord.date, UsageRecord.created_at)
+
+
+def message_export_statement(
+    organization_id: str,
+    conversation_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    bot_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """组织的消息（按对话、时间排序），可按对话、用户、机器人和时间范围过滤"""
+    statement = select(
+        Message.id,
+        Message.conversation_id,
+        Conversation.bot_id,
+        Message.user_id,
+        Message.role,
+        Message.content,
+        Message.is_truncated,
+        Message.created_at,
+    ).join(
+        Conversation, Conversation.id == Message.conversation_id
+    ).where(
+        Conversation.organization_id == organization_id
+    )
+    if conversation_id:
+        statement = statement.where(Message.conversation_id == conversation_id)
+    if user_id:
+        statement = statement.where(Conversation.user_id == user_id)
+    if bot_id:
+        statement = statement.where(Conversation.bot_id == bot_id)
+    if start:
+        statement = statement.where(Message.created_at >= start)
+    if end:
+        statement = statement.where(Message.created_at < end)
+    return statement.order_by(Message.conversation_id, Message.created_at)
+
+
+async def stream_export(
+    kind: str,
+    statement,
+    columns: Sequence[str],
+    fmt: str,
+    gzip: bool = False,
+    batch_size: Optional[int] = None,
+    chunk_bytes: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    用服务端游标执行查询并逐块产出编码后的数据
+
+    Args:
+        kind: 导出类型（指标标签）
+        statement: 查询，列顺序与 columns 一致
+        columns: 列名（CSV 表头、NDJSON 字段名）
+        fmt: csv 或 ndjson
+        gzip: 是否 gzip 压缩
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    encoder = ExportEncoder(fmt, columns, gzip=gzip, chunk_bytes=chunk_bytes or settings.EXPORT_CHUNK_BYTES)
+    rows = 0
+    written = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(statement.execution_options(yield_per=batch_size))
+            async for partition in result.partitions():
+                for row in partition:
+                    chunk = encoder.write(row)
+                    if chunk:
+                        written += len(chunk)
+                        yield chunk
+                rows += len(partition)
+
+        chunk = encoder.finish()
+        if chunk:
+            written += len(chunk)
+            yield chunk
+    finally:
+        export_rows.inc(rows, kind=kind, format=fmt)
+        export_bytes.inc(written, kind=kind, format=fmt)
+
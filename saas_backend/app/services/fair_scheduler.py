@@ -0,0 +1,309 @@
+"""
+上游调用公平调度
+所有租户共用一个 Coze Token，单个租户突发流量可能占满上游并发，饿死其他租户。
+调度器限制全局与单租户的在途调用数；超出时按加权公平排队（WFQ）：
+每个请求的虚拟完成时间 = max(全局虚拟时间, 该租户上一个请求的虚拟完成时间) + 1 / 权重，
+空出名额时优先放行虚拟完成时间最小、且未达到租户并发上限的请求。
+权重和并发上限来自订阅计划（SUBSCRIPTION_PLANS 的 scheduling_weight / concurrent_chats）；
+租户并发上限会限制原本不受限的免费版租户，需要显式开启（COZE_TENANT_CONCURRENCY_LIMITS），
+默认只有全局上限，名额用满后才按权重排队。
+指标按订阅计划汇总（不按组织 ID），时间序列数不随租户数增长。
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tracing import record_span
+from app.schemas.subscription import SUBSCRIPTION_PLANS
+
+
+queue_depth = metrics.gauge(
+    "coze_scheduler_queue_depth", "排队等待上游名额的请求数", ("plan",)
+)
+inflight_calls = metrics.gauge(
+    "coze_scheduler_inflight", "占用上游名额的在途调用数", ("plan",)
+)
+queue_wait = metrics.histogram(
+    "coze_scheduler_wait_seconds", "获取上游名额的排队时间（秒）", ("plan",)
+)
+rejected_calls = metrics.counter(
+    "coze_scheduler_rejected_total", "排队超时被拒绝的请求数", ("plan",)
+)
+
+
+class SchedulerTimeout(Exception):
+    """排队超时"""
+
+    def __init__(self, organization_id: str, waited: float):
+        self.organization_id = organization_id
+        self.waited = waited
+        super().__init__(f"Upstream queue wait exceeded {waited:.1f}s")
+
+
+class _Waiter:
+    """排队中的请求"""
+
+    __slots__ = ("finish_tag", "future")
+
+    def __init__(self, finish_tag: float, future: asyncio.Future):
+        self.finish_tag = finish_tag
+        self.future = future
+
+
+class _OrgState:
+    """单个租户的调度状态"""
+
+    __slots__ = ("plan", "weight", "max_inflight", "inflight", "last_finish_tag", "waiters")
+
+    def __init__(self, plan: str, weight: float, max_inflight: int):
+        # 订阅计划（指标标签）
+        self.plan = plan
+        self.weight = weight
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.last_finish_tag = 0.0
+        self.waiters: Deque[_Waiter] = deque()
+
+
+def plan_key(plan_type: Any) -> str:
+    """订阅计划键（未知计划按免费版）"""
+    key = getattr(plan_type, "value", plan_type) or "free"
+    return key if key in SUBSCRIPTION_PLANS else "free"
+
+
+def plan_limits(plan_type: Any) -> Tuple[float, int]:
+    """
+    获取订阅计划的调度参数
+
+    Returns:
+        (调度权重, 租户并发上限，-1 表示不限)
+    """
+    plan = SUBSCRIPTION_PLANS[plan_key(plan_type)]
+    return (
+        float(plan.limits.get("scheduling_weight", 1)),
+        int(plan.limits.get("concurrent_chats", -1)),
+    )
+
+
+class FairScheduler:
+    """加权公平调度器（单进程内生效，多 worker 时上限按 worker 数折算）"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 100,
+        max_queue_wait: float = 10.0,
+        enabled: bool = True,
+        tenant_limits: bool = False,
+    ):
+        """
+        Args:
+            max_concurrency: 全局在途上游调用上限
+            max_queue_wait: 最长排队时间（秒），超时抛出 SchedulerTimeout
+            enabled: 关闭时不做任何限制
+            tenant_limits: 是否按订阅计划的 concurrent_chats 限制租户并发
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_wait = max_queue_wait
+        self.enabled = enabled
+        self.tenant_limits = tenant_limits
+
+        self._inflight = 0
+        self._queued = 0
+        self._virtual_time = 0.0
+        self._orgs: Dict[str, _OrgState] = {}
+
+    @asynccontextmanager
+    async def slot(self, organization_id: str, plan_type: Any = None) -> AsyncIterator[None]:
+        """
+        占用一个上游名额，退出时归还
+
+        用法:
+            async with fair_scheduler.slot(org.id, org.plan_type):
+                ...
+
+        Raises:
+            SchedulerTimeout: 排队超过 max_queue_wait
+        """
+        if not self.enabled:
+            yield
+            return
+
+        await self.acquire(organization_id, plan_type)
+        try:
+            yield
+        finally:
+            self.release(organization_id)
+
+    async def acquire(self, organization_id: str, plan_type: Any = None) -> None:
+        """申请上游名额（排队直到获得名额或超时）"""
+        org = self._org_state(organization_id, plan_type)
+
+        # 虚拟完成时间：空闲后重新活跃的租户从当前虚拟时间起算，不会因“攒下”的份额插队
+        finish_tag = max(self._virtual_time, org.last_finish_tag) + 1.0 / org.weight
+        org.last_finish_tag = finish_tag
+
+        # 没有排队请求时直接放行，否则排队（新请求不能插队）
+        if not self._queued and self._can_dispatch(org):
+            self._grant(organization_id, org, finish_tag)
+            queue_wait.observe(0.0, plan=org.plan)
+            record_span("queue", 0.0)
+            return
+
+        waiter = _Waiter(finish_tag, asyncio.get_running_loop().create_future())
+        org.waiters.append(waiter)
+        self._queued += 1
+        queue_depth.inc(plan=org.plan)
+
+        # 排队的请求可能都属于已达上限的租户，此时本请求可以立即放行
+        self._dispatch()
+        if waiter.future.done():
+            queue_wait.observe(0.0, plan=org.plan)
+            record_span("queue", 0.0)
+            return
+
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_queue_wait)
+        except asyncio.TimeoutError:
+            waited = time.monotonic() - started
+            if self._abandon(organization_id, org, waiter):
+                rejected_calls.inc(plan=org.plan)
+                queue_wait.observe(waited, plan=org.plan)
+                record_span("queue", waited)
+                raise SchedulerTimeout(organization_id, waited) from None
+        except asyncio.CancelledError:
+            # 请求被取消（如客户端断开）：已获得的名额要归还
+            if not self._abandon(organization_id, org, waiter):
+                self.release(organization_id)
+            raise
+
+        waited = time.monotonic() - started
+        queue_wait.observe(waited, plan=org.plan)
+        record_span("queue", waited)
+
+    def release(self, organization_id: str) -> None:
+        """归还上游名额并放行排队请求"""
+        org = self._orgs.get(organization_id)
+        if org is None:
+            return
+        org.inflight -= 1
+        self._inflight -= 1
+        inflight_calls.dec(plan=org.plan)
+        self._dispatch()
+
+    def _org_state(self, organization_id: str, plan_type: Any) -> _OrgState:
+        """获取租户状态（套餐变更时更新权重和上限）"""
+        plan = plan_key(plan_type)
+        weight, max_inflight = plan_limits(plan)
+        if not self.tenant_limits:
+            max_inflight = -1
+        org = self._orgs.get(organization_id)
+        if org is None:
+            org = _OrgState(plan, weight, max_inflight)
+            self._orgs[organization_id] = org
+        else:
+            if org.plan != plan:
+                # 在途和排队中的请求计入新计划的指标
+                inflight_calls.dec(org.inflight, plan=org.plan)
+                inflight_calls.inc(org.inflight, plan=plan)
+                queue_depth.dec(len(org.waiters), plan=org.plan)
+                queue_depth.inc(len(org.waiters), plan=plan)
+                org.plan = plan
+            org.weight = weight
+            org.max_inflight = max_inflight
+        return org
+
+    def _can_dispatch(self, org: _OrgState) -> bool:
+        """全局和租户都有空余名额"""
+        return self._inflight < self.max_concurrency and (
+            org.max_inflight < 0 or org.inflight < org.max_inflight
+        )
+
+    def _grant(self, organization_id: str, org: _OrgState, finish_tag: float) -> None:
+        """占用名额并推进虚拟时间"""
+        org.inflight += 1
+        self._inflight += 1
+        self._virtual_time = max(self._virtual_time, finish_tag - 1.0 / org.weight)
+        inflight_calls.inc(plan=org.plan)
+
+    def _dispatch(self) -> None:
+        """按虚拟完成时间依次放行排队请求，直到名额用完"""
+        while self._queued and self._inflight < self.max_concurrency:
+            best: Optional[Tuple[str, _OrgState]] = None
+            for organization_id, org in self._orgs.items():
+                if not org.waiters or not self._can_dispatch(org):
+                    continue
+                if best is None or org.waiters[0].finish_tag < best[1].waiters[0].finish_tag:
+                    best = (organization_id, org)
+
+            if best is None:
+                break
+
+            organization_id, org = best
+            waiter = org.waiters.popleft()
+            self._queued -= 1
+            queue_depth.dec(plan=org.plan)
+            self._grant(organization_id, org, waiter.finish_tag)
+            waiter.future.set_result(None)
+
+        self._gc()
+
+    def _abandon(self, organization_id: str, org: _OrgState, waiter: _Waiter) -> bool:
+        """
+        放弃排队
+
+        Returns:
+            True 表示已从队列移除；False 表示放弃前已获得名额
+        """
+        if waiter.future.done():
+            return False
+        org.waiters.remove(waiter)
+        self._queued -= 1
+        waiter.future.cancel()
+        queue_depth.dec(plan=org.plan)
+        self._gc()
+        return True
+
+    def _gc(self) -> None:
+        """清理空闲租户的状态"""
+        if len(self._orgs) < 1024:
+            return
+        for organization_id in [
+            key for key, org in self._orgs.items()
+            if not org.waiters and org.inflight == 0 and org.last_finish_tag <= self._virtual_time
+        ]:
+            del self._orgs[organization_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取调度状态（只列出有在途或排队请求的租户）"""
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "tenant_limits": self.tenant_limits,
+            "inflight": self._inflight,
+            "queued": self._queued,
+            "organizations": {
+                organization_id: {
+                    "inflight": org.inflight,
+                    "queued": len(org.waiters),
+                    "max_inflight": org.max_inflight,
+                    "weight": org.weight,
+                }
+                for organization_id, org in self._orgs.items()
+                if org.inflight or org.waiters
+            },
+        }
+
+
+# 全局上游调度实例
+fair_scheduler = FairScheduler(
+    max_concurrency=settings.COZE_MAX_CONCURRENCY,
+    max_queue_wait=settings.COZE_QUEUE_TIMEOUT,
+    enabled=settings.COZE_SCHEDULER_ENABLED,
+    tenant_limits=settings.COZE_TENANT_CONCURRENCY_LIMITS,
+)
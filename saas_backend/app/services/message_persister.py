@@ -0,0 +1,299 @@
+"""
+消息异步批量持久化服务（write-behind）
+流式聊天的消息写入先进入进程内有界队列，由后台任务按时间窗口/批量大小合并为
+一条多行 INSERT 和一条 UPDATE，请求路径上不再等待数据库提交
+"""
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, insert, update
+from sqlalchemy.exc import OperationalError, StatementError
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+
+
+class PersistQueueFull(Exception):
+    """持久化队列已满（背压超时）"""
+
+
+def _error_message(error: BaseException) -> str:
+    """错误信息（SQLAlchemy 异常只取驱动错误，不带 SQL 参数，避免把消息内容写进日志）"""
+    if isinstance(error, StatementError) and error.orig is not None:
+        return f"{type(error.orig).__name__}: {error.orig}"
+    return f"{type(error).__name__}: {error}"
+
+
+class MessagePersister:
+    """消息批量持久化器"""
+
+    def __init__(
+        self,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        enqueue_timeout: float = 5.0,
+        max_retries: int = 3,
+    ):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # 统计
+        self.flushes = 0
+        self.messages_written = 0
+        self.failed_messages = 0
+
+    @property
+    def running(self) -> bool:
+        """后台刷写任务是否在运行"""
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """启动后台刷写任务（在应用 lifespan 启动阶段调用）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止并刷写队列中剩余的全部消息（在应用 lifespan 关闭阶段调用）
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        # 唤醒可能正在等待的后台任务
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def enqueue_message(
+        self,
+        conversation_id: str,
+        user_id: str,
+        role: str,
+        content: str,
+        coze_message_id: Optional[str] = None,
+        message_count_delta: int = 0,
+        coze_conversation_id: Optional[str] = None,
+        is_truncated: bool = False,
+    ) -> str:
+        """
+        消息入队（写后持久化）
+
+        队列已满时等待（背压），超过 enqueue_timeout 仍无空位则抛出 PersistQueueFull。
+
+        Args:
+            conversation_id: 对话 ID
+            user_id: 用户 ID
+            role: 消息角色
+            content: 消息内容
+            coze_message_id: Coze 消息 ID
+            message_count_delta: 对话消息计数增量
+            coze_conversation_id: Coze 对话 ID（用于回写对话）
+            is_truncated: 回复是否不完整（客户端断开或上游出错）
+
+        Returns:
+            消息 ID（入队时预先生成）
+        """
+        item = {
+            "row": {
+                "id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "role": role,
+                "content": content,
+                "coze_message_id": coze_message_id,
+                "is_truncated": is_truncated,
+                # 入队时间即消息时间，保证批量写入后排序正确
+                "created_at": datetime.utcnow(),
+            },
+            "message_count_delta": message_count_delta,
+            "coze_conversation_id": coze_conversation_id,
+        }
+
+        if not self.running:
+            # 未启动（如脚本环境）时直接写入
+            await self._flush([item])
+            return item["row"]["id"]
+
+        try:
+            await asyncio.wait_for(self._queue.put(item), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise PersistQueueFull("Message persist queue is full")
+
+        return item["row"]["id"]
+
+    async def save_coze_conversation_id(self, conversation_id: str, coze_conversation_id: str) -> None:
+        """
+        立即写入对话的 Coze 对话 ID（不经过队列）
+
+        每个对话只写一次；若等批量刷写，紧接着的追问会读到空值，不带上下文调用 Coze。
+        """
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(conversation_id=coze_conversation_id, updated_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取持久化统计"""
+        return {
+            "running": self.running,
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "flushes": self.flushes,
+            "messages_written": self.messages_written,
+            "failed_messages": self.failed_messages,
+        }
+
+    async def _run(self) -> None:
+        """后台刷写循环：攒够 batch_size 条或到达 flush_interval 即刷写一次"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._queue.get()
+            batch = [] if item is None else [item]
+
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stopping:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is not None:
+                    batch.append(item)
+
+            if self._stopping:
+                # 关闭时取出队列中剩余的全部消息
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+
+            for start in range(0, len(batch), self.batch_size):
+                await self._flush_with_retry(batch[start:start + self.batch_size])
+
+            if self._stopping and self._queue.empty():
+                return
+
+    async def _flush_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        刷写一批消息
+
+        连接类错误（OperationalError：断连、锁等待超时等）整批退避重试；
+        其他错误多为个别行的数据问题，重试不会成功，拆分批次定位出错的行，只丢弃这些行。
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._flush(batch)
+                return
+            except OperationalError as e:
+                error = e
+                print(
+                    f"❌ Message persist flush failed (attempt {attempt}/{self.max_retries}): "
+                    f"{_error_message(e)}"
+                )
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.5 * attempt)
+            except Exception as e:
+                await self._flush_bisect(batch, e)
+                return
+
+        self._drop(batch, error)
+
+    async def _flush_bisect(self, batch: List[Dict[str, Any]], error: BaseException) -> None:
+        """二分写入整批失败的消息，只丢弃单独写入仍失败的行"""
+        if len(batch) == 1:
+            self._drop(batch, error)
+            return
+
+        middle = len(batch) // 2
+        for part in (batch[:middle], batch[middle:]):
+            try:
+                await self._flush(part)
+            except Exception as e:
+                await self._flush_bisect(part, e)
+
+    def _drop(self, batch: List[Dict[str, Any]], error: BaseException) -> None:
+        """记录丢弃的消息（只记录 ID，不记录内容），便于按 ID 排查"""
+        self.failed_messages += len(batch)
+        for item in batch:
+            row = item["row"]
+            print(
+                f"❌ Dropped message {row['id']} (conversation {row['conversation_id']}, "
+                f"role {row['role']}): {_error_message(error)}"
+            )
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        在一个事务中写入一批消息：
+        - 一条多行 INSERT 写入全部消息
+        - 一条 UPDATE（CASE 表达式）更新所有涉及对话的消息计数和 Coze 对话 ID
+        """
+        if not batch:
+            return
+
+        count_deltas: Dict[str, int] = {}
+        coze_conversation_ids: Dict[str, str] = {}
+        for item in batch:
+            conversation_id = item["row"]["conversation_id"]
+            if item["message_count_delta"]:
+                count_deltas[conversation_id] = (
+                    count_deltas.get(conversation_id, 0) + item["message_count_delta"]
+                )
+            if item["coze_conversation_id"]:
+                coze_conversation_ids[conversation_id] = item["coze_conversation_id"]
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Message).values([item["row"] for item in batch]))
+
+            conversation_ids = set(count_deltas) | set(coze_conversation_ids)
+            if conversation_ids:
+                values = {"updated_at": datetime.utcnow()}
+                if count_deltas:
+                    values["message_count"] = Conversation.message_count + case(
+                        count_deltas, value=Conversation.id, else_=0
+                    )
+                if coze_conversation_ids:
+                    values["conversation_id"] = case(
+                        coze_conversation_ids,
+                        value=Conversation.id,
+                        else_=Conversation.conversation_id,
+                    )
+                await db.execute(
+                    update(Conversation)
+                    .where(Conversation.id.in_(conversation_ids))
+                    .values(**values)
+                )
+
+            await db.commit()
+
+        self.flushes += 1
+        self.messages_written += len(batch)
+
+
+# 全局消息持久化实例
+message_persister = MessagePersister(
+    max_queue_size=settings.MESSAGE_PERSIST_QUEUE_SIZE,
+    batch_size=settings.MESSAGE_PERSIST_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_PERSIST_FLUSH_INTERVAL,
+    enqueue_timeout=settings.MESSAGE_PERSIST_ENQUEUE_TIMEOUT,
+)
@@ -0,0 +1,255 @@
+"""
+当前组织解析
+用户 → 成员记录 → 组织用一次 JOIN 查出（原来先查成员记录再查组织，要两次往返）。
+同一请求内由 FastAPI 依赖缓存保证只解析一次（deps.get_current_membership）；跨请求可选用进程内缓存：
+按用户缓存组织行的列值和成员角色，命中时把快照并入当前会话（merge(load=False)，不发查询）。
+成员增删、组织信息或计划变更时按用户 / 组织失效；多 worker 部署时其他进程中的旧条目最多保留 TTL。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.organization import Organization
+from app.models.organization_member import MemberRole, OrganizationMember
+
+
+cache_requests = metrics.counter(
+    "org_membership_cache_requests_total", "组织解析缓存查询次数", ("result",)
+)
+cache_evictions = metrics.counter(
+    "org_membership_cache_evictions_total", "组织解析缓存淘汰次数", ("reason",)
+)
+cache_entries = metrics.gauge("org_membership_cache_entries", "组织解析缓存条目数")
+
+
+@dataclass
+class OrgMembership:
+    """当前用户的组织及其成员角色"""
+    organization: Organization
+    role: Optional[MemberRole]
+
+
+@dataclass
+class CachedMembership:
+    """缓存的组织解析结果"""
+    organization_id: str
+    role: Optional[MemberRole]
+    # organizations 行的列值（不含关系）
+    values: Dict[str, Any]
+    expires_at: float
+
+    def detached(self) -> Organization:
+        """由列值构造一个游离态的组织对象（未加载的关系在并入会话后按需加载）"""
+        org = Organization(**self.values)
+        make_transient_to_detached(org)
+        return org
+
+
+def _membership_statement(user_id: str):
+    """用户的组织与角色（一个用户属于多个组织时取最早加入的）"""
+    return (
+        select(Organization, OrganizationMember.role)
+        .join(OrganizationMember, OrganizationMember.organization_id == Organization.id)
+        .where(OrganizationMember.user_id == user_id)
+        .order_by(OrganizationMember.joined_at)
+        .limit(1)
+    )
+
+
+class MembershipCache:
+    """组织解析缓存（TTL + LRU，按用户 / 组织失效）"""
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, CachedMembership]" = OrderedDict()
+        # 组织 ID -> 缓存了该组织的用户（组织变更时失效）
+        self._org_users: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[CachedMembership]:
+        """
+        查询用户的组织
+
+        Returns:
+            未过期的缓存条目；未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(user_id, entry)
+                cache_evictions.inc(reason="expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+
+        cache_requests.inc(result="hit" if entry is not None else "miss")
+        return entry
+
+    def peek(self, user_id: str) -> Optional[CachedMembership]:
+        """查询用户的组织但不计入命中统计、不调整 LRU 顺序（限流中间件使用）"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return entry
+
+    def set(self, user_id: str, organization: Organization, role: Optional[MemberRole]) -> None:
+        """缓存解析结果（只缓存属于组织的用户，新用户加入组织后无需失效）"""
+        if not self.enabled:
+            return
+
+        values = {
+            attr.key: getattr(organization, attr.key)
+            for attr in inspect(Organization).column_attrs
+        }
+        entry = CachedMembership(
+            organization_id=organization.id,
+            role=role,
+            values=values,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None:
+                self._discard_org_user(previous.organization_id, user_id)
+
+            self._entries[user_id] = entry
+            self._org_users.setdefault(entry.organization_id, set()).add(user_id)
+
+            while len(self._entries) > self.max_entries:
+                oldest, oldest_entry = next(iter(self._entries.items()))
+                self._remove(oldest, oldest_entry)
+                cache_evictions.inc(reason="capacity")
+
+            cache_entries.set(len(self._entries))
+
+    def invalidate_user(self, user_id: str) -> int:
+        """
+        使用户的缓存失效（加入、退出组织后调用）
+
+        Returns:
+            失效的条目数
+        """
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is None:
+                return 0
+            self._remove(str(user_id), entry)
+
+        cache_evictions.inc(reason="invalidated")
+        return 1
+
+    def invalidate_organization(self, organization_id: str) -> int:
+        """
+        使组织下所有用户的缓存失效（组织信息、计划、启用状态变更后调用）
+
+        Returns:
+            失效的条目数
+        """
+        with self._lock:
+            users = self._org_users.pop(str(organization_id), set())
+            for user_id in users:
+                self._entries.pop(user_id, None)
+            cache_entries.set(len(self._entries))
+
+        if users:
+            cache_evictions.inc(len(users), reason="invalidated")
+        return len(users)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._org_users.clear()
+            cache_entries.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存状态"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "organizations": len(self._org_users),
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+        }
+
+    def _remove(self, user_id: str, entry: CachedMembership) -> None:
+        """移除条目（调用方持有锁）"""
+        self._entries.pop(user_id, None)
+        self._discard_org_user(entry.organization_id, user_id)
+        cache_entries.set(len(self._entries))
+
+    def _discard_org_user(self, organization_id: str, user_id: str) -> None:
+        """从组织索引中移除用户（调用方持有锁）"""
+        users = self._org_users.get(organization_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._org_users[organization_id]
+
+
+def resolve_membership(db: Session, user_id: str) -> Optional[OrgMembership]:
+    """
+    解析用户的组织（同步会话）
+
+    Returns:
+        组织与角色；用户不属于任何组织时返回 None
+    """
+    cached = membership_cache.get(user_id)
+    if cached is not None:
+        return OrgMembership(db.merge(cached.detached(), load=False), cached.role)
+
+    row = db.execute(_membership_statement(user_id)).first()
+    if row is None:
+        return None
+
+    organization, role = row
+    membership_cache.set(user_id, organization, role)
+    return OrgMembership(organization, role)
+
+
+async def resolve_membership_async(db: AsyncSession, user_id: str) -> Optional[OrgMembership]:
+    """
+    解析用户的组织（异步会话，聊天热路径使用）
+
+    Returns:
+        组织与角色；用户不属于任何组织时返回 None
+    """
+    cached = membership_cache.get(user_id)
+    if cached is not None:
+        organization = await db.merge(cached.detached(), load=False)
+        return OrgMembership(organization, cached.role)
+
+    result = await db.execute(_membership_statement(user_id))
+    row = result.first()
+    if row is None:
+        return None
+
+    organization, role = row
+    membership_cache.set(user_id, organization, role)
+    return OrgMembership(organization, role)
+
+
+# 全局组织解析缓存实例
+membership_cache = MembershipCache(
+    ttl_seconds=settings.ORG_CACHE_TTL_SECONDS,
+    max_entries=settings.ORG_CACHE_MAX_ENTRIES,
+    enabled=settings.ORG_CACHE_ENABLED,
+)
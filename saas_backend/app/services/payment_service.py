@@ -13,6 +13,8 @@ from app.models.order import Order, OrderStatus, PaymentMethod
 from app.models.subscription import Subscription, SubscriptionStatus, BillingCycle
 from app.models.organization import Organization
 from app.schemas.payment import PaymentResponse
+from app.services.api_key_service import api_key_cache
+from app.services.org_membership import membership_cache
 from app.core.config import settings
 
 
@@ -289,3 +291,6 @@ class PaymentService:
             organization.plan_type = order.plan_type
 
         self.db.commit()
+        # 计划变更立即对该组织的成员和 API 密钥生效
+        membership_cache.invalidate_organization(order.organization_id)
+        api_key_cache.invalidate_organization(order.organization_id)
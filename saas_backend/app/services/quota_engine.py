@@ -0,0 +1,186 @@
+"""
+用量配额引擎
+按组织在内存中维护当前计费周期（自然月）的各资源用量：首次检查时用一次 GROUP BY 从日汇总表
+（当天读明细）加上本进程尚未刷写的增量装载，之后每记录一个使用量事件就在锁内累加。
+检查只做字典查找和比较，不访问数据库，可以在每条聊天消息调用上游之前执行。
+
+多 worker 部署时其他进程记录的用量在后台重新装载（每 QUOTA_RESYNC_SECONDS 秒）后可见，
+并发请求可能使用量略超上限，超出量不超过各 worker 在一个同步间隔内的用量。
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
+from app.services.usage_service import resource_limit, usage_totals_statement
+
+
+quota_checks = metrics.counter("quota_checks_total", "配额检查次数", ("resource_type", "result"))
+quota_loads = metrics.counter("quota_loads_total", "配额用量装载次数", ("reason",))
+quota_entries = metrics.gauge("quota_entries", "内存中维护用量的组织数")
+
+
+@dataclass
+class OrgUsage:
+    """组织在当前计费周期的用量"""
+    period_start: date
+    used: Dict[str, int]
+    loaded_at: float
+
+
+def current_period_start() -> date:
+    """当前计费周期的开始日期（与使用量统计的默认周期一致）"""
+    return date.today().replace(day=1)
+
+
+class QuotaEngine:
+    """配额引擎"""
+
+    def __init__(self, resync_seconds: float = 60, max_entries: int = 100000):
+        self.resync_seconds = resync_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, OrgUsage] = {}
+        self._lock = threading.Lock()
+        # 组织 ID -> 正在进行的装载（合并并发装载）
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def check_loaded(
+        self,
+        organization_id: str,
+        plan_type: Any,
+        resource_type: str,
+        quantity: int = 1,
+    ) -> Optional[bool]:
+        """
+        用内存中的用量检查（不访问数据库）
+
+        Returns:
+            是否允许；用量未装载或已跨周期时返回 None
+        """
+        limit = resource_limit(plan_type, resource_type)
+        if limit is None or limit < 0:
+            # 未知资源类型或无限
+            return True
+
+        entry = self._entries.get(str(organization_id))
+        if entry is None or entry.period_start != current_period_start():
+            return None
+
+        allowed = entry.used.get(resource_type, 0) + quantity <= limit
+        quota_checks.inc(resource_type=resource_type, result="allowed" if allowed else "exceeded")
+        return allowed
+
+    async def check(
+        self,
+        organization_id: str,
+        plan_type: Any,
+        resource_type: str,
+        quantity: int = 1,
+    ) -> bool:
+        """
+        检查组织本周期的用量加上 quantity 是否超出计划上限
+
+        用量未装载时先装载（一次查询）；装载失败时抛出异常，不会放行。
+        超过同步间隔时仍用内存中的用量判断，同时在后台重新装载。
+        """
+        organization_id = str(organization_id)
+        allowed = self.check_loaded(organization_id, plan_type, resource_type, quantity)
+        if allowed is None:
+            await asyncio.shield(self._start_load(organization_id))
+            allowed = self.check_loaded(organization_id, plan_type, resource_type, quantity)
+        elif self.needs_resync(organization_id):
+            self._start_load(organization_id)
+        return allowed
+
+    def needs_resync(self, organization_id: str) -> bool:
+        """用量是否超过同步间隔未从数据库重新装载"""
+        entry = self._entries.get(str(organization_id))
+        return entry is None or time.time() - entry.loaded_at > self.resync_seconds
+
+    async def load(self, organization_id: str) -> None:
+        """
+        从数据库装载组织本周期的用量
+
+        装载期间持有累加器的刷写锁：正在写库的批次已不在未刷写增量中、可能也还没提交，
+        不持锁时两边都读不到这一批。
+        """
+        from app.services.usage_accumulator import usage_accumulator
+
+        organization_id = str(organization_id)
+        period_start = current_period_start()
+        statement = usage_totals_statement(organization_id, period_start, date.today())
+        async with usage_accumulator.flush_lock:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(statement)).all()
+            self.install(organization_id, period_start, {rt: int(total or 0) for rt, total in rows})
+
+    def install(self, organization_id: str, period_start: date, totals: Dict[str, int]) -> None:
+        """
+        设置组织的用量（已写库的总量 + 本进程尚未刷写的增量）
+
+        读取未刷写增量与替换条目之间没有 await，期间记录的事件不会遗漏；
+        调用方需持有累加器的刷写锁（见 load）。
+        """
+        from app.services.usage_accumulator import usage_accumulator
+
+        organization_id = str(organization_id)
+        used = dict(totals)
+        for resource_type, quantity in usage_accumulator.pending_totals(organization_id, period_start).items():
+            used[resource_type] = used.get(resource_type, 0) + quantity
+
+        with self._lock:
+            reason = "resync" if organization_id in self._entries else "initial"
+            self._entries[organization_id] = OrgUsage(period_start=period_start, used=used, loaded_at=time.time())
+            if len(self._entries) > self.max_entries:
+                # 容量超限时清空，按需重新装载
+                self._entries = {organization_id: self._entries[organization_id]}
+            quota_entries.set(len(self._entries))
+        quota_loads.inc(reason=reason)
+
+    def add(self, organization_id: str, resource_type: str, quantity: int = 1) -> None:
+        """累加一个使用量事件（用量未装载时忽略，装载时会从数据库读到）"""
+        with self._lock:
+            entry = self._entries.get(str(organization_id))
+            if entry is not None and entry.period_start == current_period_start():
+                entry.used[resource_type] = entry.used.get(resource_type, 0) + quantity
+
+    def _start_load(self, organization_id: str) -> asyncio.Task:
+        """开始装载（同一组织同时只有一个装载任务）"""
+        task = self._loading.get(organization_id)
+        if task is None:
+            task = asyncio.create_task(self.load(organization_id))
+            self._loading[organization_id] = task
+            task.add_done_callback(lambda done: self._load_done(organization_id, done))
+        return task
+
+    def _load_done(self, organization_id: str, task: asyncio.Task) -> None:
+        """装载结束"""
+        self._loading.pop(organization_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Quota usage load failed for {organization_id}: {task.exception()}")
+
+    def clear(self) -> None:
+        """清空所有组织的用量"""
+        with self._lock:
+            self._entries.clear()
+            quota_entries.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取配额引擎状态"""
+        return {
+            "organizations": len(self._entries),
+            "resync_seconds": self.resync_seconds,
+            "max_entries": self.max_entries,
+        }
+
+
+# 全局配额引擎实例
+quota_engine = QuotaEngine(
+    resync_seconds=settings.QUOTA_RESYNC_SECONDS,
+    max_entries=settings.QUOTA_MAX_ENTRIES,
+)
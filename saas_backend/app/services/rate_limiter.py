@@ -0,0 +1,279 @@
+"""
+限流引擎（滑动窗口计数）
+每个限流键、每个窗口只保存当前窗口和上一个窗口的计数，按上一个窗口在滑动窗口内的剩余比例加权估算请求数：
+    估算值 = 上一窗口计数 × (1 - 当前窗口已过比例) + 当前窗口计数
+每个键的内存占用固定（O(1)），精度与真正的滑动日志相差很小。被拒绝的请求不计数。
+
+两种存储：
+    memory  进程内（LRU 限制键的总数），多 worker 时上限按 worker 数放大
+    redis   Lua 脚本在一次往返内检查并递增全部窗口，多 worker / 多实例共享计数
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.subscription import SUBSCRIPTION_PLANS
+
+
+MINUTE = 60
+HOUR = 3600
+
+rate_limit_requests = metrics.counter(
+    "rate_limit_requests_total", "限流检查次数", ("kind", "result")
+)
+rate_limit_backend_errors = metrics.counter(
+    "rate_limit_backend_errors_total", "限流存储异常次数（异常时放行）"
+)
+rate_limit_keys = metrics.gauge("rate_limit_memory_keys", "进程内限流存储的键数")
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """一个窗口的上限"""
+    limit: int
+    window: int
+
+
+@dataclass
+class RateLimitResult:
+    """限流检查结果"""
+    allowed: bool
+    # 被拒绝时建议的重试等待（秒）
+    retry_after: float = 0.0
+    # 触发拒绝的窗口
+    limit: Optional[RateLimit] = None
+
+
+def plan_rate_limits(plan_type: Any) -> Tuple[RateLimit, ...]:
+    """订阅计划的请求速率上限（计划未知时取免费版）"""
+    plan_key = getattr(plan_type, "value", plan_type) or "free"
+    plan = SUBSCRIPTION_PLANS.get(plan_key, SUBSCRIPTION_PLANS["free"])
+    return (
+        RateLimit(int(plan.limits.get("requests_per_minute", settings.RATE_LIMIT_PER_MINUTE)), MINUTE),
+        RateLimit(int(plan.limits.get("requests_per_hour", settings.RATE_LIMIT_PER_HOUR)), HOUR),
+    )
+
+
+def anonymous_rate_limits() -> Tuple[RateLimit, ...]:
+    """按 IP 限流的上限（未登录或凭据未经验证的请求）"""
+    return (
+        RateLimit(settings.RATE_LIMIT_PER_MINUTE, MINUTE),
+        RateLimit(settings.RATE_LIMIT_PER_HOUR, HOUR),
+    )
+
+
+def tenant_rate_limits() -> Tuple[RateLimit, ...]:
+    """公开租户接口按租户汇总的上限"""
+    return (RateLimit(settings.RATE_LIMIT_TENANT_PER_MINUTE, MINUTE),)
+
+
+def _retry_after(limit: int, window: int, elapsed: float, current: int, previous: int) -> float:
+    """
+    估算值降到 limit - 1 以下（即可以再放行一个请求）还需要等待的时间
+
+    当前窗口计数已满时要等到下一个窗口，届时当前计数成为“上一窗口计数”。
+    """
+    capacity = limit - 1
+    if current <= capacity:
+        if previous <= 0:
+            return 0.0
+        needed = 1 - (capacity - current) / previous
+        return max(0.0, needed * window - elapsed)
+
+    if current <= 0:
+        return window - elapsed
+    needed = max(0.0, 1 - capacity / current)
+    return (window - elapsed) + needed * window
+
+
+class MemoryRateLimitStore:
+    """进程内存储（每个键固定 3 个数 × 窗口数，LRU 限制键的总数）"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # 键 -> 每个窗口的 [窗口序号, 当前窗口计数, 上一窗口计数]
+        self._counters: "OrderedDict[str, List[List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, limits: Sequence[RateLimit], now: Optional[float] = None) -> RateLimitResult:
+        """检查并计数（所有窗口都未超限时才计数）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            counters = self._counters.get(key)
+            if counters is None or len(counters) != len(limits):
+                counters = [[0, 0, 0] for _ in limits]
+                self._counters[key] = counters
+                while len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+                rate_limit_keys.set(len(self._counters))
+            else:
+                self._counters.move_to_end(key)
+
+            for counter, rate_limit in zip(counters, limits):
+                index = int(now // rate_limit.window)
+                if counter[0] != index:
+                    # 进入新窗口：相邻窗口的计数成为上一窗口计数，更早的作废
+                    counter[2] = counter[1] if counter[0] == index - 1 else 0
+                    counter[1] = 0
+                    counter[0] = index
+
+            for counter, rate_limit in zip(counters, limits):
+                elapsed = now - counter[0] * rate_limit.window
+                estimated = counter[2] * (1 - elapsed / rate_limit.window) + counter[1]
+                if estimated + 1 > rate_limit.limit:
+                    return RateLimitResult(
+                        allowed=False,
+                        retry_after=_retry_after(
+                            rate_limit.limit, rate_limit.window, elapsed, counter[1], counter[2]
+                        ),
+                        limit=rate_limit,
+                    )
+
+            for counter in counters:
+                counter[1] += 1
+        return RateLimitResult(allowed=True)
+
+    def clear(self) -> None:
+        """清空计数"""
+        with self._lock:
+            self._counters.clear()
+            rate_limit_keys.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储状态"""
+        return {"backend": "memory", "keys": len(self._counters), "max_keys": self.max_keys}
+
+
+# KEYS: 每个窗口两个键（当前窗口、上一窗口）；ARGV: 每个窗口的 上限、窗口长度、当前窗口已过秒数
+# 返回 {是否放行, 触发拒绝的窗口序号（从 1 开始）, 当前计数, 上一窗口计数}
+_SLIDING_WINDOW_SCRIPT = """
+local windows = #KEYS / 2
+for i = 1, windows do
+    local limit = tonumber(ARGV[i * 3 - 2])
+    local window = tonumber(ARGV[i * 3 - 1])
+    local elapsed = tonumber(ARGV[i * 3])
+    local current = tonumber(redis.call('GET', KEYS[i * 2 - 1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[i * 2]) or '0')
+    if previous * (1 - elapsed / window) + current + 1 > limit then
+        return {0, i, current, previous}
+    end
+end
+for i = 1, windows do
+    redis.call('INCR', KEYS[i * 2 - 1])
+    redis.call('EXPIRE', KEYS[i * 2 - 1], tonumber(ARGV[i * 3 - 1]) * 2)
+end
+return {1, 0, 0, 0}
+"""
+
+
+class RedisRateLimitStore:
+    """Redis 存储（多 worker / 多实例共享计数；Redis 不可用时放行）"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+        self._script = None
+
+    def _get_script(self):
+        """首次使用时创建客户端并注册脚本（redis 为可选依赖）"""
+        if self._script is None:
+            import redis.asyncio as redis
+
+            self._client = redis.from_url(self.url)
+            self._script = self._client.register_script(_SLIDING_WINDOW_SCRIPT)
+        return self._script
+
+    async def hit(self, key: str, limits: Sequence[RateLimit], now: Optional[float] = None) -> RateLimitResult:
+        """检查并计数（一次往返）"""
+        now = time.time() if now is None else now
+        keys: List[str] = []
+        args: List[Any] = []
+        for rate_limit in limits:
+            index = int(now // rate_limit.window)
+            keys.append(f"{self.prefix}:{key}:{rate_limit.window}:{index}")
+            keys.append(f"{self.prefix}:{key}:{rate_limit.window}:{index - 1}")
+            args.extend((rate_limit.limit, rate_limit.window, now - index * rate_limit.window))
+
+        try:
+            allowed, position, current, previous = await self._get_script()(keys=keys, args=args)
+        except Exception as e:
+            rate_limit_backend_errors.inc()
+            print(f"⚠️ Rate limit backend error, allowing request: {e}")
+            return RateLimitResult(allowed=True)
+
+        if allowed:
+            return RateLimitResult(allowed=True)
+
+        rate_limit = limits[int(position) - 1]
+        elapsed = now - int(now // rate_limit.window) * rate_limit.window
+        return RateLimitResult(
+            allowed=False,
+            retry_after=_retry_after(rate_limit.limit, rate_limit.window, elapsed, int(current), int(previous)),
+            limit=rate_limit,
+        )
+
+    async def close(self) -> None:
+        """关闭连接"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._script = None
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储状态"""
+        return {"backend": "redis", "connected": self._client is not None}
+
+
+class RateLimiter:
+    """限流器"""
+
+    def __init__(self, store, enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+
+    async def check(self, kind: str, key: str, limits: Sequence[RateLimit]) -> RateLimitResult:
+        """
+        检查一个限流键
+
+        Args:
+            kind: 键的类型（user / api_key / tenant / ip），用于指标
+            key: 限流键
+            limits: 各窗口的上限
+        """
+        result = await self.store.hit(f"{kind}:{key}", limits)
+        rate_limit_requests.inc(kind=kind, result="allowed" if result.allowed else "limited")
+        return result
+
+    async def close(self) -> None:
+        """关闭存储（应用关闭时调用）"""
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            await close()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取限流器状态"""
+        return {"enabled": self.enabled, **self.store.stats()}
+
+
+def create_rate_limiter() -> RateLimiter:
+    """按配置创建限流器"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        store = RedisRateLimitStore(settings.REDIS_URL)
+    else:
+        store = MemoryRateLimitStore(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+    return RateLimiter(store, enabled=settings.RATE_LIMIT_ENABLED)
+
+
+# 全局限流器实例
+rate_limiter = create_rate_limiter()
+
+
+def retry_after_header(result: RateLimitResult) -> str:
+    """Retry-After 头（整数秒，至少 1）"""
+    return str(max(1, math.ceil(result.retry_after)))
@@ -0,0 +1,57 @@
+"""
+SSE 帧编码器
+流式聊天每个增量都要编码一帧；固定字段（type、message_id、conversation_id）预先渲染为模板，
+增量内容只做 JSON 字符串转义，避免每帧构造 pydantic 模型再序列化。
+输出与 ChatStreamChunk.model_dump_json() 逐字节一致。
+"""
+from json.encoder import encode_basestring
+from typing import Optional
+
+
+def _json_string(value: Optional[str]) -> str:
+    """编码 JSON 字符串字面量（None 编码为 null）"""
+    return "null" if value is None else encode_basestring(value)
+
+
+_MESSAGE_PREFIX = 'data: {"type":"message","content":'
+_FRAME_END = "}\n\n"
+
+# 完成帧是常量
+DONE_FRAME = (
+    'data: {"type":"done","content":null,"message_id":null,'
+    '"conversation_id":null,"error":null}\n\n'
+)
+
+
+class SSEFrameEncoder:
+    """单个流式响应的 SSE 帧编码器"""
+
+    def __init__(self, conversation_id: Optional[str]):
+        # 帧尾：conversation_id 在整个流中不变
+        self._tail = (
+            ',"conversation_id":' + _json_string(conversation_id)
+            + ',"error":null' + _FRAME_END
+        )
+        # message_id 通常在一条回复中不变，缓存其渲染结果
+        self._message_id: Optional[str] = None
+        self._message_id_part = ',"message_id":null'
+
+    def message(self, content: str, message_id: Optional[str] = None) -> str:
+        """编码消息增量帧"""
+        if message_id != self._message_id:
+            self._message_id = message_id
+            self._message_id_part = ',"message_id":' + _json_string(message_id)
+        return _MESSAGE_PREFIX + encode_basestring(content) + self._message_id_part + self._tail
+
+    @staticmethod
+    def done() -> str:
+        """编码完成帧"""
+        return DONE_FRAME
+
+    @staticmethod
+    def error(error: str) -> str:
+        """编码错误帧"""
+        return (
+            'data: {"type":"error","content":null,"message_id":null,'
+            '"conversation_id":null,"error":' + _json_string(error) + _FRAME_END
+        )
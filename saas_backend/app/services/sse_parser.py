@@ -0,0 +1,178 @@
+"""
+增量 SSE 解析器
+直接处理 aiter_raw() 的字节块：字节缓冲区复用，每次 feed 对最后一个事件边界（空行）之前的内容
+做一次切分并整理一次缓冲区，常见的 event + data 两行事件块走快速路径，半帧不重复扫描；支持多行 data、event / id / retry 字段、CRLF / LF / CR 换行以及跨块的半帧。
+data 保留为原始字节，调用方只对需要的事件做解码。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+# json.loads 对 bytes 会先做编码探测；SSE 规定为 UTF-8，直接解码后交给解码器更快
+_decode_json = json.JSONDecoder().decode
+
+
+class SSEEvent:
+    """一个 SSE 事件"""
+
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(self, event: str, data: bytes, id: Optional[str], retry: Optional[int]):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    def text(self) -> str:
+        """data 解码为字符串"""
+        return self.data.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        """data 解析为 JSON"""
+        return _decode_json(self.data.decode("utf-8"))
+
+    def __repr__(self):
+        return f"<SSEEvent {self.event}: {self.data[:50]!r}>"
+
+
+class SSEParser:
+    """增量 SSE 解析器（按 WHATWG EventSource 规范）"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # 下次查找事件边界的起点，避免半帧被重复扫描
+        self._scan = 0
+        # 块末尾的 CR 暂存：下一块可能以 LF 开头（CRLF 被拆开）
+        self._pending_cr = False
+        # 事件名解码缓存（一个流里只有少数几种事件名）
+        self._names: Dict[bytes, str] = {}
+        # id 和 retry 在事件之间保持
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        输入一个字节块
+
+        Returns:
+            本次解析出的完整事件（未完成的半帧留在缓冲区）
+        """
+        if self._pending_cr or b"\r" in chunk:
+            chunk = self._normalize_newlines(chunk)
+
+        buffer = self._buffer
+        buffer += chunk
+
+        # 只处理到最后一个事件边界（空行）为止，之后的半帧留到下次
+        boundary = buffer.rfind(b"\n\n", self._scan)
+        if boundary == -1:
+            # 边界可能跨块：下次从缓冲区末尾的前一个字节开始找
+            self._scan = max(len(buffer) - 1, 0)
+            return []
+
+        # 一次 split 切出所有完整的事件块
+        blocks = bytes(buffer[:boundary]).split(b"\n\n")
+        del buffer[:boundary + 2]
+        self._scan = max(len(buffer) - 1, 0)
+
+        events: List[SSEEvent] = []
+        for block in blocks:
+            # 快速路径：Coze 的事件块固定为 "event:<名称>\ndata:<JSON>" 两行
+            if block[:6] == b"event:":
+                newline = block.find(b"\n")
+                if (
+                    newline > 0
+                    and block[newline + 1:newline + 6] == b"data:"
+                    and block.find(b"\n", newline + 1) == -1
+                ):
+                    name = block[6:newline]
+                    data = block[newline + 6:]
+                    events.append(SSEEvent(
+                        self._event_name(name[1:] if name[:1] == b" " else name),
+                        data[1:] if data[:1] == b" " else data,
+                        self.last_event_id,
+                        self.retry,
+                    ))
+                    continue
+            if block:
+                self._parse(block.split(b"\n"), events)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束：处理缓冲区中没有以空行结尾的最后一帧"""
+        if self._pending_cr:
+            self._pending_cr = False
+            self._buffer += b"\n"
+        if not self._buffer:
+            return []
+        lines = bytes(self._buffer).split(b"\n")
+        self._buffer.clear()
+        self._scan = 0
+        events: List[SSEEvent] = []
+        self._parse(lines, events)
+        return events
+
+    def _normalize_newlines(self, chunk: bytes) -> bytes:
+        """CRLF / CR 统一为 LF（只有出现 CR 时才需要）"""
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if chunk.endswith(b"\r"):
+            chunk = chunk[:-1]
+            self._pending_cr = True
+        return chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+    def _event_name(self, raw: bytes) -> str:
+        """解码事件名"""
+        name = self._names.get(raw)
+        if name is None:
+            name = raw.decode("utf-8", errors="replace")
+            if len(self._names) < 64:
+                self._names[raw] = name
+        return name
+
+    def _parse(self, lines: List[bytes], events: List[SSEEvent]) -> None:
+        """
+        逐行解析一个事件块（通用路径）
+
+        块总是以事件边界结束，事件状态只在本次调用内有效；块内的空行同样派发事件。
+        """
+        event_name: Optional[str] = None
+        data: List[bytes] = []
+
+        for line in lines + [b""]:
+            if not line:
+                # 空行：派发当前事件
+                if data:
+                    events.append(SSEEvent(
+                        event_name or "message",
+                        data[0] if len(data) == 1 else b"\n".join(data),
+                        self.last_event_id,
+                        self.retry,
+                    ))
+                    data = []
+                event_name = None
+                continue
+
+            colon = line.find(b":")
+            if colon == 0:
+                # 注释行（如 keep-alive）
+                continue
+            if colon == -1:
+                name, value = line, b""
+            else:
+                name = line[:colon]
+                value = line[colon + 1:]
+                if value[:1] == b" ":
+                    value = value[1:]
+
+            if name == b"data":
+                data.append(value)
+            elif name == b"event":
+                event_name = self._event_name(value)
+            elif name == b"id":
+                if b"\x00" not in value:
+                    self.last_event_id = value.decode("utf-8", errors="replace")
+            elif name == b"retry":
+                if value.isdigit():
+                    self.retry = int(value)
@@ -0,0 +1,202 @@
+"""
+JWT 校验与当前用户缓存
+聊天组件一个会话内会发出大量请求，每次都要解码 JWT 并查询 users 表。按 token 缓存解码后的声明和
+只读的用户快照：有效期取 TTL 与 token 过期时间的较小值；用户被修改或停用时按用户 ID 失效。
+缓存只在进程内生效，多 worker 部署时其他进程中的旧条目最多保留 TTL。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.user import User
+
+
+cache_requests = metrics.counter(
+    "auth_token_cache_requests_total", "Token 缓存查询次数", ("result",)
+)
+cache_evictions = metrics.counter(
+    "auth_token_cache_evictions_total", "Token 缓存淘汰次数", ("reason",)
+)
+cache_entries = metrics.gauge("auth_token_cache_entries", "Token 缓存条目数")
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    当前用户的只读快照
+
+    不绑定数据库会话、不含密码哈希，可以跨请求共享；字段与 User 模型一致，
+    可直接作为 response_model=User 返回。需要修改用户时使用 deps.get_current_user_model。
+    """
+    id: str
+    email: str
+    username: Optional[str]
+    phone: Optional[str]
+    avatar_url: Optional[str]
+    is_active: bool
+    is_verified: bool
+    is_admin: bool
+    is_org_admin: bool
+    wechat_openid: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserSnapshot":
+        """从 ORM 对象创建快照"""
+        return cls(
+            id=user.id,
+            email=user.email,
+            username=user.username,
+            phone=user.phone,
+            avatar_url=user.avatar_url,
+            is_active=bool(user.is_active),
+            is_verified=bool(user.is_verified),
+            is_admin=bool(user.is_admin),
+            is_org_admin=bool(user.is_org_admin),
+            wechat_openid=user.wechat_openid,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+        )
+
+
+@dataclass
+class CachedToken:
+    """缓存的 token 校验结果"""
+    claims: Dict[str, Any]
+    user: UserSnapshot
+    expires_at: float
+
+
+class TokenCache:
+    """Token 缓存（TTL + LRU，按用户 ID 失效）"""
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, CachedToken]" = OrderedDict()
+        # 用户 ID -> 该用户的 token（失效时使用）
+        self._user_tokens: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        """
+        查询 token
+
+        Returns:
+            未过期的缓存条目；未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(token, entry)
+                cache_evictions.inc(reason="expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(token)
+
+        cache_requests.inc(result="hit" if entry is not None else "miss")
+        return entry
+
+    def peek(self, token: str) -> Optional[CachedToken]:
+        """查询 token 但不计入命中统计、不调整 LRU 顺序（限流中间件使用）"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(token)
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return entry
+
+    def set(self, token: str, claims: Dict[str, Any], user: UserSnapshot) -> None:
+        """缓存校验通过的 token（有效期不超过 token 的 exp）"""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl_seconds
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= time.time():
+            return
+
+        with self._lock:
+            previous = self._entries.pop(token, None)
+            if previous is not None:
+                self._discard_user_token(previous.user.id, token)
+
+            self._entries[token] = CachedToken(claims=claims, user=user, expires_at=expires_at)
+            self._user_tokens.setdefault(user.id, set()).add(token)
+
+            while len(self._entries) > self.max_entries:
+                oldest, entry = next(iter(self._entries.items()))
+                self._remove(oldest, entry)
+                cache_evictions.inc(reason="capacity")
+
+            cache_entries.set(len(self._entries))
+
+    def invalidate_user(self, user_id: str) -> int:
+        """
+        使用户的所有 token 失效（用户被修改、停用后调用）
+
+        Returns:
+            失效的条目数
+        """
+        with self._lock:
+            tokens = self._user_tokens.pop(str(user_id), set())
+            for token in tokens:
+                self._entries.pop(token, None)
+            cache_entries.set(len(self._entries))
+
+        if tokens:
+            cache_evictions.inc(len(tokens), reason="invalidated")
+        return len(tokens)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._user_tokens.clear()
+            cache_entries.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存状态"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "users": len(self._user_tokens),
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+        }
+
+    def _remove(self, token: str, entry: CachedToken) -> None:
+        """移除条目（调用方持有锁）"""
+        self._entries.pop(token, None)
+        self._discard_user_token(entry.user.id, token)
+        cache_entries.set(len(self._entries))
+
+    def _discard_user_token(self, user_id: str, token: str) -> None:
+        """从用户索引中移除 token（调用方持有锁）"""
+        tokens = self._user_tokens.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._user_tokens[user_id]
+
+
+# 全局 token 缓存实例
+token_cache = TokenCache(
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    enabled=settings.AUTH_CACHE_ENABLED,
+)
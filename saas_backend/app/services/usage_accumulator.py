@@ -0,0 +1,460 @@
+"""
+使用量累加器（write-behind）
+记录使用量时只在内存中按 (组织, 用户, 资源类型, 日期) 累加增量，后台任务每隔 flush_interval 秒
+或攒够 flush_events 个事件时合并写库：一条多行 INSERT 写入明细（每个键一行，quantity 为增量之和）
+和一条多行累加 upsert 更新日汇总表，原来每个单位一次 INSERT + COMMIT + REFRESH。
+
+关闭时（lifespan）刷写剩余增量。可选的崩溃保护：配置 USAGE_JOURNAL_DIR 后每个事件先追加到
+本进程的日志文件，刷写成功后删除；进程崩溃后由下一个启动的 worker 重放无人持有的日志。
+重放是至少一次语义：刷写提交后、删除日志前崩溃会导致该批重复计数。
+刷写失败的批次连同它的日志分段一起保留，之后先单独重试这一批，成功前不再封存新分段。
+只有连接类错误（OperationalError）整批重试；其他错误多为个别键的数据问题（如组织不存在），
+拆分批次定位出错的键，只丢弃这些键，不让一个坏键阻塞全部使用量的写入。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.db.upsert import increment_upsert
+from app.models.usage import UsageDailyRollup, UsageRecord
+from app.services.quota_engine import quota_engine
+
+
+usage_events = metrics.counter("usage_accumulator_events_total", "累加的使用量事件数", ("resource_type",))
+usage_flushes = metrics.counter("usage_accumulator_flushes_total", "使用量刷写次数", ("result",))
+usage_pending_keys = metrics.gauge("usage_accumulator_pending_keys", "待刷写的使用量键数")
+
+# (组织 ID, 用户 ID, 资源类型, 日期)
+UsageKey = Tuple[str, str, str, date]
+
+
+def _lock_file(handle) -> bool:
+    """对日志文件加排他锁（非阻塞）；不支持 flock 的平台视为加锁成功"""
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class UsageJournal:
+    """使用量预写日志（按进程分段，刷写成功后删除已封存的分段）"""
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self._handle = None
+        self._sequence = 0
+        # 已封存、等待刷写成功后删除的分段
+        self._sealed: List[Any] = []
+
+    def open(self) -> Dict[UsageKey, int]:
+        """
+        打开新的分段，并接管无人持有的旧分段（崩溃的进程留下的）
+
+        Returns:
+            旧分段中的增量
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        recovered: Dict[UsageKey, int] = {}
+        for path in sorted(self.directory.glob("usage-*.jsonl")):
+            handle = open(path, "r+", encoding="utf-8")
+            if not _lock_file(handle):
+                # 仍在运行的 worker 持有
+                handle.close()
+                continue
+            for line in handle:
+                try:
+                    organization_id, user_id, resource_type, day, quantity = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    continue
+                key = (organization_id, user_id, resource_type, date.fromisoformat(day))
+                recovered[key] = recovered.get(key, 0) + quantity
+            self._sealed.append(handle)
+
+        self._rotate()
+        return recovered
+
+    def append(self, key: UsageKey, quantity: int) -> None:
+        """追加一个事件（写入操作系统缓冲；fsync=True 时落盘）"""
+        organization_id, user_id, resource_type, day = key
+        self._handle.write(json.dumps([organization_id, user_id, resource_type, day.isoformat(), quantity]) + "\n")
+        self._handle.flush()
+        if self.fsync:
+            os.fsync(self._handle.fileno())
+
+    @property
+    def sealed_segments(self) -> int:
+        """已封存、等待删除的分段数"""
+        return len(self._sealed)
+
+    def seal(self) -> None:
+        """封存当前分段并开始新分段（与内存增量的交换在同一把锁内调用）"""
+        self._sealed.append(self._handle)
+        self._rotate()
+
+    def release(self) -> None:
+        """删除全部已封存的分段（其中的增量已刷写成功）"""
+        for handle in self._sealed:
+            handle.close()
+            try:
+                os.remove(handle.name)
+            except FileNotFoundError:
+                pass
+        self._sealed.clear()
+
+    def close(self) -> None:
+        """关闭当前分段（关闭前已刷写成功时删除）"""
+        if self._handle is not None:
+            self._sealed.append(self._handle)
+            self._handle = None
+            self.release()
+
+    def _rotate(self) -> None:
+        """打开新分段"""
+        self._sequence += 1
+        path = self.directory / f"usage-{os.getpid()}-{int(time.time())}-{self._sequence}.jsonl"
+        self._handle = open(path, "a", encoding="utf-8")
+        _lock_file(self._handle)
+
+
+class UsageAccumulator:
+    """使用量累加器"""
+
+    def __init__(
+        self,
+        flush_interval: float = 5.0,
+        flush_events: int = 1000,
+        max_retries: int = 3,
+        journal: Optional[UsageJournal] = None,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.max_retries = max_retries
+        self.journal = journal
+
+        self._pending: Dict[UsageKey, int] = {}
+        # 刷写失败、等待重试的批次（对应日志中已封存的分段）
+        self._retry: Dict[UsageKey, int] = {}
+        self._events = 0
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        # 后台刷写与关闭时的刷写互斥
+        self._flush_lock = asyncio.Lock()
+
+        # 统计
+        self.flushes = 0
+        self.events_recorded = 0
+        self.rows_written = 0
+        self.dropped_keys = 0
+
+    @property
+    def running(self) -> bool:
+        """后台刷写任务是否在运行"""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def flush_lock(self) -> asyncio.Lock:
+        """刷写锁（持有期间没有正在写库的批次，配额引擎装载用量时持有）"""
+        return self._flush_lock
+
+    def record(
+        self,
+        organization_id: str,
+        user_id: str,
+        resource_type: str,
+        quantity: int = 1,
+    ) -> None:
+        """
+        记录使用量（只更新内存，可在任意线程调用）
+
+        未启动后台任务时（如脚本环境）直接写库。
+        """
+        key = (str(organization_id), str(user_id), resource_type, date.today())
+        quota_engine.add(key[0], resource_type, quantity)
+
+        if not self.running:
+            self._write_sync({key: quantity})
+            return
+
+        with self._lock:
+            if self.journal is not None:
+                self.journal.append(key, quantity)
+            self._pending[key] = self._pending.get(key, 0) + quantity
+            self._events += 1
+            self.events_recorded += 1
+            full = self._events >= self.flush_events
+            usage_pending_keys.set(len(self._pending))
+        usage_events.inc(resource_type=resource_type)
+
+        if full:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        """启动后台刷写任务（在应用 lifespan 启动阶段调用）"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        if self.journal is not None:
+            recovered = self.journal.open()
+            if recovered:
+                print(f"♻️ Replaying {len(recovered)} journaled usage keys")
+                # 接管的分段已封存，按失败批次重试
+                for key, quantity in recovered.items():
+                    self._retry[key] = self._retry.get(key, 0) + quantity
+
+        self._task = asyncio.create_task(self._run())
+        if self._retry or self._pending:
+            await self.flush()
+
+    async def stop(self) -> None:
+        """停止并刷写剩余增量（在应用 lifespan 关闭阶段调用）"""
+        if self._task is not None:
+            # 不取消任务，避免中断正在进行的刷写（已取出的增量会丢失）
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
+        if self.journal is not None and not self._pending and not self._retry:
+            self.journal.close()
+
+    async def flush(self) -> int:
+        """
+        刷写当前累加的增量
+
+        上次失败的批次先单独重试，成功后才交换新的增量、封存新的日志分段：
+        数据库长时间不可用时封存的分段（及其文件句柄）不会随刷写次数增长。
+
+        Returns:
+            写入的明细行数
+        """
+        async with self._flush_lock:
+            written = 0
+            if self._retry:
+                retry = self._retry
+                dropped = self.dropped_keys
+                remaining = await self._write(retry)
+                with self._lock:
+                    self._retry = remaining
+                    if remaining:
+                        # 不因事件数持续触发刷写，按间隔重试
+                        self._events = 0
+                if remaining:
+                    return 0
+                written += self._flushed(len(retry) - (self.dropped_keys - dropped))
+
+            with self._lock:
+                if not self._pending:
+                    return written
+                pending, self._pending = self._pending, {}
+                self._events = 0
+                if self.journal is not None:
+                    self.journal.seal()
+            usage_pending_keys.set(0)
+
+            dropped = self.dropped_keys
+            remaining = await self._write(pending)
+            if remaining:
+                # 下次先重试未写入的键（日志分段保留到写入成功）
+                with self._lock:
+                    self._retry = remaining
+                return written
+            written += self._flushed(len(pending) - (self.dropped_keys - dropped))
+
+        return written
+
+    def pending_totals(self, organization_id: str, since: date) -> Dict[str, int]:
+        """组织自 since 起尚未写库的各资源用量（配额引擎装载时使用）"""
+        totals: Dict[str, int] = {}
+        with self._lock:
+            for pending in (self._retry, self._pending):
+                for (org_id, _, resource_type, day), quantity in pending.items():
+                    if org_id == organization_id and day >= since:
+                        totals[resource_type] = totals.get(resource_type, 0) + quantity
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """获取累加器统计"""
+        return {
+            "running": self.running,
+            "pending_keys": len(self._pending),
+            "retry_keys": len(self._retry),
+            "pending_events": self._events,
+            "flush_interval": self.flush_interval,
+            "flush_events": self.flush_events,
+            "journal": str(self.journal.directory) if self.journal is not None else None,
+            "flushes": self.flushes,
+            "events_recorded": self.events_recorded,
+            "rows_written": self.rows_written,
+            "dropped_keys": self.dropped_keys,
+        }
+
+    async def _run(self) -> None:
+        """后台刷写循环：到达间隔或事件数达到上限时刷写"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+    async def _write(self, pending: Dict[UsageKey, int]) -> Dict[UsageKey, int]:
+        """
+        写入一批增量
+
+        连接类错误（OperationalError）整批退避重试；其他错误拆分批次，只丢弃单独写入仍失败的键。
+
+        Returns:
+            未能写入、需要稍后重试的增量（空字典表示已全部写入或丢弃）
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._execute(pending)
+                return {}
+            except OperationalError as e:
+                print(f"❌ Usage flush failed (attempt {attempt}/{self.max_retries}): {e.orig}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.5 * attempt)
+            except Exception as e:
+                remaining = await self._write_bisect(pending, e)
+                if remaining:
+                    usage_flushes.inc(result="failed")
+                return remaining
+
+        usage_flushes.inc(result="failed")
+        return pending
+
+    async def _write_bisect(self, pending: Dict[UsageKey, int], error: BaseException) -> Dict[UsageKey, int]:
+        """二分写入整批失败的增量；遇到连接类错误时其余部分留待重试"""
+        if len(pending) == 1:
+            self._drop(pending, error)
+            return {}
+
+        items = list(pending.items())
+        middle = len(items) // 2
+        remaining: Dict[UsageKey, int] = {}
+        for part in (dict(items[:middle]), dict(items[middle:])):
+            if remaining:
+                remaining.update(part)
+                continue
+            try:
+                await self._execute(part)
+            except OperationalError:
+                remaining.update(part)
+            except Exception as e:
+                remaining.update(await self._write_bisect(part, e))
+        return remaining
+
+    async def _execute(self, pending: Dict[UsageKey, int]) -> None:
+        """在一个事务中写入一批增量"""
+        async with AsyncSessionLocal() as db:
+            for statement in self._statements(pending, db.bind.dialect.name):
+                await db.execute(statement)
+            await db.commit()
+
+    def _drop(self, pending: Dict[UsageKey, int], error: BaseException) -> None:
+        """记录丢弃的增量（单独写入仍失败，重试不会成功）"""
+        self.dropped_keys += len(pending)
+        usage_flushes.inc(result="dropped")
+        reason = f"{type(error.orig).__name__}: {error.orig}" if getattr(error, "orig", None) else repr(error)
+        for (organization_id, user_id, resource_type, day), quantity in pending.items():
+            print(
+                f"❌ Dropped usage {resource_type!r} x{quantity} for organization {organization_id} "
+                f"(user {user_id}, {day}): {reason}"
+            )
+
+    def _flushed(self, rows: int) -> int:
+        """一批增量写入成功：删除已封存的日志分段并更新统计"""
+        if self.journal is not None:
+            self.journal.release()
+        self.flushes += 1
+        self.rows_written += rows
+        usage_flushes.inc(result="ok")
+        return rows
+
+    @staticmethod
+    def _statements(pending: Dict[UsageKey, int], dialect_name: str) -> list:
+        """
+        一批增量对应的语句：
+        - 一条多行 INSERT 写入明细（每个键一行）
+        - 一条多行累加 upsert 更新日汇总
+        """
+        now = datetime.utcnow()
+        records = []
+        rollup: Dict[Tuple[str, date, str], int] = {}
+        for (organization_id, user_id, resource_type, day), quantity in pending.items():
+            records.append({
+                "id": str(uuid.uuid4()),
+                "organization_id": organization_id,
+                "user_id": user_id,
+                "resource_type": resource_type,
+                "quantity": quantity,
+                "created_at": now,
+                "date": day,
+            })
+            rollup_key = (organization_id, day, resource_type)
+            rollup[rollup_key] = rollup.get(rollup_key, 0) + quantity
+
+        rollup_rows = [
+            {"organization_id": organization_id, "date": day, "resource_type": resource_type, "total": total}
+            for (organization_id, day, resource_type), total in rollup.items()
+        ]
+        return [
+            insert(UsageRecord).values(records),
+            increment_upsert(
+                UsageDailyRollup.__table__,
+                rollup_rows,
+                key_columns=("organization_id", "date", "resource_type"),
+                increment_columns=("total",),
+                dialect_name=dialect_name,
+            ),
+        ]
+
+    def _write_sync(self, pending: Dict[UsageKey, int]) -> None:
+        """同步写库（后台任务未启动时使用）"""
+        db = SessionLocal()
+        try:
+            for statement in self._statements(pending, db.get_bind().dialect.name):
+                db.execute(statement)
+            db.commit()
+        finally:
+            db.close()
+
+
+# 全局使用量累加器实例
+usage_accumulator = UsageAccumulator(
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    flush_events=settings.USAGE_FLUSH_MAX_EVENTS,
+    journal=(
+        UsageJournal(settings.USAGE_JOURNAL_DIR, fsync=settings.USAGE_JOURNAL_FSYNC)
+        if settings.USAGE_JOURNAL_DIR else None
+    ),
+)
@@ -1,18 +1,90 @@
 """
 使用量追踪服务
+统计和历史查询读取日汇总表 usage_daily_rollup（记录使用量时在同一事务中增量累加）；
+当天的数据直接对明细行聚合，部署当天尚未回填的部分和回填脚本都不影响当天结果。
 """
 from datetime import date, datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, insert, literal, select, union_all
 from sqlalchemy.orm import Session
 from uuid import UUID
 
-from app.models.usage import UsageRecord
+from app.db.upsert import increment_upsert
+from app.models.usage import UsageRecord, UsageDailyRollup
 from app.models.organization import Organization
 from app.models.subscription import Subscription
 from app.schemas.usage import UsageStats, UsageHistory
 from app.schemas.subscription import SUBSCRIPTION_PLANS
 
 
+# 资源类型 -> (计划 limits 中的键, 计划未配置时的月度上限)
+RESOURCE_LIMIT_KEYS = {
+    "message": ("messages_per_month", -1),
+    "api_call": ("api_calls", 10000),
+    "storage": ("storage_mb", 1000),
+}
+
+
+def resource_limit(plan_type, resource_type: str) -> Optional[int]:
+    """
+    计划对资源的月度上限
+
+    Returns:
+        上限（-1 表示无限）；未知资源类型返回 None
+    """
+    if resource_type not in RESOURCE_LIMIT_KEYS:
+        return None
+    key, default = RESOURCE_LIMIT_KEYS[resource_type]
+    plan = SUBSCRIPTION_PLANS[getattr(plan_type, "value", plan_type)]
+    return int(plan.limits.get(key, default))
+
+
+def daily_totals_query(organization_id: str, period_start: date, period_end: date):
+    """
+    (日期, 资源类型, 数量) 子查询：今天之前读汇总表，今天读明细行
+
+    Returns:
+        子查询；期间不包含今天及之前的日期时返回 None
+    """
+    today = date.today()
+    parts = []
+    if period_start < today:
+        parts.append(
+            select(
+                UsageDailyRollup.date.label("date"),
+                UsageDailyRollup.resource_type.label("resource_type"),
+                UsageDailyRollup.total.label("total"),
+            ).where(
+                UsageDailyRollup.organization_id == organization_id,
+                UsageDailyRollup.date >= period_start,
+                UsageDailyRollup.date <= min(period_end, today - timedelta(days=1)),
+            )
+        )
+    if period_start <= today <= period_end:
+        parts.append(
+            select(
+                literal(today).label("date"),
+                UsageRecord.resource_type.label("resource_type"),
+                func.sum(UsageRecord.quantity).label("total"),
+            ).where(
+                UsageRecord.organization_id == organization_id,
+                UsageRecord.date == today,
+            ).group_by(UsageRecord.resource_type)
+        )
+
+    if not parts:
+        return None
+    return (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+
+
+def usage_totals_statement(organization_id: str, period_start: date, period_end: date):
+    """期间内各资源使用总量的查询 (资源类型, 总量)；同步、异步会话共用"""
+    daily = daily_totals_query(organization_id, period_start, period_end)
+    if daily is None:
+        return None
+    return select(daily.c.resource_type, func.sum(daily.c.total)).group_by(daily.c.resource_type)
+
+
 class UsageService:
     """使用量服务类"""
 
@@ -28,22 +100,91 @@ class UsageService:
         metadata: Optional[dict] = None
     ) -> UsageRecord:
         """
-        记录使用量
+        记录使用量（立即写库并返回记录；高频路径使用 usage_accumulator 批量写入）
         """
         record = UsageRecord(
-            organization_id=organization_id,
-            user_id=user_id,
+            organization_id=str(organization_id),
+            user_id=str(user_id),
             resource_type=resource_type,
             quantity=quantity,
-            extra_data=extra_data,
+            extra_data=metadata,
+            date=date.today(),
         )
 
         self.db.add(record)
+        self.increment_rollup([
+            {
+                "organization_id": record.organization_id,
+                "date": record.date,
+                "resource_type": resource_type,
+                "total": quantity,
+            }
+        ])
         self.db.commit()
         self.db.refresh(record)
 
+        from app.services.quota_engine import quota_engine
+        quota_engine.add(record.organization_id, resource_type, quantity)
+
         return record
 
+    def increment_rollup(self, rows: List[dict]) -> None:
+        """
+        累加日汇总（不提交，调用方与明细写入放在同一事务）
+
+        Args:
+            rows: [{"organization_id", "date", "resource_type", "total"}]
+        """
+        if not rows:
+            return
+        self.db.execute(
+            increment_upsert(
+                UsageDailyRollup.__table__,
+                rows,
+                key_columns=("organization_id", "date", "resource_type"),
+                increment_columns=("total",),
+                dialect_name=self.db.get_bind().dialect.name,
+            )
+        )
+
+    def rebuild_rollup(self, day: date, organization_id: Optional[str] = None) -> int:
+        """
+        按明细行重算某一天的汇总（幂等，用于回填；不要用于仍在写入的当天）
+
+        Returns:
+            写入的汇总行数
+        """
+        rollup_filter = [UsageDailyRollup.date == day]
+        record_filter = [UsageRecord.date == day]
+        if organization_id:
+            rollup_filter.append(UsageDailyRollup.organization_id == organization_id)
+            record_filter.append(UsageRecord.organization_id == organization_id)
+
+        self.db.execute(delete(UsageDailyRollup).where(*rollup_filter))
+        result = self.db.execute(
+            insert(UsageDailyRollup).from_select(
+                ["organization_id", "date", "resource_type", "total", "updated_at"],
+                select(
+                    UsageRecord.organization_id,
+                    UsageRecord.date,
+                    UsageRecord.resource_type,
+                    func.sum(UsageRecord.quantity),
+                    literal(datetime.utcnow()),
+                )
+                .where(*record_filter)
+                .group_by(UsageRecord.organization_id, UsageRecord.date, UsageRecord.resource_type),
+            )
+        )
+        self.db.commit()
+        return result.rowcount
+
+    def _totals_by_resource(self, organization_id: str, period_start: date, period_end: date) -> Dict[str, int]:
+        """期间内各资源的使用总量（一次 GROUP BY）"""
+        statement = usage_totals_statement(organization_id, period_start, period_end)
+        if statement is None:
+            return {}
+        return {resource_type: int(total or 0) for resource_type, total in self.db.execute(statement).all()}
+
     def get_usage_stats(
         self,
         organization_id: UUID,
@@ -61,38 +202,22 @@ class UsageService:
 
         # 获取组织信息
         organization = self.db.query(Organization).filter(
-            Organization.id == organization_id
+            Organization.id == str(organization_id)
         ).first()
 
         if not organization:
             raise ValueError("Organization not found")
 
-        # 获取订阅计划限制
-        plan = SUBSCRIPTION_PLANS[organization.plan_type]
-        limits = plan.limits
-
-        # 查询使用量
-        usage_records = self.db.query(UsageRecord).filter(
-            UsageRecord.organization_id == organization_id,
-            UsageRecord.date >= period_start,
-            UsageRecord.date <= period_end,
-        ).all()
-
         # 统计各类资源使用量
-        messages_used = sum(
-            r.quantity for r in usage_records if r.resource_type == "message"
-        )
-        api_calls_used = sum(
-            r.quantity for r in usage_records if r.resource_type == "api_call"
-        )
-        storage_used = sum(
-            r.quantity for r in usage_records if r.resource_type == "storage"
-        )
+        totals = self._totals_by_resource(str(organization_id), period_start, period_end)
+        messages_used = totals.get("message", 0)
+        api_calls_used = totals.get("api_call", 0)
+        storage_used = totals.get("storage", 0)
 
         # 计算百分比
-        messages_limit = limits["messages_per_month"]
-        api_calls_limit = limits.get("api_calls", 10000)
-        storage_limit = limits.get("storage_mb", 1000)
+        messages_limit = resource_limit(organization.plan_type, "message")
+        api_calls_limit = resource_limit(organization.plan_type, "api_call")
+        storage_limit = resource_limit(organization.plan_type, "storage")
 
         messages_percentage = (
             (messages_used / messages_limit * 100) if messages_limit > 0 else 0
@@ -139,29 +264,24 @@ class UsageService:
         """
         start_date = date.today() - timedelta(days=days)
 
-        # 查询使用量记录
-        records = self.db.query(UsageRecord).filter(
-            UsageRecord.organization_id == organization_id,
-            UsageRecord.date >= start_date,
-        ).all()
+        # 按日期、资源类型汇总（每天每种资源一行）
+        daily = daily_totals_query(str(organization_id), start_date, date.today())
+        rows = self.db.execute(select(daily.c.date, daily.c.resource_type, daily.c.total)).all()
 
         # 按日期分组统计
+        fields = {"message": "messages", "api_call": "api_calls", "storage": "storage_mb"}
         history = {}
-        for record in records:
-            if record.date not in history:
-                history[record.date] = {
-                    "date": record.date,
+        for day, resource_type, total in rows:
+            if resource_type not in fields:
+                continue
+            if day not in history:
+                history[day] = {
+                    "date": day,
                     "messages": 0,
                     "api_calls": 0,
                     "storage_mb": 0,
                 }
-
-            if record.resource_type == "message":
-                history[record.date]["messages"] += record.quantity
-            elif record.resource_type == "api_call":
-                history[record.date]["api_calls"] += record.quantity
-            elif record.resource_type == "storage":
-                history[record.date]["storage_mb"] += record.quantity
+            history[day][fields[resource_type]] += int(total or 0)
 
         # 转换为列表并排序
         result = [
@@ -177,28 +297,36 @@ class UsageService:
         additional_quantity: int = 1
     ) -> bool:
         """
-        检查是否超出使用限制
+        检查是否超出使用限制（本周期用量由配额引擎维护，未装载时用当前会话装载一次）
+
+        后台刷写运行时同步会话无法持有刷写锁，读到的总量可能不含正在写库的批次：
+        只用于本次判断，不装入配额引擎（由 QuotaEngine.load 装载）。
+
+        Raises:
+            ValueError: 组织不存在
         """
-        try:
-            stats = self.get_usage_stats(organization_id)
-
-            if resource_type == "message":
-                limit = stats.messages_limit
-                used = stats.messages_used
-            elif resource_type == "api_call":
-                limit = stats.api_calls_limit
-                used = stats.api_calls_used
-            elif resource_type == "storage":
-                limit = stats.storage_limit_mb
-                used = stats.storage_used_mb
-            else:
-                return True  # 未知类型，允许使用
-
-            # -1 表示无限
-            if limit < 0:
-                return True
-
-            return (used + additional_quantity) <= limit
-
-        except Exception:
-            return True  # 出错时允许使用
+        from app.services.quota_engine import current_period_start, quota_engine
+        from app.services.usage_accumulator import usage_accumulator
+
+        organization_id = str(organization_id)
+        plan_type = self.db.query(Organization.plan_type).filter(
+            Organization.id == organization_id
+        ).scalar()
+        if plan_type is None:
+            raise ValueError("Organization not found")
+
+        allowed = quota_engine.check_loaded(organization_id, plan_type, resource_type, additional_quantity)
+        if allowed is None or quota_engine.needs_resync(organization_id):
+            period_start = current_period_start()
+            totals = self._totals_by_resource(organization_id, period_start, date.today())
+            if usage_accumulator.running:
+                limit = resource_limit(plan_type, resource_type)
+                if limit is None or limit < 0:
+                    return True
+                pending = usage_accumulator.pending_totals(organization_id, period_start)
+                used = totals.get(resource_type, 0) + pending.get(resource_type, 0)
+                return used + additional_quantity <= limit
+
+            quota_engine.install(organization_id, period_start, totals)
+            allowed = quota_engine.check_loaded(organization_id, plan_type, resource_type, additional_quantity)
+        return allowed
@@ -0,0 +1,167 @@
+"""
+微信扫码登录状态等待
+登录页原来每隔几秒轮询一次 /auth/wechat/check-status，每次都按 state 查询 wechat_login_sessions。
+长轮询时请求挂在按 state 索引的等待者上，回调更新会话状态时直接唤醒；最近的状态保留在内存中，
+后续轮询无需查库。等待超时（例如回调落在另一个 worker 上）时由接口回退为一次数据库查询。
+只有已记录的 state（签发二维码时或接口查库确认会话存在后记录）才能挂起等待，等待者总数有上限。
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+waiter_wakeups = metrics.counter(
+    "wechat_login_waiter_wakeups_total", "微信登录长轮询结束次数", ("result",)
+)
+waiter_pending = metrics.gauge("wechat_login_waiters", "正在等待的微信登录长轮询数")
+
+# 不会再变化的状态
+TERMINAL_STATUSES = ("confirmed", "expired")
+
+
+@dataclass
+class _StateEntry:
+    """一个 state 的最近状态和等待者"""
+    status: Optional[Dict[str, Any]] = None
+    expires_at: float = 0.0
+    event: Optional[asyncio.Event] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    waiters: int = 0
+    version: int = 0
+
+
+class LoginStatusWaiter:
+    """微信登录状态等待者（进程内，按 state 索引）"""
+
+    def __init__(self, ttl_seconds: float = 300, max_states: int = 10000, max_waiters: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_states = max_states
+        # 同时挂起的等待者上限（有等待者的 state 不会被淘汰），默认与 max_states 相同
+        self.max_waiters = max_waiters if max_waiters is not None else max_states
+        self._states: "OrderedDict[str, _StateEntry]" = OrderedDict()
+        self._waiters = 0
+        self._lock = threading.Lock()
+
+    def peek(self, state: str) -> Optional[Dict[str, Any]]:
+        """
+        内存中的最近状态
+
+        Returns:
+            本进程见过的最近状态；未见过或已过期返回 None
+        """
+        with self._lock:
+            entry = self._states.get(state)
+            if entry is None or entry.status is None or entry.expires_at <= time.time():
+                return None
+            return entry.status
+
+    def notify(self, state: str, status: str, user_id: Optional[str] = None) -> None:
+        """
+        记录状态变更并唤醒等待者（可在任意线程调用）
+        """
+        snapshot = {"status": status, "user_id": str(user_id) if user_id else None}
+        with self._lock:
+            entry = self._states.get(state)
+            if entry is None:
+                entry = _StateEntry()
+                self._states[state] = entry
+                self._evict(state)
+            else:
+                self._states.move_to_end(state)
+            entry.status = snapshot
+            entry.expires_at = time.time() + self.ttl_seconds
+            entry.version += 1
+            event, loop = entry.event, entry.loop
+            # 下一轮等待使用新的事件
+            entry.event = None
+
+        if event is not None:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                event.set()
+            else:
+                loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, state: str, timeout: float, known_status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        等待状态变更
+
+        Args:
+            state: 登录会话的 state
+            timeout: 最长等待秒数
+            known_status: 调用方已知的状态；内存中的状态与之不同时立即返回
+
+        Returns:
+            变更后的状态；超时返回 None。未记录（或已过期）的 state、等待者已满时不挂起，立即返回 None
+        """
+        with self._lock:
+            entry = self._states.get(state)
+            if entry is None or entry.expires_at <= time.time():
+                waiter_wakeups.inc(result="unknown")
+                return None
+            if entry.status is not None and entry.status["status"] != known_status:
+                waiter_wakeups.inc(result="notified")
+                return entry.status
+            if self._waiters >= self.max_waiters:
+                waiter_wakeups.inc(result="rejected")
+                return None
+            if entry.event is None:
+                entry.event = asyncio.Event()
+                entry.loop = asyncio.get_running_loop()
+            event = entry.event
+            version = entry.version
+            entry.waiters += 1
+            self._waiters += 1
+        waiter_pending.inc()
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiter_pending.dec()
+            with self._lock:
+                entry.waiters -= 1
+                self._waiters -= 1
+                notified = entry.version != version
+                status = entry.status
+
+        waiter_wakeups.inc(result="notified" if notified else "timeout")
+        return status if notified else None
+
+    def stats(self) -> Dict[str, Any]:
+        """获取等待者状态"""
+        with self._lock:
+            return {
+                "states": len(self._states),
+                "waiters": self._waiters,
+                "max_states": self.max_states,
+                "max_waiters": self.max_waiters,
+            }
+
+    def _evict(self, keep: str) -> None:
+        """从最旧的开始淘汰过期和超出容量的 state（调用方持有锁；有等待者的和 keep 不淘汰）"""
+        now = time.time()
+        stale = []
+        for state, entry in self._states.items():
+            if len(self._states) - len(stale) <= self.max_states and entry.expires_at > now:
+                break
+            if entry.waiters == 0 and state != keep:
+                stale.append(state)
+        for state in stale:
+            del self._states[state]
+
+
+# 全局微信登录状态等待者
+login_status_waiter = LoginStatusWaiter(
+    max_states=settings.WECHAT_LOGIN_WAITER_MAX_STATES,
+)
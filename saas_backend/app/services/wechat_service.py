@@ -209,6 +209,9 @@ class WeChatAuthService:
             user.wechat_unionid = unionid
 
         self.db.commit()
+
+        from app.services.token_cache import token_cache
+        token_cache.invalidate_user(user.id)
         return True
 
 
@@ -229,6 +232,10 @@ class WeChatLoginSession:
 
         self.db.add(session)
         self.db.commit()
+
+        # 记录已签发的 state，长轮询只为已记录的 state 挂起
+        from app.services.wechat_login_waiter import login_status_waiter
+        login_status_waiter.notify(state, "pending")
         return True
 
     def update_session_status(self, state: str, status: str, user_id: Optional[str] = None) -> bool:
@@ -244,6 +251,10 @@ class WeChatLoginSession:
             if user_id:
                 session.user_id = user_id
             self.db.commit()
+
+            # 唤醒等待该 state 的长轮询
+            from app.services.wechat_login_waiter import login_status_waiter
+            login_status_waiter.notify(state, status, session.user_id)
             return True
 
         return False
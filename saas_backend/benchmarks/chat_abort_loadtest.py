@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+流式聊天中途断开压测
+
+并发发起流式聊天，每个请求收到若干帧后主动断开连接，结束后对比服务端资源：
+Coze 连接池在用连接数、上游调度在途数应回落到压测前的水平，
+chat_stream_disconnects_total / coze_cancelled_chats_total 应随断开次数增长。
+
+用法:
+    cd saas_backend
+    python benchmarks/chat_abort_loadtest.py --base-url http://localhost:8000 \\
+        --token <用户 JWT> --admin-token <平台管理员 JWT> --bot-id <机器人 ID> \\
+        --requests 200 --concurrency 50 --abort-after 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def fetch_health(client: httpx.AsyncClient, admin_token: str) -> dict:
+    """获取服务端资源状态"""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    health = (await client.get("/api/v1/admin/system/health", headers=headers)).json()
+    metrics = (await client.get("/api/v1/admin/system/metrics", headers=headers)).json()
+
+    def total(name: str) -> float:
+        return sum(sample["value"] for sample in metrics.get(name, {}).get("samples", []))
+
+    return {
+        "pool_in_use": health.get("coze_pool", {}).get("in_use"),
+        "scheduler_inflight": health.get("coze_scheduler", {}).get("inflight"),
+        "disconnects": total("chat_stream_disconnects_total"),
+        "cancelled_chats": total("coze_cancelled_chats_total"),
+    }
+
+
+async def aborted_stream(
+    client: httpx.AsyncClient,
+    token: str,
+    bot_id: str,
+    abort_after: int,
+    index: int,
+) -> float:
+    """发起一个流式请求，收到 abort_after 帧后断开；返回断开前的耗时"""
+    started = time.perf_counter()
+    frames = 0
+    async with client.stream(
+        "POST",
+        "/api/v1/chat/chat/stream",
+        headers={"Authorization": f"Bearer {token}"},
+        # 问题各不相同，避免命中回答缓存或被合并
+        json={"bot_id": bot_id, "message": f"请详细介绍一下你们的产品 #{index}"},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                frames += 1
+                if frames >= abort_after:
+                    break
+    # 退出 async with 即关闭连接
+    return time.perf_counter() - started
+
+
+async def run(args) -> None:
+    """执行压测"""
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        before = await fetch_health(client, args.admin_token)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        errors = 0
+
+        async def worker(index: int):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    return await aborted_stream(client, args.token, args.bot_id, args.abort_after, index)
+                except httpx.HTTPError as e:
+                    errors += 1
+                    print(f"请求 {index} 失败: {e!r}")
+                    return None
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        durations = sorted(r for r in results if r is not None)
+
+        # 给服务端后台收尾任务（取消生成、保存截断回复）留出时间
+        await asyncio.sleep(args.settle)
+        after = await fetch_health(client, args.admin_token)
+
+    print(f"请求数: {args.requests}，并发: {args.concurrency}，失败: {errors}，总耗时: {elapsed:.2f}s")
+    if durations:
+        print(f"断开前耗时 p50: {statistics.median(durations) * 1000:.0f}ms  "
+              f"p99: {durations[int(len(durations) * 0.99) - 1] * 1000:.0f}ms")
+    print(f"{'指标':<20}{'压测前':>10}{'压测后':>10}")
+    for key in before:
+        print(f"{key:<20}{before[key]!s:>10}{after[key]!s:>10}")
+
+    leaked = (after["pool_in_use"] or 0) > (before["pool_in_use"] or 0) or \
+        (after["scheduler_inflight"] or 0) > (before["scheduler_inflight"] or 0)
+    print("❌ 存在未释放的上游资源" if leaked else "✅ 上游资源已全部释放")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式聊天中途断开压测")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="服务地址")
+    parser.add_argument("--token", required=True, help="聊天用户的 JWT")
+    parser.add_argument("--admin-token", required=True, help="平台管理员 JWT（读取资源状态）")
+    parser.add_argument("--bot-id", required=True, help="机器人 ID")
+    parser.add_argument("--requests", type=int, default=200, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    parser.add_argument("--abort-after", type=int, default=3, help="收到多少帧后断开")
+    parser.add_argument("--settle", type=float, default=2.0, help="压测结束后等待服务端收尾的秒数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
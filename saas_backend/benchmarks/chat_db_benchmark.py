@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+聊天数据库访问基准测试：同步 Session vs AsyncSession
+
+模拟 N 条正在输出的 SSE 流（每隔固定间隔发送一个分片），同时并发执行 M 个聊天回合的
+数据库操作（查组织、查机器人、查对话、写消息、提交）。统计流分片的调度延迟 p50/p99：
+同步 Session 会阻塞事件循环，导致已在输出的流全部卡顿。
+
+用法:
+    cd saas_backend
+    DATABASE_URL=sqlite:///./bench_chat.db python benchmarks/chat_db_benchmark.py --streams 200 --turns 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.base import Base
+from app.db.session import SessionLocal, engine, AsyncSessionLocal, async_engine
+from app.models import (  # noqa: F401  注册所有模型
+    User, Organization, OrganizationMember, Bot, Conversation, Message
+)
+from app.services.chat_service import ChatService
+
+
+def seed() -> dict:
+    """准备基准数据：一个用户、一个组织、一个机器人、一个对话"""
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        user = User(email=f"bench_{uuid.uuid4().hex[:8]}@bench.local", username="bench")
+        db.add(user)
+        db.flush()
+        org = Organization(name="bench org", owner_id=user.id)
+        db.add(org)
+        db.flush()
+        db.add(OrganizationMember(organization_id=org.id, user_id=user.id))
+        bot = Bot(organization_id=org.id, name="bench bot", bot_id="bench")
+        db.add(bot)
+        db.flush()
+        conversation = Conversation(
+            organization_id=org.id, bot_id=bot.id, user_id=user.id, message_count=0
+        )
+        db.add(conversation)
+        db.commit()
+        return {
+            "user_id": user.id,
+            "org_id": org.id,
+            "bot_id": bot.id,
+            "conversation_id": conversation.id,
+        }
+    finally:
+        db.close()
+
+
+def sync_turn(ids: dict) -> None:
+    """一个聊天回合的数据库操作（同步 Session，原实现方式）"""
+    db = SessionLocal()
+    try:
+        membership = db.query(OrganizationMember).filter(
+            OrganizationMember.user_id == ids["user_id"]
+        ).first()
+        db.query(Organization).filter(Organization.id == membership.organization_id).first()
+        db.query(Bot).filter(Bot.id == ids["bot_id"], Bot.organization_id == ids["org_id"]).first()
+        conversation = db.query(Conversation).filter(
+            Conversation.id == ids["conversation_id"]
+        ).first()
+        db.add(Message(conversation_id=conversation.id, user_id=ids["user_id"], role="user", content="hi"))
+        db.add(Message(conversation_id=conversation.id, user_id=ids["user_id"], role="assistant", content="hello"))
+        conversation.message_count += 2
+        db.commit()
+    finally:
+        db.close()
+
+
+async def async_turn(ids: dict) -> None:
+    """一个聊天回合的数据库操作（AsyncSession）"""
+    async with AsyncSessionLocal() as db:
+        chat_service = ChatService(db)
+        org = await chat_service.get_user_organization(ids["user_id"])
+        await chat_service.get_bot(ids["bot_id"], org.id)
+        conversation = await chat_service.get_conversation(
+            ids["conversation_id"], org.id, ids["user_id"]
+        )
+        chat_service.add_message(conversation, ids["user_id"], "user", "hi")
+        chat_service.add_message(conversation, ids["user_id"], "assistant", "hello")
+        conversation.message_count += 2
+        await chat_service.commit()
+
+
+async def stream(lags: list, interval: float, stop: asyncio.Event) -> None:
+    """模拟一条 SSE 流：记录每个分片相对预期发送时间的延迟"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(mode: str, ids: dict, streams: int, turns: int, concurrency: int, interval: float) -> dict:
+    """运行一轮基准"""
+    lags: list = []
+    stop = asyncio.Event()
+    stream_tasks = [asyncio.create_task(stream(lags, interval, stop)) for _ in range(streams)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_turn():
+        async with semaphore:
+            if mode == "sync":
+                # 与改造前的 chat 端点一致：在 async 函数中直接调用同步 Session
+                sync_turn(ids)
+            else:
+                await async_turn(ids)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_turn() for _ in range(turns)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await asyncio.gather(*stream_tasks)
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "turns_per_sec": turns / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="聊天数据库访问基准测试")
+    parser.add_argument("--streams", type=int, default=200, help="并发 SSE 流数量")
+    parser.add_argument("--turns", type=int, default=500, help="聊天回合数量")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发聊天回合数量")
+    parser.add_argument("--interval", type=float, default=0.02, help="流分片间隔（秒）")
+    args = parser.parse_args()
+
+    ids = seed()
+    print(f"数据库: {os.getenv('DATABASE_URL', '(默认)')}")
+    print(f"{'模式':<8}{'回合/秒':>12}{'p50 延迟(ms)':>16}{'p99 延迟(ms)':>16}{'最大延迟(ms)':>16}")
+    for mode in ("sync", "async"):
+        result = await run(mode, ids, args.streams, args.turns, args.concurrency, args.interval)
+        print(
+            f"{result['mode']:<8}{result['turns_per_sec']:>12.1f}"
+            f"{result['lag_p50_ms']:>16.2f}{result['lag_p99_ms']:>16.2f}{result['lag_max_ms']:>16.2f}"
+        )
+
+    await async_engine.dispose()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+聊天链路压测（后端标准回归基准）
+
+N 个并发虚拟用户先各自登录，然后在 --duration 时长内循环进行多轮对话（POST /chat 或 POST /chat/stream），
+统计吞吐（RPS）、流式首字延迟（TTFT）和完整回复耗时的分位数；可读取服务端 /metrics，
+输出压测期间各阶段（认证、组织查询、排队、Coze 首包……）的平均耗时。
+
+上游使用本地 Coze 替身服务（benchmarks/fake_coze_server.py），不会打到真实 Coze。
+
+用法:
+    cd saas_backend
+    # 1. 启动 Coze 替身服务和后端
+    python benchmarks/fake_coze_server.py --port 9000 --tokens-per-second 40 --ttft-ms 400 &
+    COZE_API_BASE=http://127.0.0.1:9000 COZE_API_TOKEN=fake uvicorn app.main:app --port 8000 --workers 4 &
+
+    # 2. 准备压测账号（直接写库，DATABASE_URL 与后端一致）：每个用户一个组织和一个机器人
+    python benchmarks/chat_loadtest.py seed --users 50 --plan enterprise --out loadtest_users.json
+
+    # 3. 压测；保存结果作为基线，改动后与基线对比（p50/p99 劣化超过容差时退出码为 1）
+    python benchmarks/chat_loadtest.py run --users-file loadtest_users.json --users 50 \\
+        --duration 60 --stream-ratio 0.8 --save baseline.json
+    python benchmarks/chat_loadtest.py run --users-file loadtest_users.json --users 50 \\
+        --duration 60 --stream-ratio 0.8 --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# 不同的首轮问题数：数量越少，回答缓存和相同问题合并的命中越多
+QUESTIONS = [
+    "你们的产品支持哪些功能？",
+    "如何申请退款？",
+    "退款多久到账？",
+    "可以开发票吗？",
+    "怎么联系人工客服？",
+    "支持哪些支付方式？",
+    "企业版和专业版有什么区别？",
+    "知识库可以上传哪些格式的文件？",
+]
+FOLLOW_UPS = ["能再详细说说吗？", "还有其他注意事项吗？", "好的，谢谢"]
+
+REPORT_OPERATIONS = ("login", "chat", "stream_ttft", "stream_total")
+
+
+# ============================================
+# 准备压测账号
+# ============================================
+
+def seed(args) -> None:
+    """创建压测用户、组织和机器人，写出账号文件"""
+    from app.core.security import get_password_hash
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models import User, Organization, OrganizationMember, Bot  # noqa: F401  注册所有模型
+    from app.models.organization import PlanType
+    from app.models.organization_member import MemberRole
+
+    Base.metadata.create_all(bind=engine)
+
+    run_id = uuid.uuid4().hex[:8]
+    # 所有压测账号共用一个密码，只计算一次哈希
+    password_hash = get_password_hash(args.password)
+    accounts = []
+
+    db = SessionLocal()
+    try:
+        for i in range(args.users):
+            user = User(
+                email=f"loadtest_{run_id}_{i}@loadtest.local",
+                username=f"loadtest_{i}",
+                password_hash=password_hash,
+                is_active=True,
+                is_verified=True,
+            )
+            db.add(user)
+            db.flush()
+            org = Organization(name=f"loadtest org {i}", owner_id=user.id, plan_type=PlanType(args.plan))
+            db.add(org)
+            db.flush()
+            db.add(OrganizationMember(organization_id=org.id, user_id=user.id, role=MemberRole.OWNER))
+            bot = Bot(organization_id=org.id, name=f"loadtest bot {i}", bot_id=args.coze_bot_id)
+            db.add(bot)
+            db.flush()
+            accounts.append({"email": user.email, "password": args.password, "bot_id": bot.id})
+        db.commit()
+    finally:
+        db.close()
+
+    Path(args.out).write_text(json.dumps(accounts, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ 已创建 {len(accounts)} 个压测账号（{args.plan}），写入 {args.out}")
+
+
+# ============================================
+# 压测
+# ============================================
+
+class Recorder:
+    """按操作记录耗时和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+
+    def ok(self, operation: str, seconds: float) -> None:
+        """记录一次成功"""
+        self.latencies[operation].append(seconds)
+
+    def error(self, operation: str, detail: str) -> None:
+        """记录一次失败（保留前几条错误信息）"""
+        self.errors[operation] += 1
+        if len(self.error_samples) < 10:
+            self.error_samples.append(f"{operation}: {detail}")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def login(client: httpx.AsyncClient, account: Dict[str, str], recorder: Recorder) -> Optional[str]:
+    """登录，返回 access token"""
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            "/api/v1/auth/login",
+            data={"username": account["email"], "password": account["password"]},
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        recorder.error("login", repr(e))
+        return None
+    recorder.ok("login", time.perf_counter() - started)
+    return response.json()["access_token"]
+
+
+async def chat_once(
+    client: httpx.AsyncClient,
+    headers: Dict[str, str],
+    body: Dict[str, Any],
+    recorder: Recorder,
+) -> Optional[str]:
+    """非流式聊天一轮，返回对话 ID"""
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/v1/chat/chat", json=body, headers=headers)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        recorder.error("chat", repr(e))
+        return None
+
+    data = response.json()
+    if str(data.get("message_id", "")).startswith("fallback_"):
+        # 服务端降级回复（Coze 调用失败）
+        recorder.error("chat", "fallback reply")
+        return data.get("conversation_id")
+    recorder.ok("chat", time.perf_counter() - started)
+    return data.get("conversation_id")
+
+
+async def stream_once(
+    client: httpx.AsyncClient,
+    headers: Dict[str, str],
+    body: Dict[str, Any],
+    recorder: Recorder,
+) -> Optional[str]:
+    """流式聊天一轮，返回对话 ID"""
+    started = time.perf_counter()
+    first_token: Optional[float] = None
+    conversation_id = None
+    try:
+        async with client.stream("POST", "/api/v1/chat/chat/stream", json=body, headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                frame = json.loads(line[5:])
+                kind = frame.get("type")
+                if kind == "message":
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    conversation_id = frame.get("conversation_id") or conversation_id
+                elif kind == "error":
+                    recorder.error("stream_total", frame.get("error") or "error frame")
+                    return conversation_id
+                elif kind == "done":
+                    break
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        recorder.error("stream_total", repr(e))
+        return None
+
+    if first_token is None:
+        recorder.error("stream_total", "empty reply")
+        return conversation_id
+    recorder.ok("stream_ttft", first_token)
+    recorder.ok("stream_total", time.perf_counter() - started)
+    return conversation_id
+
+
+async def virtual_user(
+    index: int,
+    client: httpx.AsyncClient,
+    token: str,
+    account: Dict[str, str],
+    args,
+    deadline: float,
+    recorder: Recorder,
+) -> None:
+    """一个虚拟用户：循环对话，每个对话 --turns 轮"""
+    rng = random.Random(args.seed + index)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    iterations = 0
+    while time.monotonic() < deadline and (not args.iterations or iterations < args.iterations):
+        conversation_id = None
+        for turn in range(args.turns):
+            if time.monotonic() >= deadline:
+                return
+            if turn == 0:
+                message = rng.choice(QUESTIONS[:max(1, args.questions)])
+            else:
+                message = FOLLOW_UPS[(turn - 1) % len(FOLLOW_UPS)]
+            body = {"bot_id": account["bot_id"], "message": message, "conversation_id": conversation_id}
+
+            if rng.random() < args.stream_ratio:
+                conversation_id = await stream_once(client, headers, body, recorder)
+            else:
+                conversation_id = await chat_once(client, headers, body, recorder)
+
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+            if conversation_id is None:
+                break
+        iterations += 1
+
+
+_SAMPLE_LINE = re.compile(r'^chat_stage_seconds_(sum|count)\{([^}]*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+async def fetch_stage_totals(client: httpx.AsyncClient, token: Optional[str]) -> Dict[Tuple[str, str], List[float]]:
+    """读取 /metrics 中各阶段耗时的累计值：{(endpoint, stage): [sum, count]}"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        response = await client.get("/metrics", headers=headers)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+
+    totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for line in response.text.splitlines():
+        match = _SAMPLE_LINE.match(line)
+        if not match:
+            continue
+        kind, labels, value = match.groups()
+        labels = dict(_LABEL.findall(labels))
+        key = (labels.get("endpoint", ""), labels.get("stage", ""))
+        totals[key][0 if kind == "sum" else 1] += float(value)
+    return totals
+
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, Any]:
+    """汇总压测结果"""
+    operations = {}
+    for operation in REPORT_OPERATIONS:
+        values = sorted(recorder.latencies.get(operation, []))
+        operations[operation] = {
+            "count": len(values),
+            "errors": recorder.errors.get(operation, 0),
+            "p50": percentile(values, 0.50),
+            "p90": percentile(values, 0.90),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else 0.0,
+        }
+
+    completed = operations["chat"]["count"] + operations["stream_total"]["count"]
+    failed = operations["chat"]["errors"] + operations["stream_total"]["errors"]
+    return {
+        "elapsed": elapsed,
+        "rps": completed / elapsed if elapsed else 0.0,
+        "completed": completed,
+        "failed": failed,
+        "operations": operations,
+    }
+
+
+def print_report(summary: Dict[str, Any], stages: Dict[Tuple[str, str], Tuple[float, int]]) -> None:
+    """打印压测结果"""
+    print(f"\n耗时: {summary['elapsed']:.1f}s  完成对话轮次: {summary['completed']}  "
+          f"失败: {summary['failed']}  RPS: {summary['rps']:.1f}")
+    print(f"{'操作':<14}{'次数':>8}{'失败':>8}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for operation, result in summary["operations"].items():
+        print(f"{operation:<14}{result['count']:>8}{result['errors']:>8}"
+              f"{result['p50'] * 1000:>10.0f}{result['p90'] * 1000:>10.0f}"
+              f"{result['p99'] * 1000:>10.0f}{result['max'] * 1000:>10.0f}")
+
+    if stages:
+        print("\n服务端各阶段平均耗时（压测期间，来自 /metrics）")
+        print(f"{'端点':<14}{'阶段':<20}{'次数':>8}{'平均(ms)':>10}")
+        for (endpoint, stage), (total, count) in sorted(stages.items()):
+            print(f"{endpoint:<14}{stage:<20}{count:>8}{total / count * 1000:>10.1f}")
+
+
+def compare(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """与基线对比；返回是否存在超过容差的劣化"""
+    regressed = False
+    print(f"\n与基线对比（容差 {tolerance:.0%}）")
+    print(f"{'指标':<22}{'基线':>10}{'本次':>10}{'变化':>10}")
+
+    def row(name: str, before: float, after: float, higher_is_better: bool = False) -> None:
+        nonlocal regressed
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressed = True
+            flag = "  ❌"
+        print(f"{name:<22}{before:>10.1f}{after:>10.1f}{change:>+10.1%}{flag}")
+
+    row("rps", baseline["rps"], summary["rps"], higher_is_better=True)
+    for operation in REPORT_OPERATIONS:
+        before = baseline["operations"].get(operation)
+        after = summary["operations"][operation]
+        if not before or not before["count"] or not after["count"]:
+            continue
+        for q in ("p50", "p99"):
+            row(f"{operation} {q}(ms)", before[q] * 1000, after[q] * 1000)
+
+    print("❌ 存在性能劣化" if regressed else "✅ 未发现超过容差的劣化")
+    return regressed
+
+
+async def run(args) -> int:
+    """执行压测"""
+    accounts = json.loads(Path(args.users_file).read_text(encoding="utf-8"))
+    if not accounts:
+        print("❌ 账号文件为空")
+        return 1
+
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        before = await fetch_stage_totals(client, args.metrics_token)
+
+        recorder = Recorder()
+        users = [accounts[i % len(accounts)] for i in range(args.users)]
+
+        # 先并发登录，登录完成后再开始计时对话阶段（RPS 只统计对话轮次）
+        tokens = await asyncio.gather(*(login(client, account, recorder) for account in users))
+
+        started = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(
+            virtual_user(i, client, token, account, args, deadline, recorder)
+            for i, (token, account) in enumerate(zip(tokens, users))
+            if token is not None
+        ))
+        elapsed = time.perf_counter() - started
+
+        after = await fetch_stage_totals(client, args.metrics_token)
+
+    stages = {}
+    for key, (total, count) in after.items():
+        previous_total, previous_count = before.get(key, (0.0, 0.0))
+        if count > previous_count:
+            stages[key] = (total - previous_total, int(count - previous_count))
+
+    summary = summarize(recorder, elapsed)
+    summary["config"] = {
+        "users": args.users,
+        "duration": args.duration,
+        "iterations": args.iterations,
+        "turns": args.turns,
+        "stream_ratio": args.stream_ratio,
+        "questions": args.questions,
+        "think_time": args.think_time,
+    }
+    print_report(summary, stages)
+    for sample in recorder.error_samples:
+        print(f"  错误示例 {sample}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(summary, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天链路压测（后端标准回归基准）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="创建压测账号（直接写库）")
+    seed_parser.add_argument("--users", type=int, default=50, help="账号数")
+    seed_parser.add_argument("--password", default="loadtest123", help="账号密码")
+    seed_parser.add_argument("--plan", default="enterprise", choices=("free", "pro", "enterprise"),
+                             help="组织订阅计划（决定上游并发上限和调度权重）")
+    seed_parser.add_argument("--coze-bot-id", default="fake-bot", help="机器人的 Coze Bot ID")
+    seed_parser.add_argument("--out", default="loadtest_users.json", help="账号文件")
+
+    run_parser = commands.add_parser("run", help="执行压测")
+    run_parser.add_argument("--base-url", default="http://localhost:8000", help="服务地址")
+    run_parser.add_argument("--users-file", default="loadtest_users.json", help="seed 生成的账号文件")
+    run_parser.add_argument("--users", type=int, default=50, help="并发虚拟用户数（超过账号数时复用账号）")
+    run_parser.add_argument("--duration", type=float, default=60.0, help="压测时长（秒）")
+    run_parser.add_argument("--iterations", type=int, default=0, help="每个用户的对话数上限（0 表示不限，按时长结束）")
+    run_parser.add_argument("--turns", type=int, default=3, help="每个对话的轮数（首轮之后为续聊）")
+    run_parser.add_argument("--stream-ratio", type=float, default=0.8, help="流式请求占比")
+    run_parser.add_argument("--questions", type=int, default=len(QUESTIONS), help="首轮问题的种类数（1~8）")
+    run_parser.add_argument("--think-time", type=float, default=0.0, help="两轮之间的平均思考时间（秒）")
+    run_parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+    run_parser.add_argument("--seed", type=int, default=7, help="随机种子")
+    run_parser.add_argument("--metrics-token", default=None, help="/metrics 的 Bearer Token（METRICS_TOKEN）")
+    run_parser.add_argument("--save", help="保存结果（JSON），可作为基线")
+    run_parser.add_argument("--compare", help="与基线结果对比")
+    run_parser.add_argument("--tolerance", type=float, default=0.10, help="对比容差（默认 10%%）")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    else:
+        sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+本地 Coze v3 替身服务（压测用）
+
+提供 /v3/chat（流式与非流式）、/v3/chat/cancel、/v3/chat/retrieve、/v3/chat/message/list，
+流式事件序列与真实 Coze 一致（chat.created → chat.in_progress → message.delta … → message.completed
+→ chat.completed → done）。可配置输出速率、首包延迟分布和错误注入，避免压测打到真实 Coze。
+
+首包延迟服从对数正态分布（中位数 --ttft-ms，离散度 --ttft-sigma），之后按 --tokens-per-second
+逐个输出增量；非流式请求等待完整生成时间后一次返回。错误注入：
+    --error-rate      直接返回 500
+    --throttle-rate   直接返回 429
+    --fail-rate       流式输出若干增量后发送 conversation.chat.failed（非流式返回 code != 0）
+
+用法:
+    cd saas_backend
+    python benchmarks/fake_coze_server.py --port 9000 --tokens-per-second 40 --ttft-ms 400
+    # 后端指向替身服务
+    COZE_API_BASE=http://127.0.0.1:9000 COZE_API_TOKEN=fake uvicorn app.main:app --port 8000
+    # 查看替身服务收到的请求统计
+    curl http://127.0.0.1:9000/fake/stats
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+REPLY_TEXT = (
+    "您好，感谢您的咨询。关于您提到的问题，我们的产品支持多租户部署、知识库检索和多渠道接入，"
+    "订单完成后 7 天内可以在“我的订单”页面申请退款，审核通过后原路退回。"
+    "如果还有其他问题，欢迎随时联系我们的人工客服。"
+)
+
+
+class FakeCozeConfig:
+    """替身服务参数"""
+
+    def __init__(
+        self,
+        tokens_per_second: float = 40.0,
+        reply_tokens: int = 120,
+        ttft_ms: float = 400.0,
+        ttft_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        fail_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+
+    def first_token_delay(self) -> float:
+        """首包延迟（秒）"""
+        if self.ttft_ms <= 0:
+            return 0.0
+        return self.random.lognormvariate(math.log(self.ttft_ms / 1000), self.ttft_sigma)
+
+    def token_interval(self) -> float:
+        """两个增量之间的间隔（秒）"""
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def roll(self, rate: float) -> bool:
+        """按概率注入"""
+        return rate > 0 and self.random.random() < rate
+
+
+class FakeCozeStats:
+    """请求统计（/fake/stats）"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters: Dict[str, int] = {}
+        self.active_streams = 0
+
+    def inc(self, name: str) -> None:
+        """计数"""
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出统计"""
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "active_streams": self.active_streams,
+            **self.counters,
+        }
+
+
+def _tokens(count: int) -> Iterator[str]:
+    """把回复文本切成 1~3 个字的增量（循环使用样例文本）"""
+    position = 0
+    for i in range(count):
+        size = 1 + i % 3
+        piece = REPLY_TEXT[position:position + size] or REPLY_TEXT[:size]
+        position = (position + size) % len(REPLY_TEXT)
+        yield piece
+
+
+def _frame(event: str, data: Any) -> bytes:
+    """编码一个 SSE 事件"""
+    return f"event:{event}\ndata:{json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def create_app(config: FakeCozeConfig) -> FastAPI:
+    """创建替身服务"""
+    app = FastAPI(title="Fake Coze v3")
+    stats = FakeCozeStats()
+
+    def injected_error() -> Optional[JSONResponse]:
+        """请求级错误注入"""
+        if config.roll(config.error_rate):
+            stats.inc("injected_500")
+            return JSONResponse(status_code=500, content={"code": 5000, "msg": "injected internal error"})
+        if config.roll(config.throttle_rate):
+            stats.inc("injected_429")
+            return JSONResponse(status_code=429, content={"code": 4013, "msg": "injected rate limit"})
+        return None
+
+    async def stream_reply(body: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """流式回复"""
+        chat_id = str(uuid.uuid4().int)[:19]
+        conversation_id = body.get("conversation_id") or str(uuid.uuid4().int)[:19]
+        message_id = str(uuid.uuid4().int)[:19]
+        chat = {
+            "id": chat_id,
+            "conversation_id": conversation_id,
+            "bot_id": body.get("bot_id"),
+            "created_at": int(time.time()),
+        }
+        fail = config.roll(config.fail_rate)
+
+        stats.active_streams += 1
+        try:
+            yield _frame("conversation.chat.created", dict(chat, status="created"))
+            yield _frame("conversation.chat.in_progress", dict(chat, status="in_progress"))
+            await asyncio.sleep(config.first_token_delay())
+
+            interval = config.token_interval()
+            content = []
+            for piece in _tokens(config.reply_tokens):
+                content.append(piece)
+                yield _frame("conversation.message.delta", {
+                    "id": message_id, "conversation_id": conversation_id, "bot_id": body.get("bot_id"),
+                    "chat_id": chat_id, "role": "assistant", "type": "answer",
+                    "content": piece, "content_type": "text",
+                })
+                if fail and len(content) >= 5:
+                    stats.inc("injected_stream_failures")
+                    yield _frame("conversation.chat.failed", dict(
+                        chat, status="failed", last_error={"code": 5000, "msg": "injected failure"},
+                    ))
+                    yield _frame("done", "[DONE]")
+                    return
+                if interval:
+                    await asyncio.sleep(interval)
+
+            yield _frame("conversation.message.completed", {
+                "id": message_id, "conversation_id": conversation_id, "bot_id": body.get("bot_id"),
+                "chat_id": chat_id, "role": "assistant", "type": "answer",
+                "content": "".join(content), "content_type": "text",
+            })
+            yield _frame("conversation.chat.completed", dict(
+                chat, status="completed",
+                usage={"token_count": len(content) + 20, "output_count": len(content), "input_count": 20},
+            ))
+            yield b'event:done\ndata:"[DONE]"\n\n'
+            stats.inc("streams_completed")
+        except (asyncio.CancelledError, GeneratorExit):
+            # 调用方提前断开
+            stats.inc("streams_disconnected")
+            raise
+        finally:
+            stats.active_streams -= 1
+
+    @app.post("/v3/chat")
+    async def chat(request: Request, authorization: Optional[str] = Header(None)):
+        if not authorization or not authorization.startswith("Bearer "):
+            stats.inc("unauthorized")
+            return JSONResponse(status_code=401, content={"code": 4100, "msg": "missing token"})
+
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        stats.inc("chat_stream_requests" if stream else "chat_requests")
+
+        error = injected_error()
+        if error is not None:
+            return error
+
+        if stream:
+            return StreamingResponse(
+                stream_reply(body),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        # 非流式：等待完整生成时间后返回（格式与 CozeService.chat 的解析一致）
+        await asyncio.sleep(config.first_token_delay() + config.token_interval() * config.reply_tokens)
+        conversation_id = body.get("conversation_id") or str(uuid.uuid4().int)[:19]
+        if config.roll(config.fail_rate):
+            stats.inc("injected_chat_failures")
+            return {"code": 5000, "msg": "injected failure", "conversation_id": conversation_id, "data": []}
+
+        content = "".join(_tokens(config.reply_tokens))
+        return {
+            "code": 0,
+            "msg": "",
+            "conversation_id": conversation_id,
+            "data": [{
+                "id": str(uuid.uuid4().int)[:19],
+                "conversation_id": conversation_id,
+                "role": "assistant",
+                "type": "answer",
+                "content": content,
+                "content_type": "text",
+            }],
+        }
+
+    @app.post("/v3/chat/cancel")
+    async def cancel(request: Request):
+        body = await request.json()
+        stats.inc("cancels")
+        return {"code": 0, "msg": "", "data": {
+            "id": body.get("chat_id"), "conversation_id": body.get("conversation_id"), "status": "canceled",
+        }}
+
+    @app.get("/v3/chat/retrieve")
+    async def retrieve(conversation_id: str, chat_id: str):
+        stats.inc("retrieves")
+        return {"code": 0, "msg": "", "data": {
+            "id": chat_id, "conversation_id": conversation_id, "status": "completed",
+        }}
+
+    @app.get("/v3/chat/message/list")
+    async def message_list(conversation_id: str, chat_id: str):
+        stats.inc("message_lists")
+        content = "".join(_tokens(config.reply_tokens))
+        return {"code": 0, "msg": "", "data": [{
+            "id": str(uuid.uuid4().int)[:19], "conversation_id": conversation_id, "chat_id": chat_id,
+            "role": "assistant", "type": "answer", "content": content, "content_type": "text",
+        }]}
+
+    @app.get("/fake/stats")
+    async def fake_stats():
+        return stats.snapshot()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Coze v3 替身服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=9000, help="监听端口")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="每条流的增量输出速率（0 表示不限）")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="每个回复的增量数")
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="首包延迟中位数（毫秒）")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="首包延迟对数正态分布的 sigma（0 为固定延迟）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="生成失败（chat.failed）的概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（复现延迟和错误序列）")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeCozeConfig(
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        ttft_ms=args.ttft_ms,
+        ttft_sigma=args.ttft_sigma,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        fail_rate=args.fail_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+登录（bcrypt）吞吐基准
+
+三个子命令:
+    cost   各 bcrypt cost 下单次哈希 / 校验耗时，以及单线程每秒可完成的登录数，用于选择 PASSWORD_BCRYPT_ROUNDS
+    local  进程内对比：在事件循环中直接校验（旧实现）与在密码哈希线程池中校验，
+           报告每秒登录数、校验延迟分位数和事件循环最大卡顿（卡顿即同一 worker 上所有 SSE 流的停顿）
+    http   对运行中的服务并发登录（账号文件由 chat_loadtest.py seed 生成），同时探测 /health 延迟；
+           用 --workers 指定服务的 worker 数，输出每 worker 每秒登录数
+
+用法:
+    cd saas_backend
+    python benchmarks/login_benchmark.py cost --rounds 10 11 12 13
+    python benchmarks/login_benchmark.py local --rounds 12 --concurrency 32 --logins 200
+    python benchmarks/chat_loadtest.py seed --users 50 --out loadtest_users.json
+    python benchmarks/login_benchmark.py http --base-url http://localhost:8000 --users-file loadtest_users.json \\
+        --concurrency 32 --duration 30 --workers 1
+"""
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoopLagProbe:
+    """事件循环卡顿探测：每隔 interval 醒来一次，记录实际醒来时间比预期晚多少"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+# ============================================
+# cost：各 cost 的耗时
+# ============================================
+
+def run_cost(args) -> None:
+    """各 bcrypt cost 下的哈希 / 校验耗时"""
+    from passlib.context import CryptContext
+
+    print(f"{'cost':>5} {'hash_ms':>9} {'verify_ms':>10} {'logins/s/thread':>16}")
+    for rounds in args.rounds:
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        hashes, verifies = [], []
+        hashed = context.hash(PASSWORD)
+        for _ in range(args.samples):
+            started = time.perf_counter()
+            context.hash(PASSWORD)
+            hashes.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            context.verify(PASSWORD, hashed)
+            verifies.append(time.perf_counter() - started)
+
+        verify = statistics.median(verifies)
+        print(f"{rounds:>5} {statistics.median(hashes) * 1000:>9.1f} {verify * 1000:>10.1f} {1 / verify:>16.1f}")
+
+
+# ============================================
+# local：进程内对比
+# ============================================
+
+async def _local_round(mode: str, hashed: str, concurrency: int, logins: int) -> Dict[str, float]:
+    """并发执行 logins 次校验，返回吞吐、延迟和事件循环卡顿"""
+    from app.core.security import verify_password, verify_password_async
+
+    latencies: List[float] = []
+    remaining = logins
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            if mode == "inline":
+                ok = verify_password(PASSWORD, hashed)
+            else:
+                ok = await verify_password_async(PASSWORD, hashed)
+            assert ok
+            latencies.append(time.perf_counter() - started)
+            # inline 模式下让出一次，模拟请求之间的调度
+            await asyncio.sleep(0)
+
+    probe = LoopLagProbe()
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await probe.stop()
+
+    latencies.sort()
+    lags = sorted(probe.lags)
+    return {
+        "logins_per_second": logins / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 0.99) * 1000,
+        "loop_lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+    }
+
+
+def run_local(args) -> None:
+    """进程内对比 inline 与线程池"""
+    from passlib.context import CryptContext
+    from app.core.config import settings
+
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds).hash(PASSWORD)
+    print(f"cost={args.rounds} 并发={args.concurrency} 登录数={args.logins} "
+          f"PASSWORD_HASH_WORKERS={settings.PASSWORD_HASH_WORKERS}")
+    print(f"{'mode':>7} {'logins/s':>9} {'p50_ms':>8} {'p99_ms':>8} {'loop_lag_p99_ms':>16} {'loop_lag_max_ms':>16}")
+    for mode in ("inline", "pool"):
+        result = asyncio.run(_local_round(mode, hashed, args.concurrency, args.logins))
+        print(f"{mode:>7} {result['logins_per_second']:>9.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['loop_lag_p99_ms']:>16.1f} {result['loop_lag_max_ms']:>16.1f}")
+
+
+# ============================================
+# http：对运行中的服务压测
+# ============================================
+
+async def _run_http(args) -> None:
+    accounts = json.loads(Path(args.users_file).read_text(encoding="utf-8"))
+    if not accounts:
+        raise SystemExit("账号文件为空")
+
+    latencies: List[float] = []
+    health_latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        deadline = time.perf_counter() + args.duration
+
+        async def login_worker(index: int) -> None:
+            nonlocal errors
+            account = accounts[index % len(accounts)]
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/api/v1/auth/login",
+                        data={"username": account["email"], "password": account["password"]},
+                    )
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        async def health_probe() -> None:
+            # 轻量请求的延迟反映 worker 事件循环是否被登录阻塞
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    (await client.get("/health")).raise_for_status()
+                    health_latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        await asyncio.gather(health_probe(), *(login_worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    health_latencies.sort()
+    total = len(latencies) / elapsed
+    print(f"登录成功 {len(latencies)} 次，失败 {errors} 次，耗时 {elapsed:.1f}s")
+    print(f"吞吐 {total:.1f} 次/秒（每 worker {total / args.workers:.1f} 次/秒）")
+    print(f"登录延迟 p50={percentile(latencies, 0.50) * 1000:.0f}ms p99={percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"/health 延迟 p50={percentile(health_latencies, 0.50) * 1000:.1f}ms "
+          f"p99={percentile(health_latencies, 0.99) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录（bcrypt）吞吐基准")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cost_parser = commands.add_parser("cost", help="各 bcrypt cost 的哈希 / 校验耗时")
+    cost_parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13], help="bcrypt cost")
+    cost_parser.add_argument("--samples", type=int, default=5, help="每个 cost 的采样次数")
+
+    local_parser = commands.add_parser("local", help="进程内对比事件循环内校验与线程池校验")
+    local_parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    local_parser.add_argument("--concurrency", type=int, default=32, help="并发登录数")
+    local_parser.add_argument("--logins", type=int, default=100, help="每种模式的登录次数")
+
+    http_parser = commands.add_parser("http", help="对运行中的服务并发登录")
+    http_parser.add_argument("--base-url", default="http://localhost:8000", help="服务地址")
+    http_parser.add_argument("--users-file", default="loadtest_users.json", help="chat_loadtest.py seed 生成的账号文件")
+    http_parser.add_argument("--concurrency", type=int, default=32, help="并发登录数")
+    http_parser.add_argument("--duration", type=float, default=30.0, help="压测时长（秒）")
+    http_parser.add_argument("--workers", type=int, default=1, help="服务的 worker 数（用于折算每 worker 吞吐）")
+    http_parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+
+    args = parser.parse_args()
+    if args.command == "cost":
+        run_cost(args)
+    elif args.command == "local":
+        run_local(args)
+    else:
+        asyncio.run(_run_http(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+SSE 帧编码微基准：ChatStreamChunk.model_dump_json() + 字符串拼接 vs SSEFrameEncoder + 列表累积
+
+用法:
+    cd saas_backend
+    python benchmarks/sse_encoder_benchmark.py --deltas 2000 --rounds 200
+"""
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.schemas.conversation import ChatStreamChunk
+from app.services.sse_encoder import SSEFrameEncoder
+
+
+def make_deltas(count: int) -> list:
+    """构造模拟的 Coze 增量（中英文混合、含需要转义的字符，1~4 个字符一段）"""
+    text = '您好，关于退款问题："订单完成后 7 天内可申请"。\nPlease check your order page. '
+    deltas = []
+    position = 0
+    for i in range(count):
+        size = 1 + i % 4
+        deltas.append(text[position:position + size] or text[:size])
+        position = (position + size) % len(text)
+    return deltas
+
+
+def pydantic_path(deltas: list, conversation_id: str, message_id: str) -> int:
+    """改造前：每帧构造 pydantic 模型并序列化，回复内容用 += 累积"""
+    full_content = ""
+    total = 0
+    for content in deltas:
+        full_content += content
+        chunk = ChatStreamChunk(
+            type="message",
+            content=content,
+            message_id=message_id,
+            conversation_id=conversation_id,
+        )
+        total += len(f"data: {chunk.model_dump_json()}\n\n")
+    total += len(f"data: {ChatStreamChunk(type='done').model_dump_json()}\n\n")
+    return total + len(full_content)
+
+
+def encoder_path(deltas: list, conversation_id: str, message_id: str) -> int:
+    """改造后：预渲染模板 + JSON 字符串转义，回复内容用列表累积"""
+    encoder = SSEFrameEncoder(conversation_id)
+    content_parts = []
+    total = 0
+    for content in deltas:
+        content_parts.append(content)
+        total += len(encoder.message(content, message_id))
+    total += len(encoder.done())
+    return total + len("".join(content_parts))
+
+
+def bench(func, deltas: list, rounds: int) -> float:
+    """返回每秒编码帧数"""
+    conversation_id = str(uuid.uuid4())
+    message_id = "7381234567890123456"
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(deltas, conversation_id, message_id)
+    elapsed = time.perf_counter() - started
+    return rounds * (len(deltas) + 1) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 帧编码微基准")
+    parser.add_argument("--deltas", type=int, default=2000, help="每条回复的增量数")
+    parser.add_argument("--rounds", type=int, default=200, help="回复条数")
+    args = parser.parse_args()
+
+    deltas = make_deltas(args.deltas)
+    assert pydantic_path(deltas, "c", "m") == encoder_path(deltas, "c", "m")
+
+    baseline = bench(pydantic_path, deltas, args.rounds)
+    optimized = bench(encoder_path, deltas, args.rounds)
+
+    print(f"pydantic model_dump_json: {baseline:>12,.0f} 帧/秒")
+    print(f"SSEFrameEncoder:          {optimized:>12,.0f} 帧/秒")
+    print(f"加速比:                   {optimized / baseline:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Coze 流式响应解析基准：aiter_lines() + 逐行 json.loads vs aiter_raw() + SSEParser（按需解码）
+
+可以用真实录制的 Coze 流（原始字节）做输入，例如:
+    curl -N https://api.coze.cn/v3/chat -H "Authorization: Bearer $COZE_API_TOKEN" \\
+        -H "Content-Type: application/json" -d '{"bot_id": "...", "user_id": "u", "stream": true,
+        "additional_messages": [{"role": "user", "content": "介绍一下你们的产品", "content_type": "text"}]}' \\
+        > coze_stream.sse
+
+用法:
+    cd saas_backend
+    python benchmarks/sse_parser_benchmark.py --recording coze_stream.sse --rounds 200
+    python benchmarks/sse_parser_benchmark.py --deltas 1500 --rounds 200   # 使用按 Coze 格式生成的流
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.coze_service import STREAM_EVENTS
+from app.services.sse_parser import SSEParser
+
+
+def synthesize_stream(deltas: int) -> bytes:
+    """按 Coze v3 流式响应的格式生成一条回复"""
+    ids = {
+        "id": "7382159487609323539",
+        "conversation_id": "7382159487609307155",
+        "bot_id": "7379462189365198898",
+        "chat_id": "7382159487609323539",
+        "section_id": "7382159487609307155",
+    }
+    text = "您好，关于退款问题：订单完成后 7 天内可在“我的订单”页面申请，审核通过后原路退回。"
+    frames = [
+        ("conversation.chat.created", dict(ids, status="created", created_at=1718792949)),
+        ("conversation.chat.in_progress", dict(ids, status="in_progress", created_at=1718792949)),
+    ]
+    content = []
+    position = 0
+    for i in range(deltas):
+        piece = text[position:position + 1 + i % 3] or text[:2]
+        position = (position + len(piece)) % len(text)
+        content.append(piece)
+        frames.append(("conversation.message.delta", {
+            "id": "7382159494123470858", "conversation_id": ids["conversation_id"],
+            "bot_id": ids["bot_id"], "role": "assistant", "type": "answer",
+            "content": piece, "content_type": "text", "chat_id": ids["chat_id"],
+        }))
+    full = "".join(content)
+    frames.append(("conversation.message.completed", {
+        "id": "7382159494123470858", "conversation_id": ids["conversation_id"],
+        "bot_id": ids["bot_id"], "role": "assistant", "type": "answer",
+        "content": full, "content_type": "text", "chat_id": ids["chat_id"],
+    }))
+    for follow_up in ("还有其他问题吗？", "如何查看退款进度？", "退款多久到账？"):
+        frames.append(("conversation.message.completed", {
+            "id": "7382159494123470859", "conversation_id": ids["conversation_id"],
+            "role": "assistant", "type": "follow_up", "content": follow_up, "content_type": "text",
+        }))
+    frames.append(("conversation.chat.completed", dict(
+        ids, status="completed", usage={"token_count": 633, "output_count": 265, "input_count": 368},
+    )))
+
+    body = "".join(
+        f"event:{event}\ndata:{json.dumps(data, ensure_ascii=False)}\n\n" for event, data in frames
+    )
+    return (body + 'event:done\ndata:"[DONE]"\n\n').encode("utf-8")
+
+
+def split_chunks(raw: bytes, seed: int = 7) -> List[bytes]:
+    """按网络读取的粒度切块（1 字节 ~ 1.5 KB，含拆开的多字节字符和半帧）"""
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(raw):
+        size = rng.choice((1, 7, 64, 300, 512, 1460))
+        chunks.append(raw[position:position + size])
+        position += size
+    return chunks
+
+
+def make_response(chunks: List[bytes]) -> httpx.Response:
+    """构造与真实传输一致的流式响应"""
+    async def body():
+        for chunk in chunks:
+            yield chunk
+    return httpx.Response(200, content=body())
+
+
+async def lines_path(chunks: List[bytes]) -> int:
+    """改造前：aiter_lines() 逐行解码为 str，每个 data 行都 json.loads"""
+    count = 0
+    async for line in make_response(chunks).aiter_lines():
+        if line.startswith("data:"):
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                json.loads(data)
+                count += 1
+            except json.JSONDecodeError:
+                continue
+    return count
+
+
+async def parser_path(chunks: List[bytes]) -> int:
+    """改造后：aiter_raw() 字节块增量解析，只解码需要的事件"""
+    count = 0
+    parser = SSEParser()
+    async for raw in make_response(chunks).aiter_raw():
+        for event in parser.feed(raw):
+            if event.event == "done":
+                return count
+            if event.event in STREAM_EVENTS:
+                event.json()
+                count += 1
+    return count
+
+
+async def bench(func, chunks: List[bytes], rounds: int) -> float:
+    """返回耗时（秒）"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await func(chunks)
+    return time.perf_counter() - started
+
+
+async def run(args) -> None:
+    raw = Path(args.recording).read_bytes() if args.recording else synthesize_stream(args.deltas)
+    chunks = split_chunks(raw)
+    events = raw.count(b"\n\n")
+
+    # 预热
+    await lines_path(chunks)
+    await parser_path(chunks)
+
+    baseline = await bench(lines_path, chunks, args.rounds)
+    optimized = await bench(parser_path, chunks, args.rounds)
+
+    total_mb = len(raw) * args.rounds / 1024 / 1024
+    print(f"流大小: {len(raw):,} 字节，{events} 个事件，{len(chunks)} 个字节块")
+    print(f"aiter_lines + json.loads: {events * args.rounds / baseline:>12,.0f} 事件/秒  {total_mb / baseline:>8.1f} MB/s")
+    print(f"aiter_raw + SSEParser:    {events * args.rounds / optimized:>12,.0f} 事件/秒  {total_mb / optimized:>8.1f} MB/s")
+    print(f"加速比:                   {baseline / optimized:>12.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coze 流式响应解析基准")
+    parser.add_argument("--recording", help="录制的 Coze 流（原始字节）；不指定时按 Coze 格式生成")
+    parser.add_argument("--deltas", type=int, default=1500, help="生成流的增量事件数")
+    parser.add_argument("--rounds", type=int, default=200, help="解析轮数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
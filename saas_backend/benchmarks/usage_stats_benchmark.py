@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+使用量统计基准：逐行加载明细 vs 明细 GROUP BY vs 日汇总表
+
+为一个组织生成 N 条使用量明细（均匀分布在最近 --days 天、三种资源类型），回填日汇总表后对比：
+    legacy  原实现：加载期间内全部 UsageRecord 到 Python 后分三遍求和
+    raw     明细表上的一条 GROUP BY
+    rollup  UsageService.get_usage_stats（汇总表 GROUP BY + 当天明细）
+输出耗时和 Python 内存峰值（tracemalloc）。
+
+用法:
+    cd saas_backend
+    DATABASE_URL=sqlite:///./bench_usage.db python benchmarks/usage_stats_benchmark.py --records 10000000
+    # 已生成过数据时跳过生成；明细很多时原实现会占用数 GB 内存，可用 --skip-legacy 跳过
+    DATABASE_URL=sqlite:///./bench_usage.db python benchmarks/usage_stats_benchmark.py --reuse --skip-legacy
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, insert
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+from app.models import User, Organization, UsageRecord  # noqa: F401  注册所有模型
+from app.models.organization import PlanType
+from app.services.usage_service import UsageService
+
+
+RESOURCE_TYPES = ("message", "api_call", "storage")
+BENCH_ORG_NAME = "usage bench org"
+
+
+def seed(records: int, days: int, batch_size: int) -> str:
+    """生成基准数据，返回组织 ID"""
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        user = User(email=f"usage_{uuid.uuid4().hex[:8]}@bench.local", username="usage bench")
+        db.add(user)
+        db.flush()
+        org = Organization(name=BENCH_ORG_NAME, owner_id=user.id, plan_type=PlanType.ENTERPRISE)
+        db.add(org)
+        db.commit()
+        org_id, user_id = org.id, user.id
+    finally:
+        db.close()
+
+    today = date.today()
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    written = 0
+    with engine.begin() as conn:
+        while written < records:
+            size = min(batch_size, records - written)
+            rows = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "organization_id": org_id,
+                    "user_id": user_id,
+                    "resource_type": RESOURCE_TYPES[i % len(RESOURCE_TYPES)],
+                    "quantity": 1,
+                    "created_at": now,
+                    "date": today - timedelta(days=(written + i) % days),
+                }
+                for i in range(size)
+            ]
+            conn.execute(insert(UsageRecord), rows)
+            written += size
+            print(f"\r生成明细 {written}/{records}", end="", flush=True)
+    print(f"\n生成耗时 {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        usage_service = UsageService(db)
+        for offset in range(1, days):
+            usage_service.rebuild_rollup(today - timedelta(days=offset), organization_id=org_id)
+        print(f"回填汇总耗时 {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+    return org_id
+
+
+def find_org() -> str:
+    """复用已生成的数据"""
+    db = SessionLocal()
+    try:
+        org = db.query(Organization).filter(Organization.name == BENCH_ORG_NAME).first()
+        if org is None:
+            raise SystemExit("没有找到基准数据，请去掉 --reuse 重新生成")
+        return org.id
+    finally:
+        db.close()
+
+
+def legacy_stats(db, org_id: str, period_start: date, period_end: date) -> dict:
+    """原实现：逐行加载后在 Python 中求和"""
+    usage_records = db.query(UsageRecord).filter(
+        UsageRecord.organization_id == org_id,
+        UsageRecord.date >= period_start,
+        UsageRecord.date <= period_end,
+    ).all()
+    return {
+        resource_type: sum(r.quantity for r in usage_records if r.resource_type == resource_type)
+        for resource_type in RESOURCE_TYPES
+    }
+
+
+def raw_stats(db, org_id: str, period_start: date, period_end: date) -> dict:
+    """明细表上的 GROUP BY"""
+    rows = db.query(UsageRecord.resource_type, func.sum(UsageRecord.quantity)).filter(
+        UsageRecord.organization_id == org_id,
+        UsageRecord.date >= period_start,
+        UsageRecord.date <= period_end,
+    ).group_by(UsageRecord.resource_type).all()
+    return {resource_type: int(total) for resource_type, total in rows}
+
+
+def rollup_stats(db, org_id: str, period_start: date, period_end: date) -> dict:
+    """日汇总表（当前实现）"""
+    stats = UsageService(db).get_usage_stats(org_id, period_start, period_end)
+    return {
+        "message": stats.messages_used,
+        "api_call": stats.api_calls_used,
+        "storage": stats.storage_used_mb,
+    }
+
+
+def measure(name: str, fn, org_id: str, period_start: date, period_end: date, repeat: int) -> dict:
+    """多次执行取中位数耗时，首次执行记录内存峰值"""
+    timings = []
+    peak = 0
+    result = None
+    for i in range(repeat):
+        db = SessionLocal()
+        try:
+            if i == 0:
+                tracemalloc.start()
+            started = time.perf_counter()
+            result = fn(db, org_id, period_start, period_end)
+            timings.append(time.perf_counter() - started)
+            if i == 0:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        finally:
+            db.close()
+    return {
+        "name": name,
+        "median_ms": statistics.median(timings) * 1000,
+        "peak_mb": peak / 1024 / 1024,
+        "result": result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用量统计基准")
+    parser.add_argument("--records", type=int, default=1_000_000, help="明细条数")
+    parser.add_argument("--days", type=int, default=30, help="明细分布的天数")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="生成数据的批大小")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式的执行次数")
+    parser.add_argument("--reuse", action="store_true", help="复用已生成的数据")
+    parser.add_argument("--skip-legacy", action="store_true", help="跳过原实现（明细很多时内存占用很大）")
+    args = parser.parse_args()
+
+    org_id = find_org() if args.reuse else seed(args.records, args.days, args.batch_size)
+    period_end = date.today()
+    period_start = period_end - timedelta(days=args.days - 1)
+
+    print(f"数据库: {os.getenv('DATABASE_URL', '(默认)')}")
+    print(f"{'方式':<8}{'耗时(ms)':>12}{'内存峰值(MB)':>16}  结果")
+    modes = [("raw", raw_stats), ("rollup", rollup_stats)]
+    if not args.skip_legacy:
+        modes.insert(0, ("legacy", legacy_stats))
+    for name, fn in modes:
+        result = measure(name, fn, org_id, period_start, period_end, args.repeat)
+        print(f"{result['name']:<8}{result['median_ms']:>12.1f}{result['peak_mb']:>16.1f}  {result['result']}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+回填使用量日汇总表 usage_daily_rollup
+
+按天从 usage_records 重算汇总（先删后插，每天一个事务，可重复执行）。
+上线后需在部署当天结束后执行一次，覆盖部署当天及之前的所有日期；默认截止到昨天，
+当天的统计始终直接读明细行，不依赖回填。
+
+用法:
+    cd saas_backend
+    python scripts/backfill_usage_rollup.py                       # 从最早的明细到昨天
+    python scripts/backfill_usage_rollup.py --start 2024-01-01 --end 2024-03-31
+    python scripts/backfill_usage_rollup.py --organization-id <组织ID>
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import func
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.session import SessionLocal
+from app.models import UsageRecord
+from app.services.usage_service import UsageService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填使用量日汇总表")
+    parser.add_argument("--start", type=date.fromisoformat, help="开始日期（默认最早的明细日期）")
+    parser.add_argument("--end", type=date.fromisoformat, help="结束日期（默认昨天）")
+    parser.add_argument("--organization-id", help="只回填指定组织")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = args.start
+        if start is None:
+            query = db.query(func.min(UsageRecord.date))
+            if args.organization_id:
+                query = query.filter(UsageRecord.organization_id == args.organization_id)
+            start = query.scalar()
+            if start is None:
+                print("没有使用量明细，无需回填")
+                return
+        end = args.end or date.today() - timedelta(days=1)
+
+        usage_service = UsageService(db)
+        day = start
+        total_rows = 0
+        started = time.perf_counter()
+        while day <= end:
+            rows = usage_service.rebuild_rollup(day, organization_id=args.organization_id)
+            total_rows += rows
+            print(f"{day}: {rows} 行")
+            day += timedelta(days=1)
+
+        print(f"✅ 回填完成：{start} ~ {end}，共 {total_rows} 行，耗时 {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
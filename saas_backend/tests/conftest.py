@@ -0,0 +1,149 @@
+"""
+测试公共配置
+使用临时 SQLite 数据库（需在导入 app 之前设置 DATABASE_URL），关闭限流以免接口测试互相影响。
+"""
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+_db_dir = tempfile.mkdtemp(prefix="saas_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ["RATE_LIMIT_ENABLED"] = "False"
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """启动应用（含 lifespan）的测试客户端"""
+    from fastapi.testclient import TestClient
+
+    from app.db.session import init_db
+    from app.main import app
+
+    init_db()
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_member(client):
+    """
+    创建用户、组织和成员关系
+
+    Returns:
+        工厂函数 (is_org_admin=False, organization_id=None) -> (user_id, organization_id, headers)
+    """
+    from app.core.security import create_access_token
+    from app.db.session import SessionLocal
+    from app.models import Organization, OrganizationMember, User
+
+    def factory(is_org_admin: bool = False, organization_id: str = None):
+        db = SessionLocal()
+        try:
+            user = User(
+                email=f"{uuid.uuid4().hex[:12]}@example.com",
+                username="test",
+                is_org_admin=is_org_admin,
+            )
+            db.add(user)
+            db.flush()
+            if organization_id is None:
+                org = Organization(name=f"org {uuid.uuid4().hex[:8]}", owner_id=user.id)
+                db.add(org)
+                db.flush()
+                organization_id = org.id
+            db.add(OrganizationMember(organization_id=organization_id, user_id=user.id))
+            db.commit()
+            user_id = user.id
+        finally:
+            db.close()
+        headers = {"Authorization": f"Bearer {create_access_token(user_id)}"}
+        return user_id, organization_id, headers
+
+    return factory
+
+
+@pytest.fixture
+def make_bot(client):
+    """创建机器人：工厂函数 (organization_id, coze_bot_id) -> 机器人 ID"""
+    from app.db.session import SessionLocal
+    from app.models import Bot
+
+    def factory(organization_id: str, coze_bot_id: str = "coze-bot") -> str:
+        db = SessionLocal()
+        try:
+            bot = Bot(organization_id=organization_id, name="test bot", bot_id=coze_bot_id)
+            db.add(bot)
+            db.commit()
+            return bot.id
+        finally:
+            db.close()
+
+    return factory
+
+
+class FakeCoze:
+    """替换 coze_service 的上游调用，记录每次调用的参数"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.chats = []
+        self.created = []
+
+    async def chat(self, bot_id, message, conversation_id=None, user_id="default_user"):
+        import asyncio
+
+        self.chats.append({"message": message, "conversation_id": conversation_id})
+        await asyncio.sleep(self.delay)
+        return {
+            "conversation_id": conversation_id or f"coze-{len(self.chats)}",
+            "data": [{"type": "answer", "content": f"answer to {message}", "id": f"m{len(self.chats)}"}],
+        }
+
+    async def chat_stream(self, bot_id, message, conversation_id=None, user_id="default_user", events=None):
+        import asyncio
+
+        self.chats.append({"message": message, "conversation_id": conversation_id})
+        coze_conversation_id = conversation_id or f"coze-{len(self.chats)}"
+        yield {"event": "conversation.chat.created", "data": {"id": "chat", "conversation_id": coze_conversation_id}}
+        await asyncio.sleep(self.delay)
+        for part in ("answer to ", message):
+            yield {
+                "event": "conversation.message.delta",
+                "data": {"id": "m", "content": part, "type": "answer", "conversation_id": coze_conversation_id},
+            }
+        yield {"type": "done"}
+
+    async def create_conversation(self, bot_id, user_id="default_user", messages=None):
+        self.created.append(messages)
+        return {"id": f"seeded-{len(self.created)}"}
+
+
+@pytest.fixture
+def fake_coze(monkeypatch):
+    """上游 Coze 替身（非流式调用延迟 0.2 秒，便于并发请求重叠）"""
+    from app.services.coze_service import coze_service
+
+    fake = FakeCoze(delay=0.2)
+    monkeypatch.setattr(coze_service, "chat", fake.chat)
+    monkeypatch.setattr(coze_service, "chat_stream", fake.chat_stream)
+    monkeypatch.setattr(coze_service, "create_conversation", fake.create_conversation)
+    return fake
+
+
+def conversation_row(conversation_id: str):
+    """读取对话行"""
+    from app.db.session import SessionLocal
+    from app.models import Conversation
+
+    db = SessionLocal()
+    try:
+        return db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    finally:
+        db.close()
@@ -0,0 +1,33 @@
+"""
+回答缓存：知识库变更对其他 worker 的缓存同样生效
+"""
+from app.db.session import SessionLocal
+from app.models import Bot
+from app.services.answer_cache import AnswerCache
+
+
+def _load_bot(bot_id):
+    db = SessionLocal()
+    try:
+        return db.get(Bot, bot_id)
+    finally:
+        db.close()
+
+
+def test_knowledge_change_invalidates_other_workers(client, make_member, make_bot):
+    _, org_id, _ = make_member()
+    bot_id = make_bot(org_id)
+    # 两个 worker 各自的进程内缓存
+    worker_a, worker_b = AnswerCache(), AnswerCache()
+
+    worker_a.set(_load_bot(bot_id), "营业时间？", "9:00-18:00")
+    assert worker_a.get(_load_bot(bot_id), "营业时间") is not None
+
+    # 知识库编辑落在 worker B 上
+    db = SessionLocal()
+    try:
+        worker_b.invalidate_org_knowledge(db, org_id)
+    finally:
+        db.close()
+
+    assert worker_a.get(_load_bot(bot_id), "营业时间？") is None
@@ -0,0 +1,103 @@
+"""
+API 密钥：权限范围展开、负缓存、吊销后缓存失效
+"""
+from app.core.config import settings
+from app.core.security import hash_api_key
+from app.db.session import SessionLocal
+from app.services.api_key_service import APIKeyService, api_key_cache, compile_scopes
+
+
+def test_hash_uses_dedicated_secret(monkeypatch):
+    digest = hash_api_key("sk_test")
+    monkeypatch.setattr(settings, "SECRET_KEY", "rotated-jwt-secret")
+    assert hash_api_key("sk_test") == digest
+    monkeypatch.setattr(settings, "API_KEY_HMAC_SECRET", "another-secret")
+    assert hash_api_key("sk_test") != digest
+
+
+def test_compile_scopes():
+    assert compile_scopes(["*"]) == {"chat", "usage:read", "usage:write"}
+    assert compile_scopes(["usage:*"]) == {"usage:read", "usage:write"}
+    assert compile_scopes(["chat", "unknown", "billing:*"]) == {"chat"}
+    assert compile_scopes(None) == frozenset()
+
+
+def test_unknown_key_is_negatively_cached(client, monkeypatch):
+    loads = []
+    db = SessionLocal()
+    try:
+        service = APIKeyService(db)
+        load = service._load
+
+        def counting(key_hash):
+            loads.append(key_hash)
+            return load(key_hash)
+
+        monkeypatch.setattr(service, "_load", counting)
+        assert service.authenticate("sk_unknown-key-for-negative-cache") is None
+        assert service.authenticate("sk_unknown-key-for-negative-cache") is None
+    finally:
+        db.close()
+
+    assert len(loads) == 1
+
+
+def test_revoked_key_is_rejected_immediately(client, make_member):
+    user_id, org_id, _ = make_member(is_org_admin=True)
+    db = SessionLocal()
+    try:
+        service = APIKeyService(db)
+        api_key, raw_key = service.create_key(org_id, user_id, "test", ["chat"])
+        principal = service.authenticate(raw_key)
+        assert principal is not None and principal.allows("chat") and not principal.allows("usage:read")
+
+        service.revoke_key(org_id, api_key.id)
+        assert api_key_cache.peek(api_key.key_hash) is None
+        assert service.authenticate(raw_key) is None
+    finally:
+        db.close()
+
+
+def test_cached_key_is_authenticated_without_the_threadpool(client, make_member, monkeypatch):
+    user_id, org_id, _ = make_member(is_org_admin=True)
+    db = SessionLocal()
+    try:
+        _, raw_key = APIKeyService(db).create_key(org_id, user_id, "test", ["usage:read"])
+    finally:
+        db.close()
+
+    loads = []
+    authenticate_hash = APIKeyService.authenticate_hash
+
+    def counting(self, key_hash):
+        loads.append(key_hash)
+        return authenticate_hash(self, key_hash)
+
+    monkeypatch.setattr(APIKeyService, "authenticate_hash", counting)
+    for _ in range(3):
+        response = client.get(
+            "/api/v1/usage/history", params={"organization_id": org_id}, headers={"X-API-Key": raw_key}
+        )
+        assert response.status_code == 200, response.text
+
+    assert len(loads) == 1
+
+
+def test_plan_change_invalidates_cached_keys(client, make_member):
+    from app.models import Order
+    from app.models.organization import PlanType
+    from app.services.payment_service import PaymentService
+
+    user_id, org_id, _ = make_member(is_org_admin=True)
+    db = SessionLocal()
+    try:
+        service = APIKeyService(db)
+        api_key, raw_key = service.create_key(org_id, user_id, "test", ["chat"])
+        assert service.authenticate(raw_key).plan == "free"
+
+        order = Order(organization_id=org_id, plan_type=PlanType.PRO, billing_cycle="monthly")
+        PaymentService(db)._activate_subscription(order)
+        assert api_key_cache.peek(api_key.key_hash) is None
+        assert service.authenticate(raw_key).plan == "pro"
+    finally:
+        db.close()
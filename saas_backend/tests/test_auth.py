@@ -0,0 +1,44 @@
+"""
+注册 / 登录：数据库操作不在事件循环线程上执行
+"""
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from app.db.session import engine
+
+
+@pytest.fixture
+def loop_queries():
+    """记录在事件循环线程上执行的同步查询"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_register_and_login_keep_queries_off_the_event_loop(client, loop_queries):
+    email = f"auth-{uuid.uuid4().hex[:8]}@example.com"
+
+    response = client.post("/api/v1/auth/register", json={"email": email, "password": "secret-password"})
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == email
+
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "secret-password"})
+    assert response.status_code == 200, response.text
+    assert response.json()["access_token"]
+
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "wrong-password"})
+    assert response.status_code == 401
+
+    assert loop_queries == []
@@ -0,0 +1,105 @@
+"""
+请求合并（single-flight）
+"""
+import asyncio
+
+import pytest
+
+from app.services.chat_coalescer import ChatCoalescer
+
+
+def test_followers_share_one_upstream_call():
+    async def scenario():
+        coalescer = ChatCoalescer()
+        calls = 0
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(coalescer.call(("bot", "q"), factory) for _ in range(3)))
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+
+    assert calls == 1
+    assert [result for result, _ in results] == [{"answer": 42}] * 3
+    assert [is_leader for _, is_leader in results] == [True, False, False]
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        coalescer = ChatCoalescer()
+        release = asyncio.Event()
+
+        async def factory():
+            await release.wait()
+            return {"answer": "ok"}
+
+        leader = asyncio.create_task(coalescer.call(("bot", "q"), factory))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.call(("bot", "q"), factory))
+        await asyncio.sleep(0)
+
+        # 发起者的客户端断开
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result, is_leader = asyncio.run(scenario())
+
+    assert result == {"answer": "ok"}
+    assert is_leader is False
+
+
+def test_upstream_cancelled_when_all_waiters_leave():
+    async def scenario():
+        coalescer = ChatCoalescer()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def factory():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(coalescer.call(("bot", "q"), factory))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+        # 放弃的调用不再被复用
+        async def fresh():
+            return {"answer": "new"}
+        return await coalescer.call(("bot", "q"), fresh)
+
+    result, is_leader = asyncio.run(scenario())
+
+    assert result == {"answer": "new"}
+    assert is_leader is True
+
+
+def test_upstream_error_reaches_every_waiter():
+    async def scenario():
+        coalescer = ChatCoalescer()
+
+        async def factory():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        return await asyncio.gather(
+            *(coalescer.call(("bot", "q"), factory) for _ in range(2)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,160 @@
+"""
+缓存命中、合并请求的对话在后续提问时保留上下文
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tests.conftest import conversation_row
+
+
+def test_coalesced_follower_gets_its_own_coze_conversation(client, make_member, make_bot, fake_coze):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    question = f"what is {uuid.uuid4().hex}?"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(client.post, "/api/v1/chat/chat", json={"bot_id": bot_id, "message": question}, headers=headers)
+            for _ in range(2)
+        ]
+        responses = [future.result() for future in futures]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    # 只调用一次上游，另一个请求为它创建了带本轮问答的 Coze 对话
+    assert len(fake_coze.chats) == 1
+    assert len(fake_coze.created) == 1
+    assert fake_coze.created[0][0]["content"] == question
+
+    coze_ids = {conversation_row(r.json()["conversation_id"]).conversation_id for r in responses}
+    assert coze_ids == {"coze-1", "seeded-1"}
+
+
+def test_coalesced_stream_follower_gets_its_own_coze_conversation(client, make_member, make_bot, fake_coze):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    question = f"what is {uuid.uuid4().hex}?"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(
+                client.post, "/api/v1/chat/chat/stream", json={"bot_id": bot_id, "message": question}, headers=headers
+            )
+            for _ in range(2)
+        ]
+        responses = [future.result() for future in futures]
+
+    assert all("answer to" in response.text for response in responses)
+    assert len(fake_coze.chats) == 1
+    assert len(fake_coze.created) == 1
+    assert fake_coze.created[0][1]["content"] == f"answer to {question}"
+
+
+def test_cache_hit_keeps_context_for_follow_up(client, make_member, make_bot, fake_coze):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    question = f"what is {uuid.uuid4().hex}?"
+
+    client.post("/api/v1/chat/chat", json={"bot_id": bot_id, "message": question}, headers=headers)
+    # 新对话提同一个问题：命中缓存，不调用上游，但要有带本轮问答的 Coze 对话
+    cached = client.post("/api/v1/chat/chat", json={"bot_id": bot_id, "message": question}, headers=headers)
+    conversation_id = cached.json()["conversation_id"]
+    assert len(fake_coze.chats) == 1
+    assert conversation_row(conversation_id).conversation_id == "seeded-1"
+
+    # 在命中缓存的对话中追问：带上 Coze 对话 ID 调用上游（不再当作首轮、不走缓存）
+    follow_up = client.post(
+        "/api/v1/chat/chat",
+        json={"bot_id": bot_id, "message": question, "conversation_id": conversation_id},
+        headers=headers,
+    )
+
+    assert follow_up.status_code == 200
+    assert [chat["conversation_id"] for chat in fake_coze.chats] == [None, "seeded-1"]
+
+
+def test_stream_cache_hit_seeds_coze_conversation(client, make_member, make_bot, fake_coze):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    question = f"what is {uuid.uuid4().hex}?"
+
+    client.post("/api/v1/chat/chat/stream", json={"bot_id": bot_id, "message": question}, headers=headers)
+    replay = client.post("/api/v1/chat/chat/stream", json={"bot_id": bot_id, "message": question}, headers=headers)
+
+    assert "\"type\":\"done\"" in replay.text
+    assert len(fake_coze.chats) == 1
+    assert fake_coze.created == [[
+        {"role": "user", "content": question, "content_type": "text"},
+        {"role": "assistant", "type": "answer", "content": f"answer to {question}", "content_type": "text"},
+    ]]
+
+
+def test_stream_saves_coze_conversation_id_before_done(client, make_member, make_bot, fake_coze, monkeypatch):
+    import json
+
+    from app.services.message_persister import message_persister
+
+    # 批量刷写拖到测试结束之后：Coze 对话 ID 不能依赖消息刷写
+    monkeypatch.setattr(message_persister, "flush_interval", 5.0)
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+
+    response = client.post(
+        "/api/v1/chat/chat/stream", json={"bot_id": bot_id, "message": uuid.uuid4().hex}, headers=headers
+    )
+    frame = next(line for line in response.text.splitlines() if line.startswith("data: "))
+    conversation_id = json.loads(frame[len("data: "):])["conversation_id"]
+
+    assert conversation_row(conversation_id).conversation_id == "coze-1"
+
+
+@pytest.mark.parametrize("failure", ["event", "exception"])
+def test_stream_upstream_failure_saves_partial_reply_as_truncated(
+    client, make_member, make_bot, fake_coze, monkeypatch, failure
+):
+    import json
+    import time
+
+    from app.db.session import SessionLocal
+    from app.models import Message
+    from app.services.coze_service import coze_service
+
+    async def failing_stream(bot_id, message, conversation_id=None, user_id="default_user", events=None):
+        yield {
+            "event": "conversation.message.delta",
+            "data": {"id": "m", "content": "partial", "type": "answer", "conversation_id": "coze-failed"},
+        }
+        if failure == "event":
+            yield {"type": "error", "error": "upstream broke"}
+        else:
+            raise RuntimeError("upstream broke")
+
+    monkeypatch.setattr(coze_service, "chat_stream", failing_stream)
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+
+    response = client.post(
+        "/api/v1/chat/chat/stream", json={"bot_id": bot_id, "message": uuid.uuid4().hex}, headers=headers
+    )
+    frame = next(line for line in response.text.splitlines() if line.startswith("data: "))
+    conversation_id = json.loads(frame[len("data: "):])["conversation_id"]
+    assert "upstream broke" in response.text
+
+    # 等待批量持久化写入
+    deadline = time.monotonic() + 5
+    while True:
+        db = SessionLocal()
+        try:
+            reply = db.query(Message).filter(
+                Message.conversation_id == conversation_id, Message.role == "assistant"
+            ).first()
+        finally:
+            db.close()
+        if reply is not None or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    assert reply is not None
+    assert reply.content == "partial"
+    assert reply.is_truncated is True
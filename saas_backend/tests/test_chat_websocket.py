@@ -0,0 +1,88 @@
+"""
+WebSocket 聊天：单路回复出错、连接期间用户和机器人状态校验
+"""
+import pytest
+
+from app.api.v1.endpoints.chat import ChatSocketSession
+from app.core.config import settings
+
+
+def _token(headers):
+    return headers["Authorization"][len("Bearer "):]
+
+
+@pytest.mark.parametrize("error", [ValueError("boom"), RuntimeError("boom")])
+def test_unexpected_stream_error_sends_error_frame(client, make_member, make_bot, monkeypatch, error):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+
+    async def broken_resolve(self, request):
+        raise error
+
+    monkeypatch.setattr(ChatSocketSession, "_resolve", broken_resolve)
+
+    with client.websocket_connect(f"/api/v1/chat/ws?token={_token(headers)}") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        websocket.send_json({"type": "chat", "stream_id": "s1", "bot_id": bot_id, "message": "hi"})
+        assert websocket.receive_json() == {"type": "error", "stream_id": "s1", "error": "Internal server error"}
+
+        # 连接仍可用
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json() == {"type": "pong"}
+
+
+def test_deactivated_user_is_disconnected(client, make_member, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models import User
+
+    user_id, _, headers = make_member()
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "WS_USER_RECHECK_INTERVAL", 0.0)
+
+    with client.websocket_connect(f"/api/v1/chat/ws?token={_token(headers)}") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        assert websocket.receive_json() == {"type": "ping"}
+
+        db = SessionLocal()
+        try:
+            db.query(User).filter(User.id == user_id).update({"is_active": False})
+            db.commit()
+        finally:
+            db.close()
+
+        frame = websocket.receive_json()
+        while frame == {"type": "ping"}:
+            frame = websocket.receive_json()
+        assert frame == {"type": "error", "error": "User account is inactive"}
+        assert websocket.receive()["type"] == "websocket.close"
+
+
+def _receive_reply(websocket):
+    frames = [websocket.receive_json()]
+    while frames[-1]["type"] not in ("done", "error"):
+        frames.append(websocket.receive_json())
+    return frames
+
+
+def test_deactivated_bot_stops_answering(client, make_member, make_bot, fake_coze, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models import Bot
+
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    monkeypatch.setattr(settings, "WS_USER_RECHECK_INTERVAL", 0.0)
+
+    with client.websocket_connect(f"/api/v1/chat/ws?token={_token(headers)}") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        websocket.send_json({"type": "chat", "stream_id": "s1", "bot_id": bot_id, "message": "hi"})
+        assert _receive_reply(websocket)[-1]["type"] == "done"
+
+        db = SessionLocal()
+        try:
+            db.query(Bot).filter(Bot.id == bot_id).update({"is_active": False})
+            db.commit()
+        finally:
+            db.close()
+
+        websocket.send_json({"type": "chat", "stream_id": "s2", "bot_id": bot_id, "message": "hi again"})
+        assert _receive_reply(websocket)[-1] == {"type": "error", "stream_id": "s2", "error": "Bot is not active"}
@@ -0,0 +1,117 @@
+"""
+熔断器
+"""
+import pytest
+
+from app.services import circuit_breaker as circuit_breaker_module
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _breaker(**kwargs):
+    options = dict(min_calls=4, window_seconds=10, open_seconds=30, half_open_max_calls=2)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def _calls(breaker, count, failed=False, latency=0.1):
+    for _ in range(count):
+        permit = breaker.acquire()
+        if failed:
+            permit.failure(latency)
+        else:
+            permit.success(latency)
+
+
+def test_opens_when_failure_rate_reaches_threshold(clock):
+    breaker = _breaker()
+    _calls(breaker, 2)
+    _calls(breaker, 1, failed=True)
+    assert breaker.state == CLOSED
+
+    _calls(breaker, 1, failed=True)
+    assert breaker.state == OPEN
+
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.acquire()
+    assert excinfo.value.retry_after == pytest.approx(20)
+
+
+def test_does_not_open_below_min_calls(clock):
+    breaker = _breaker()
+    _calls(breaker, 3, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_open_the_breaker(clock):
+    breaker = _breaker(slow_call_seconds=5)
+    _calls(breaker, 2)
+    _calls(breaker, 2, latency=6)
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window(clock):
+    breaker = _breaker()
+    _calls(breaker, 3, failed=True)
+    clock[0] += 11
+    _calls(breaker, 1, failed=True)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 1
+
+
+def test_half_open_probes_close_the_breaker(clock):
+    breaker = _breaker()
+    _calls(breaker, 4, failed=True)
+    clock[0] += 30
+    assert breaker.state == HALF_OPEN
+
+    first, second = breaker.acquire(), breaker.acquire()
+    # 探测名额已满
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    first.success(0.1)
+    assert breaker.state == HALF_OPEN
+    second.success(0.1)
+    assert breaker.state == CLOSED
+    # 恢复后重新开始统计
+    assert breaker.stats()["window_calls"] == 0
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = _breaker()
+    _calls(breaker, 4, failed=True)
+    clock[0] += 30
+
+    breaker.acquire().failure(0.1)
+    assert breaker.state == OPEN
+    assert breaker.stats()["retry_after"] == pytest.approx(30)
+
+
+def test_released_probe_returns_its_slot(clock):
+    breaker = _breaker(half_open_max_calls=1)
+    _calls(breaker, 4, failed=True)
+    clock[0] += 30
+
+    permit = breaker.acquire()
+    permit.release()
+    # 重复结算无效
+    permit.failure(0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.acquire().success(0.1)
+    assert breaker.state == CLOSED
+
+
+def test_disabled_breaker_only_records(clock):
+    breaker = _breaker(enabled=False)
+    _calls(breaker, 10, failed=True)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["failure_rate"] == 1.0
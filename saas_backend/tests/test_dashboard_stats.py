@@ -0,0 +1,18 @@
+"""
+仪表板统计快照：按需刷新
+"""
+from app.services.dashboard_stats import DashboardStatsCache
+
+
+def test_snapshot_is_refreshed_only_when_stale(client):
+    cache = DashboardStatsCache(refresh_interval=60)
+
+    first = client.portal.call(cache.get)
+    second = client.portal.call(cache.get)
+    assert cache.refreshes == 1
+    assert second.generated_at == first.generated_at
+
+    # 超过有效期：下一次请求重新查询
+    cache._refreshed_at -= 61
+    client.portal.call(cache.get)
+    assert cache.refreshes == 2
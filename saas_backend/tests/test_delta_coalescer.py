@@ -0,0 +1,122 @@
+"""
+SSE 增量合并
+"""
+import asyncio
+
+import pytest
+
+from app.services.delta_coalescer import DELTA_EVENT, DeltaCoalescer
+
+
+def _delta(content, message_id="m1"):
+    return {"event": DELTA_EVENT, "data": {"id": message_id, "content": content}}
+
+
+async def _stream(events, error=None):
+    for event in events:
+        yield event
+    if error is not None:
+        raise error
+
+
+def _run(coalescer, events, error=None):
+    async def scenario():
+        return [chunk async for chunk in coalescer.coalesce(_stream(events, error))]
+
+    return asyncio.run(scenario())
+
+
+def _contents(chunks):
+    return [chunk["data"].get("content") for chunk in chunks]
+
+
+def test_first_delta_is_immediate_and_rest_are_merged():
+    chunks = _run(DeltaCoalescer(max_bytes=1024, max_delay=10), [_delta(c) for c in "abcde"])
+    assert _contents(chunks) == ["a", "bcde"]
+    assert chunks[-1]["data"]["id"] == "m1"
+
+
+def test_non_delta_event_flushes_buffer_in_order():
+    completed = {"event": "conversation.message.completed", "data": {"id": "m1", "content": "abc"}}
+    chunks = _run(
+        DeltaCoalescer(max_bytes=1024, max_delay=10),
+        [_delta("a"), _delta("b"), _delta("c"), completed, _delta("d")],
+    )
+    assert [chunk["event"] for chunk in chunks] == [DELTA_EVENT, DELTA_EVENT, completed["event"], DELTA_EVENT]
+    assert _contents(chunks) == ["a", "bc", "abc", "d"]
+
+
+def test_buffer_is_flushed_at_max_bytes():
+    chunks = _run(DeltaCoalescer(max_bytes=4, max_delay=10), [_delta("ab") for _ in range(5)])
+    assert _contents(chunks) == ["ab", "abab", "abab"]
+
+
+def test_max_bytes_counts_utf8_bytes():
+    # 每个汉字 3 字节
+    chunks = _run(DeltaCoalescer(max_bytes=6, max_delay=10), [_delta(c) for c in "开始你好世界"])
+    assert _contents(chunks) == ["开", "始你", "好世", "界"]
+
+
+def test_buffer_is_flushed_after_max_delay():
+    async def slow_stream():
+        yield _delta("a")
+        yield _delta("b")
+        await asyncio.sleep(0.2)
+        yield _delta("c")
+
+    async def scenario():
+        coalescer = DeltaCoalescer(max_bytes=1024, max_delay=0.02)
+        return [chunk async for chunk in coalescer.coalesce(slow_stream())]
+
+    assert _contents(asyncio.run(scenario())) == ["a", "b", "c"]
+
+
+def test_different_messages_are_not_merged():
+    chunks = _run(
+        DeltaCoalescer(max_bytes=1024, max_delay=10),
+        [_delta("a", "m1"), _delta("b", "m1"), _delta("c", "m1"), _delta("x", "m2"), _delta("y", "m2")],
+    )
+    assert _contents(chunks) == ["a", "bc", "xy"]
+    assert [chunk["data"]["id"] for chunk in chunks] == ["m1", "m1", "m2"]
+
+
+def test_disabled_passes_every_delta_through():
+    events = [_delta(c) for c in "abc"]
+    assert _run(DeltaCoalescer(enabled=False), events) == events
+
+
+def test_upstream_error_is_raised_after_buffer_is_flushed():
+    async def scenario():
+        received = []
+        coalescer = DeltaCoalescer(max_bytes=1024, max_delay=10)
+        with pytest.raises(RuntimeError, match="upstream"):
+            async for chunk in coalescer.coalesce(_stream([_delta(c) for c in "abc"], RuntimeError("upstream"))):
+                received.append(chunk)
+        return received
+
+    assert _contents(asyncio.run(scenario())) == ["a", "bc"]
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_closing_merged_stream_closes_upstream(enabled):
+    closed = []
+
+    async def upstream():
+        try:
+            yield _delta("a")
+            yield {"type": "done"}
+            # 上游在完成事件后不再结束，只能靠调用方关闭
+            await asyncio.sleep(60)
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        stream = DeltaCoalescer(max_bytes=1024, max_delay=10, enabled=enabled).coalesce(upstream())
+        async for chunk in stream:
+            if chunk.get("type") == "done":
+                break
+        await stream.aclose()
+        # aclose 返回时上游已关闭，不依赖垃圾回收
+        return list(closed)
+
+    assert asyncio.run(scenario()) == [True]
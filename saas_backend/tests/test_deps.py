@@ -0,0 +1,28 @@
+"""
+认证依赖：查库步骤不在事件循环线程执行
+"""
+import threading
+
+from app.api.v1.endpoints import deps
+
+
+def test_token_lookup_runs_off_the_event_loop(client, make_member, monkeypatch):
+    _, _, headers = make_member()
+    loop_thread = client.portal.call(_current_thread)
+    threads = []
+    authenticate = deps._authenticate_token
+
+    def recording(db, token):
+        threads.append(threading.get_ident())
+        return authenticate(db, token)
+
+    monkeypatch.setattr(deps, "_authenticate_token", recording)
+
+    response = client.get("/api/v1/auth/me", headers=headers)
+
+    assert response.status_code == 200
+    assert threads and loop_thread not in threads
+
+
+async def _current_thread():
+    return threading.get_ident()
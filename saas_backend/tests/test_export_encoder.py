@@ -0,0 +1,75 @@
+"""
+导出行编码器
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.services.export_service import ExportEncoder
+
+
+COLUMNS = ("id", "date", "quantity", "extra_data")
+ROWS = [
+    ("r1", date(2024, 1, 2), Decimal("3"), {"bot": "机器人"}),
+    ("r2", datetime(2024, 1, 2, 3, 4, 5), Decimal("1.5"), None),
+    ("r,3", None, 0, ["a", "b"]),
+]
+
+
+def _encode(encoder, rows):
+    data = b""
+    for row in rows:
+        data += encoder.write(row) or b""
+    return data + encoder.finish()
+
+
+def test_csv_header_and_values():
+    data = _encode(ExportEncoder("csv", COLUMNS), ROWS)
+    assert list(csv.reader(io.StringIO(data.decode("utf-8")))) == [
+        list(COLUMNS),
+        ["r1", "2024-01-02", "3", '{"bot": "机器人"}'],
+        ["r2", "2024-01-02T03:04:05", "1.5", ""],
+        ["r,3", "", "0", '["a", "b"]'],
+    ]
+
+
+def test_ndjson_values():
+    data = _encode(ExportEncoder("ndjson", COLUMNS), ROWS)
+    assert [json.loads(line) for line in data.decode("utf-8").splitlines()] == [
+        {"id": "r1", "date": "2024-01-02", "quantity": 3, "extra_data": {"bot": "机器人"}},
+        {"id": "r2", "date": "2024-01-02T03:04:05", "quantity": 1.5, "extra_data": None},
+        {"id": "r,3", "date": None, "quantity": 0, "extra_data": ["a", "b"]},
+    ]
+
+
+def test_chunks_are_emitted_at_chunk_bytes():
+    encoder = ExportEncoder("ndjson", ("id",), chunk_bytes=64)
+    chunks = [encoder.write((f"row-{index:04d}",)) for index in range(20)]
+    emitted = [chunk for chunk in chunks if chunk]
+
+    assert emitted
+    assert all(len(chunk) >= 64 for chunk in emitted)
+    # 未达到阈值的行留在缓冲区
+    assert chunks[0] is None
+    data = b"".join(emitted) + encoder.finish()
+    assert data.decode("utf-8").splitlines() == [json.dumps({"id": f"row-{index:04d}"}) for index in range(20)]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_gzip_round_trip(fmt):
+    rows = ROWS * 200
+    plain = _encode(ExportEncoder(fmt, COLUMNS, chunk_bytes=1024), rows)
+    compressed = _encode(ExportEncoder(fmt, COLUMNS, gzip=True, chunk_bytes=1024), rows)
+
+    assert compressed[:2] == b"\x1f\x8b"
+    assert gzip.decompress(compressed) == plain
+
+
+def test_unsupported_format():
+    with pytest.raises(ValueError):
+        ExportEncoder("xlsx", COLUMNS)
@@ -0,0 +1,109 @@
+"""
+上游公平调度
+"""
+import asyncio
+
+import pytest
+
+from app.services.fair_scheduler import FairScheduler, SchedulerTimeout
+
+
+def _hold_slots(scheduler, count, plan_type="free"):
+    """同一租户同时申请 count 个名额，返回成功获得名额的数量"""
+    async def scenario():
+        granted = 0
+        for _ in range(count):
+            try:
+                await scheduler.acquire("org", plan_type)
+                granted += 1
+            except SchedulerTimeout:
+                pass
+        return granted
+
+    return asyncio.run(scenario())
+
+
+def test_tenant_limits_are_opt_in():
+    assert _hold_slots(FairScheduler(max_concurrency=10, max_queue_wait=0.05), 3) == 3
+
+
+def test_tenant_limits_cap_free_plan_when_enabled():
+    scheduler = FairScheduler(max_concurrency=10, max_queue_wait=0.05, tenant_limits=True)
+    # 免费版 concurrent_chats = 2
+    assert _hold_slots(scheduler, 3) == 2
+    assert scheduler.stats()["inflight"] == 2
+    assert scheduler.stats()["queued"] == 0
+
+
+def test_queued_requests_are_dispatched_by_weight():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue_wait=5)
+        await scheduler.acquire("holder", "free")
+        order = []
+
+        async def call(organization_id, plan_type):
+            await scheduler.acquire(organization_id, plan_type)
+            order.append(organization_id)
+            await asyncio.sleep(0)
+            scheduler.release(organization_id)
+
+        tasks = [asyncio.create_task(call("free-org", "free")) for _ in range(3)]
+        tasks += [asyncio.create_task(call("enterprise-org", "enterprise")) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 6
+
+        scheduler.release("holder")
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    # 企业版权重 10、免费版权重 1：企业版的虚拟完成时间全部更早
+    assert order == ["enterprise-org"] * 3 + ["free-org"] * 3
+    assert stats["inflight"] == 0
+    assert stats["queued"] == 0
+
+
+def test_queue_wait_timeout():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue_wait=0.05)
+        await scheduler.acquire("holder")
+        with pytest.raises(SchedulerTimeout):
+            await scheduler.acquire("waiting-org")
+        assert scheduler.stats()["queued"] == 0
+
+        scheduler.release("holder")
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue_wait=5)
+        await scheduler.acquire("holder")
+        waiting = asyncio.create_task(scheduler.acquire("waiting-org"))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        scheduler.release("holder")
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 0
+    assert stats["queued"] == 0
+
+
+def test_slot_is_released_on_error():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue_wait=5)
+        with pytest.raises(RuntimeError):
+            async with scheduler.slot("org"):
+                assert scheduler.stats()["inflight"] == 1
+                raise RuntimeError("upstream")
+        return scheduler.stats()
+
+    assert asyncio.run(scenario())["inflight"] == 0
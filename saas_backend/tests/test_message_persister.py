@@ -0,0 +1,53 @@
+"""
+消息批量持久化：个别行写入失败时不丢弃整批
+"""
+import uuid
+from datetime import datetime
+
+from app.db.session import SessionLocal
+from app.models import Message
+from app.services.message_persister import MessagePersister
+
+
+def _item(content):
+    return {
+        "row": {
+            "id": str(uuid.uuid4()),
+            "conversation_id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "role": "user",
+            "content": content,
+            "coze_message_id": None,
+            "is_truncated": False,
+            "created_at": datetime.utcnow(),
+        },
+        "message_count_delta": 0,
+        "coze_conversation_id": None,
+    }
+
+
+def test_bad_row_only_drops_itself(client, capsys):
+    persister = MessagePersister(max_retries=1)
+    batch = [_item(f"secret text {i}") for i in range(5)]
+    # content 不允许为空：整批 INSERT 失败
+    batch[3]["row"]["content"] = None
+
+    client.portal.call(persister._flush_with_retry, batch)
+
+    db = SessionLocal()
+    try:
+        written = {
+            message_id for (message_id,) in db.query(Message.id).filter(
+                Message.id.in_([item["row"]["id"] for item in batch])
+            )
+        }
+    finally:
+        db.close()
+
+    assert written == {item["row"]["id"] for i, item in enumerate(batch) if i != 3}
+    assert persister.failed_messages == 1
+
+    output = capsys.readouterr().out
+    assert batch[3]["row"]["id"] in output
+    # 日志不含消息内容
+    assert "secret text" not in output
@@ -0,0 +1,33 @@
+"""
+/metrics 访问控制与指标标签
+"""
+import asyncio
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.fair_scheduler import FairScheduler
+
+
+def test_metrics_requires_token_or_private_client(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    # TestClient 的客户端地址不是本机 / 内网地址
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+
+
+def test_scheduler_metrics_are_labelled_by_plan():
+    scheduler = FairScheduler(max_concurrency=1, max_queue_wait=1.0)
+
+    async def scenario():
+        async with scheduler.slot("org-metrics-label", "pro"):
+            pass
+
+    asyncio.run(scenario())
+
+    output = metrics.render_prometheus()
+    assert "org-metrics-label" not in output
+    assert 'coze_scheduler_wait_seconds_count{plan="pro"}' in output
@@ -0,0 +1,34 @@
+"""
+配额引擎：装载用量时不漏掉正在写库的批次
+"""
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+from app.services import usage_accumulator as accumulator_module
+from app.services.quota_engine import quota_engine
+from app.services.usage_accumulator import usage_accumulator
+
+
+def test_load_waits_for_in_flight_flush(client, monkeypatch):
+    organization_id = str(uuid.uuid4())
+    working_session = accumulator_module.AsyncSessionLocal
+
+    @asynccontextmanager
+    async def slow_session():
+        async with working_session() as db:
+            await asyncio.sleep(0.2)
+            yield db
+
+    monkeypatch.setattr(accumulator_module, "AsyncSessionLocal", slow_session)
+
+    async def scenario():
+        usage_accumulator.record(organization_id, "u1", "message", 4)
+        flush = asyncio.create_task(usage_accumulator.flush())
+        # 批次已从未刷写增量中取出、尚未提交
+        await asyncio.sleep(0.05)
+        await quota_engine.load(organization_id)
+        await flush
+        return quota_engine._entries[organization_id].used
+
+    assert client.portal.call(scenario) == {"message": 4}
@@ -0,0 +1,82 @@
+"""
+滑动窗口限流：估算值、重试等待时间，以及 WebSocket 握手与 chat 消息的限流
+"""
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.v1.endpoints import chat as chat_endpoint
+from app.core import rate_limit
+from app.services.rate_limiter import MINUTE, MemoryRateLimitStore, RateLimit, _retry_after, rate_limiter
+
+
+def test_sliding_window_weights_previous_window():
+    store = MemoryRateLimitStore()
+    limits = (RateLimit(10, MINUTE),)
+
+    async def scenario():
+        for _ in range(10):
+            assert (await store.hit("k", limits, now=0.0)).allowed
+        denied = await store.hit("k", limits, now=30.0)
+        # 下一窗口过了 6 秒时估算值为 10 × 0.9 = 9，可以再放行一个
+        assert not (await store.hit("k", limits, now=65.9)).allowed
+        assert (await store.hit("k", limits, now=66.0)).allowed
+        assert not (await store.hit("k", limits, now=66.0)).allowed
+        return denied
+
+    denied = asyncio.run(scenario())
+    assert denied.limit == limits[0]
+    assert denied.retry_after == pytest.approx(36.0)
+
+
+def test_retry_after():
+    # 当前窗口未满：等上一窗口的权重降下来，10 × (1 - 36 / 60) + 5 = 9
+    assert _retry_after(10, 60, elapsed=30, current=5, previous=10) == pytest.approx(6.0)
+    # 没有上一窗口计数时不需要等待
+    assert _retry_after(10, 60, elapsed=30, current=5, previous=0) == 0.0
+    # 当前窗口已满：等到下一窗口，再等当前计数的权重降到 9
+    assert _retry_after(10, 60, elapsed=0, current=10, previous=0) == pytest.approx(66.0)
+    assert _retry_after(1, 60, elapsed=20, current=1, previous=0) == pytest.approx(100.0)
+
+
+@pytest.fixture
+def limiter_enabled(monkeypatch):
+    """启用全局限流器并使用独立的计数"""
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    monkeypatch.setattr(rate_limiter, "store", MemoryRateLimitStore())
+
+
+def test_websocket_handshake_is_rate_limited(client, limiter_enabled, monkeypatch):
+    monkeypatch.setattr(rate_limit, "anonymous_rate_limits", lambda: (RateLimit(1, MINUTE),))
+
+    with client.websocket_connect("/api/v1/chat/ws") as websocket:
+        websocket.close()
+
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/api/v1/chat/ws"):
+            pass
+    assert exc_info.value.code == 1008
+
+
+def test_websocket_chat_messages_are_rate_limited(client, make_member, make_bot, fake_coze, limiter_enabled, monkeypatch):
+    _, org_id, headers = make_member()
+    bot_id = make_bot(org_id)
+    # 握手和第一条 chat 消息各计一次
+    monkeypatch.setattr(chat_endpoint, "plan_rate_limits", lambda plan_type: (RateLimit(1, MINUTE),))
+    monkeypatch.setattr(rate_limit, "plan_rate_limits", lambda plan_type: (RateLimit(2, MINUTE),))
+
+    token = headers["Authorization"][len("Bearer "):]
+    with client.websocket_connect(f"/api/v1/chat/ws?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        websocket.send_json({"type": "chat", "stream_id": "s1", "bot_id": bot_id, "message": "hi"})
+        websocket.send_json({"type": "chat", "stream_id": "s2", "bot_id": bot_id, "message": "hi"})
+
+        frames = [websocket.receive_json()]
+        while not any(frame.get("stream_id") == "s2" for frame in frames):
+            frames.append(websocket.receive_json())
+
+    limited = next(frame for frame in frames if frame.get("stream_id") == "s2")
+    assert limited["type"] == "error"
+    assert limited["error"] == "Rate limit exceeded"
+    assert limited["retry_after"] >= 1
@@ -0,0 +1,48 @@
+"""
+SSE 帧编码：与 ChatStreamChunk.model_dump_json() 逐字节一致
+"""
+import pytest
+
+from app.schemas.conversation import ChatStreamChunk
+from app.services.sse_encoder import DONE_FRAME, SSEFrameEncoder
+
+
+CONTENTS = [
+    "",
+    "你好，世界",
+    'quote " backslash \\ slash /',
+    "line\nbreak\r\ttab",
+    "control \x00\x01\x1f del \x7f",
+    "emoji 😀 and separators \u2028\u2029",
+    "<script>&</script>",
+]
+
+
+def _frame(chunk: ChatStreamChunk) -> str:
+    return f"data: {chunk.model_dump_json()}\n\n"
+
+
+@pytest.mark.parametrize("content", CONTENTS)
+@pytest.mark.parametrize("conversation_id", [None, "conv-1", '引号"会话'])
+@pytest.mark.parametrize("message_id", [None, "msg-1"])
+def test_message_frame_matches_model_dump_json(content, conversation_id, message_id):
+    encoder = SSEFrameEncoder(conversation_id)
+    expected = _frame(ChatStreamChunk(
+        type="message", content=content, message_id=message_id, conversation_id=conversation_id,
+    ))
+    assert encoder.message(content, message_id) == expected
+
+
+def test_message_id_change_within_stream():
+    encoder = SSEFrameEncoder("conv-1")
+    for message_id in ("msg-1", "msg-1", "msg-2", None, "msg-2"):
+        expected = _frame(ChatStreamChunk(
+            type="message", content="x", message_id=message_id, conversation_id="conv-1",
+        ))
+        assert encoder.message("x", message_id) == expected
+
+
+def test_done_and_error_frames():
+    assert SSEFrameEncoder.done() == DONE_FRAME == _frame(ChatStreamChunk(type="done"))
+    for error in ("Internal server error", '上游 "超时"\n'):
+        assert SSEFrameEncoder.error(error) == _frame(ChatStreamChunk(type="error", error=error))
@@ -0,0 +1,78 @@
+"""
+增量 SSE 解析：任意切分字节流的结果与整体解析一致，流末尾没有空行的最后一帧不丢失
+"""
+import asyncio
+import random
+
+import httpx
+
+from app.services.coze_service import CozeService
+from app.services.sse_parser import SSEParser
+
+
+def _stream(newline: bytes, terminated: bool) -> bytes:
+    frames = [
+        b'event:conversation.chat.created\ndata:{"id":"chat","conversation_id":"c1"}',
+        b": keep-alive",
+        b"id: 7\nretry: 3000\nevent: conversation.message.delta\ndata: {\"content\":\"\xe4\xbd\xa0\xe5\xa5\xbd\"}",
+        b"data: line one\ndata: line two",
+        b'event:conversation.message.delta\ndata:{"content":"!"}',
+        b"event:done\ndata:[DONE]",
+    ]
+    body = b"\n\n".join(frames) + (b"\n\n" if terminated else b"")
+    return body.replace(b"\n", newline)
+
+
+def _parse(chunks):
+    parser = SSEParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.flush())
+    return [(event.event, event.data, event.id, event.retry) for event in events]
+
+
+def _split(body: bytes, rng: random.Random):
+    cuts = sorted(rng.sample(range(1, len(body)), rng.randint(1, min(20, len(body) - 1))))
+    return [body[start:end] for start, end in zip([0] + cuts, cuts + [len(body)])]
+
+
+def test_split_boundaries_do_not_change_events():
+    rng = random.Random(20240601)
+    for newline in (b"\n", b"\r\n", b"\r"):
+        for terminated in (True, False):
+            body = _stream(newline, terminated)
+            expected = _parse([body])
+            assert len(expected) == 5
+            assert expected[-1] == ("done", b"[DONE]", "7", 3000)
+            assert expected[2][1] == b"line one\nline two"
+
+            for _ in range(300):
+                assert _parse(_split(body, rng)) == expected
+            # 逐字节输入
+            assert _parse([body[i:i + 1] for i in range(len(body))]) == expected
+
+
+def test_chat_stream_handles_final_frame_without_blank_line():
+    body = _stream(b"\n", terminated=False)
+
+    async def content():
+        # 分几块到达，最后一块在帧中间结束
+        for start in range(0, len(body), 40):
+            yield body[start:start + 40]
+
+    def handler(request):
+        return httpx.Response(200, content=content(), headers={"Content-Type": "text/event-stream"})
+
+    service = CozeService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        try:
+            return [chunk async for chunk in service.chat_stream("bot", "hi")]
+        finally:
+            await service._client.aclose()
+
+    chunks = asyncio.run(scenario())
+    assert chunks[-1] == {"type": "done"}
+    assert [chunk["data"]["content"] for chunk in chunks if chunk.get("event") == "conversation.message.delta"] == ["你好", "!"]
@@ -0,0 +1,79 @@
+"""
+多行累加 upsert
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.dialects import mysql, postgresql
+
+from app.db.upsert import increment_upsert
+
+
+metadata = MetaData()
+counters = Table(
+    "counters",
+    metadata,
+    Column("key", String(20), primary_key=True),
+    Column("day", String(10), primary_key=True),
+    Column("total", Integer, nullable=False),
+    Column("updated_at", DateTime),
+)
+plain_counters = Table(
+    "plain_counters",
+    metadata,
+    Column("key", String(20), primary_key=True),
+    Column("total", Integer, nullable=False),
+)
+
+
+def _upsert(table, rows, dialect_name="sqlite"):
+    key_columns = [column.name for column in table.primary_key]
+    return increment_upsert(table, rows, key_columns, ["total"], dialect_name)
+
+
+def test_sqlite_inserts_and_increments_existing_rows():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        conn.execute(_upsert(counters, [
+            {"key": "a", "day": "d1", "total": 1},
+            {"key": "b", "day": "d1", "total": 2},
+        ]))
+        conn.execute(_upsert(counters, [
+            {"key": "a", "day": "d1", "total": 10},
+            {"key": "a", "day": "d2", "total": 5},
+        ]))
+        rows = conn.execute(select(counters.c.key, counters.c.day, counters.c.total, counters.c.updated_at)).all()
+
+    totals = {(key, day): total for key, day, total, _ in rows}
+    assert totals == {("a", "d1"): 11, ("b", "d1"): 2, ("a", "d2"): 5}
+    # 只有发生冲突的行由 upsert 刷新 updated_at
+    updated = {(key, day) for key, day, _, updated_at in rows if isinstance(updated_at, datetime)}
+    assert updated == {("a", "d1")}
+
+
+def test_mysql_uses_on_duplicate_key_update():
+    sql = str(_upsert(counters, [{"key": "a", "day": "d1", "total": 1}], "mysql").compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "total = (counters.total + VALUES(total))" in sql
+    assert "updated_at" in sql.split("ON DUPLICATE KEY UPDATE")[1]
+
+
+def test_postgresql_uses_on_conflict_on_key_columns():
+    sql = str(_upsert(counters, [{"key": "a", "day": "d1", "total": 1}], "postgresql").compile(
+        dialect=postgresql.dialect()
+    ))
+    assert "ON CONFLICT (key, day) DO UPDATE" in sql
+    assert "total = (counters.total + excluded.total)" in sql
+
+
+def test_updated_at_is_only_set_when_the_table_has_it():
+    sql = str(_upsert(plain_counters, [{"key": "a", "total": 1}], "mysql").compile(dialect=mysql.dialect()))
+    assert "updated_at" not in sql
+
+
+def test_unsupported_dialect():
+    with pytest.raises(NotImplementedError):
+        _upsert(counters, [{"key": "a", "day": "d1", "total": 1}], "mssql")
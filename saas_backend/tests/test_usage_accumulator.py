@@ -0,0 +1,134 @@
+"""
+使用量累加器：日志重放、刷写失败后重试
+"""
+import json
+import uuid
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.db.session import SessionLocal
+from app.models import UsageRecord
+from app.services import usage_accumulator as accumulator_module
+from app.services.usage_accumulator import UsageAccumulator, UsageJournal
+
+
+def _recorded(organization_id):
+    db = SessionLocal()
+    try:
+        return sum(
+            quantity for (quantity,) in db.query(UsageRecord.quantity).filter(
+                UsageRecord.organization_id == organization_id
+            )
+        )
+    finally:
+        db.close()
+
+
+def test_orphaned_journal_is_replayed(client, tmp_path):
+    organization_id = str(uuid.uuid4())
+    day = date.today().isoformat()
+    # 崩溃的进程留下的分段（最后一行只写了一半）
+    (tmp_path / "usage-1-1-1.jsonl").write_text(
+        json.dumps([organization_id, "u1", "message", day, 2]) + "\n"
+        + json.dumps([organization_id, "u2", "message", day, 3]) + "\n"
+        + '["half',
+        encoding="utf-8",
+    )
+    accumulator = UsageAccumulator(flush_interval=60, journal=UsageJournal(str(tmp_path)))
+
+    client.portal.call(accumulator.start)
+    client.portal.call(accumulator.stop)
+
+    assert _recorded(organization_id) == 5
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_flush_is_retried_without_sealing_more_segments(client, tmp_path, monkeypatch):
+    organization_id = str(uuid.uuid4())
+    journal = UsageJournal(str(tmp_path))
+    accumulator = UsageAccumulator(flush_interval=60, max_retries=1, journal=journal)
+    working_session = accumulator_module.AsyncSessionLocal
+
+    def broken_session():
+        raise OperationalError("INSERT", {}, ConnectionError("database is down"))
+
+    client.portal.call(accumulator.start)
+    try:
+        monkeypatch.setattr(accumulator_module, "AsyncSessionLocal", broken_session)
+        for _ in range(3):
+            accumulator.record(organization_id, "u1", "message")
+            assert client.portal.call(accumulator.flush) == 0
+
+        # 失败的批次和之后的增量都还在内存中，只封存了第一个批次的分段
+        assert accumulator.pending_totals(organization_id, date.today()) == {"message": 3}
+        assert journal.sealed_segments == 1
+        assert len(list(tmp_path.iterdir())) == 2
+
+        monkeypatch.setattr(accumulator_module, "AsyncSessionLocal", working_session)
+        assert client.portal.call(accumulator.flush) == 2
+    finally:
+        client.portal.call(accumulator.stop)
+
+    assert _recorded(organization_id) == 3
+    assert journal.sealed_segments == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_bad_key_is_dropped_without_blocking_other_usage(client, tmp_path, monkeypatch):
+    good_org, bad_org = str(uuid.uuid4()), str(uuid.uuid4())
+    journal = UsageJournal(str(tmp_path))
+    accumulator = UsageAccumulator(flush_interval=60, journal=journal)
+    execute = accumulator._execute
+
+    async def execute_with_foreign_key(pending):
+        # 模拟 MySQL 的外键约束：组织不存在的键写入失败
+        if any(key[0] == bad_org for key in pending):
+            raise IntegrityError("INSERT", {}, Exception("foreign key constraint fails"))
+        await execute(pending)
+
+    monkeypatch.setattr(accumulator, "_execute", execute_with_foreign_key)
+    client.portal.call(accumulator.start)
+    try:
+        accumulator.record(bad_org, "u1", "message")
+        for user_id in ("u1", "u2", "u3"):
+            accumulator.record(good_org, user_id, "message")
+        assert client.portal.call(accumulator.flush) == 3
+
+        # 坏键已丢弃，之后的增量照常写入
+        accumulator.record(good_org, "u1", "message")
+        assert client.portal.call(accumulator.flush) == 1
+    finally:
+        client.portal.call(accumulator.stop)
+
+    assert _recorded(good_org) == 4
+    assert _recorded(bad_org) == 0
+    assert accumulator.stats()["dropped_keys"] == 1
+    assert accumulator.stats()["retry_keys"] == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_record_endpoint_validates_resource_type_and_organization(client, make_member):
+    _, org_id, headers = make_member()
+    _, other_org_id, _ = make_member()
+
+    response = client.post(
+        "/api/v1/usage/record",
+        params={"organization_id": org_id, "resource_type": "x" * 60},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "/api/v1/usage/record",
+        params={"organization_id": other_org_id, "resource_type": "message"},
+        headers=headers,
+    )
+    assert response.status_code == 403
+
+    response = client.post(
+        "/api/v1/usage/record",
+        params={"organization_id": org_id, "resource_type": "message"},
+        headers=headers,
+    )
+    assert response.status_code == 200
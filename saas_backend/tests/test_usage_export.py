@@ -0,0 +1,31 @@
+"""
+使用量导出接口的权限
+"""
+
+
+def test_org_admin_can_export_own_organization(client, make_member):
+    _, org_id, headers = make_member(is_org_admin=True)
+
+    response = client.get("/api/v1/usage/export", params={"organization_id": org_id}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.text.splitlines()[0] == "id,date,created_at,user_id,resource_type,quantity,extra_data"
+
+
+def test_user_from_other_organization_is_forbidden(client, make_member):
+    _, org_a, _ = make_member(is_org_admin=True)
+    _, org_b, headers_b = make_member(is_org_admin=True)
+    assert org_a != org_b
+
+    response = client.get("/api/v1/usage/export", params={"organization_id": org_a}, headers=headers_b)
+
+    assert response.status_code == 403
+
+
+def test_non_admin_member_is_forbidden(client, make_member):
+    _, org_id, _ = make_member(is_org_admin=True)
+    _, _, member_headers = make_member(organization_id=org_id)
+
+    response = client.get("/api/v1/usage/export", params={"organization_id": org_id}, headers=member_headers)
+
+    assert response.status_code == 403
@@ -0,0 +1,106 @@
+"""
+微信扫码登录长轮询：只为已签发的 state 挂起
+"""
+import asyncio
+import threading
+import time
+import uuid
+
+from app.services.wechat_login_waiter import LoginStatusWaiter, login_status_waiter
+
+
+def test_unknown_state_is_not_parked():
+    waiter = LoginStatusWaiter()
+
+    started = time.monotonic()
+    assert asyncio.run(waiter.wait("never-issued", timeout=5)) is None
+    assert time.monotonic() - started < 1
+    assert waiter.stats()["states"] == 0
+
+
+def test_recorded_state_wakes_on_notify():
+    waiter = LoginStatusWaiter()
+    waiter.notify("issued", "pending")
+
+    async def scenario():
+        task = asyncio.create_task(waiter.wait("issued", timeout=5, known_status="pending"))
+        await asyncio.sleep(0.01)
+        assert waiter.stats()["waiters"] == 1
+        waiter.notify("issued", "scanning")
+        return await task
+
+    assert asyncio.run(scenario())["status"] == "scanning"
+    assert waiter.stats()["waiters"] == 0
+
+
+def test_waiters_are_capped():
+    waiter = LoginStatusWaiter(max_waiters=1)
+    waiter.notify("a", "pending")
+    waiter.notify("b", "pending")
+
+    async def scenario():
+        parked = asyncio.create_task(waiter.wait("a", timeout=5, known_status="pending"))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        assert await waiter.wait("b", timeout=5, known_status="pending") is None
+        assert time.monotonic() - started < 1
+        parked.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_check_status_does_not_wait_for_unknown_state(client):
+    started = time.monotonic()
+    response = client.get("/api/v1/auth/wechat/check-status", params={"state": "forged", "wait": 5})
+    assert response.status_code == 200
+    assert response.json()["status"] == "expired"
+    assert time.monotonic() - started < 2
+    assert login_status_waiter.peek("forged") is None
+
+
+def test_check_status_waits_for_issued_state(client):
+    from app.db.session import SessionLocal
+    from app.services.wechat_service import WeChatLoginSession
+
+    state = "issued-" + uuid.uuid4().hex
+    with SessionLocal() as db:
+        WeChatLoginSession(db).create_session(state)
+    assert login_status_waiter.peek(state)["status"] == "pending"
+
+    response = client.get(
+        "/api/v1/auth/wechat/check-status",
+        params={"state": state, "wait": 1, "last_status": "pending"},
+    )
+    assert response.json()["status"] == "pending"
+
+
+def test_long_poll_without_last_status_waits_and_holds_no_connection(client):
+    from app.db.session import SessionLocal, engine
+    from app.services.wechat_service import WeChatLoginSession
+
+    state = "issued-" + uuid.uuid4().hex
+    with SessionLocal() as db:
+        WeChatLoginSession(db).create_session(state)
+    # 模拟二维码由其他 worker 签发：本进程没有记录，接口要先查库
+    login_status_waiter._states.pop(state)
+
+    result = {}
+
+    def long_poll():
+        result["response"] = client.get("/api/v1/auth/wechat/check-status", params={"state": state, "wait": 5})
+
+    thread = threading.Thread(target=long_poll)
+    started = time.monotonic()
+    thread.start()
+    deadline = time.monotonic() + 2
+    while login_status_waiter.stats()["waiters"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # 不带 last_status 也挂起等待，且等待期间不持有数据库连接
+    assert login_status_waiter.stats()["waiters"] == 1
+    assert engine.pool.checkedout() == 0
+
+    login_status_waiter.notify(state, "scanning")
+    thread.join(timeout=5)
+    assert result["response"].json()["status"] == "scanning"
+    assert time.monotonic() - started < 4